@@ -0,0 +1,196 @@
+"""
+Scheduler benchmark suite.
+
+Generates synthetic scripts in the read_script format (long chains, wide fan-outs, diamonds
+and random layered DAGs) whose commands are all 'true', so only the executor's own overhead is
+measured. Every case runs in a fresh interpreter, which makes its peak RSS meaningful, and
+reports:
+
+    load_seconds          reading, validating and compiling the script
+    schedule_us_per_task  time per task spent releasing tasks in the Scheduler, without running them
+    execute_seconds       wall time of execute_script running all the tasks
+    tasks_per_second      tasks executed per second by execute_script
+    peak_rss_kb           peak resident set size of the process
+
+Results are written as JSON, so runs can be compared across commits:
+
+    python benchmarks/bench_scheduler.py --output before.json
+    git checkout <other commit>
+    python benchmarks/bench_scheduler.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from executor import Scheduler, execute_script, load_script  # noqa: E402
+
+SHAPES = ("chain", "fanout", "diamond", "layered")
+SIZES = (10, 100, 1000, 10_000, 100_000)
+
+
+def generate_chain(count):
+    """
+    Generates a chain where every task depends on the previous one.
+    """
+    return {f"task{i}": {"command": "true", "dependencies": [f"task{i - 1}"]} if i else {"command": "true"}
+            for i in range(count)}
+
+
+def generate_fanout(count):
+    """
+    Generates one root task that every other task depends on.
+    """
+    return {f"task{i}": {"command": "true", "dependencies": ["task0"]} if i else {"command": "true"}
+            for i in range(count)}
+
+
+def generate_diamond(count):
+    """
+    Generates a root, a fan-out of count - 2 independent tasks and a sink depending on all of them.
+    """
+    script = generate_fanout(max(count - 1, 1))
+    script[f"task{len(script)}"] = {"command": "true", "dependencies": [name for name in script if name != "task0"]}
+    return script
+
+
+def generate_layered(count, width=None, fan_in=3, seed=42):
+    """
+    Generates a random layered DAG: every task depends on up to 'fan_in' random tasks of the previous layer.
+    """
+    rng = random.Random(seed)
+    width = width or max(1, int(count ** 0.5))
+    script = {}
+    previous = []
+    for start in range(0, count, width):
+        layer = [f"task{i}" for i in range(start, min(start + width, count))]
+        for name in layer:
+            script[name] = {"command": "true"}
+            if previous:
+                script[name]["dependencies"] = rng.sample(previous, min(fan_in, len(previous)))
+        previous = layer
+    return script
+
+
+GENERATORS = {"chain": generate_chain, "fanout": generate_fanout, "diamond": generate_diamond,
+              "layered": generate_layered}
+
+
+def run_case(shape, count, jobs, execute):
+    """
+    Runs one benchmark case in the current process.
+
+    Args:
+        shape (str): The name of the generator.
+        count (int): The number of tasks.
+        jobs (int): The number of tasks running in parallel.
+        execute (bool): Whether to run the tasks with execute_script, or only load and schedule them.
+
+    Returns:
+        dict: The measurements of the case.
+    """
+    result = {"shape": shape, "tasks": count, "jobs": jobs}
+    with tempfile.TemporaryDirectory() as work_dir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        os.chdir(work_dir)
+        os.mkdir("log")
+        with open("script.yaml", "w") as script_file:
+            yaml.safe_dump(GENERATORS[shape](count), script_file, sort_keys=False)
+
+        start = time.perf_counter()
+        graph = load_script("script.yaml", work_dir, plan_cache=False)
+        result["load_seconds"] = time.perf_counter() - start
+
+        scheduler = Scheduler(graph)
+        start = time.perf_counter()
+        while (task_id := scheduler.next_ready()) is not None:
+            scheduler.task_finished(task_id, True)
+        result["schedule_us_per_task"] = (time.perf_counter() - start) / count * 1e6
+
+        if execute:
+            start = time.perf_counter()
+            execute_script("script.yaml", {"jobs": jobs, "plan_cache": False})
+            result["execute_seconds"] = time.perf_counter() - start
+            result["tasks_per_second"] = count / result["execute_seconds"]
+
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Prints the change of every measurement against a baseline run.
+    """
+    previous = {(case["shape"], case["tasks"]): case for case in baseline["cases"]}
+    print(f"\nCompared with {baseline.get('commit')}:")
+    for case in results["cases"]:
+        old = previous.get((case["shape"], case["tasks"]))
+        if not old:
+            continue
+        changes = []
+        for metric in ("load_seconds", "schedule_us_per_task", "execute_seconds", "peak_rss_kb"):
+            if case.get(metric) and old.get(metric):
+                changes.append(f"{metric} {case[metric] / old[metric]:.2f}x")
+        print(f"  {case['shape']:>8} {case['tasks']:>7}: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the executor's scheduling overhead")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help=f"Comma separated shapes (default: {','.join(SHAPES)}).")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma separated task counts (default: 10 to 100000).")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Tasks running in parallel (default: number of cores).")
+    parser.add_argument("--execute-limit", type=int, default=10_000,
+                        help="Largest script actually executed; bigger ones are only loaded and scheduled (default: 10000).")
+    parser.add_argument("--output", default="bench_scheduler.json", help="JSON file receiving the results.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with.")
+    parser.add_argument("--case", nargs=2, metavar=("SHAPE", "TASKS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:  # Child process running a single case
+        shape, count = args.case[0], int(args.case[1])
+        print(json.dumps(run_case(shape, count, args.jobs, count <= args.execute_limit)))
+        return
+
+    results = {"commit": git_commit(), "python": platform.python_version(), "cpus": os.cpu_count(),
+               "jobs": args.jobs, "cases": []}
+    for shape in args.shapes.split(","):
+        for count in map(int, args.sizes.split(",")):
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", shape, str(count),
+                                    "--jobs", str(args.jobs), "--execute-limit", str(args.execute_limit)],
+                                   capture_output=True, text=True, check=True)
+            case = json.loads(child.stdout.splitlines()[-1])
+            results["cases"].append(case)
+            rate = f"{case['tasks_per_second']:9.0f} tasks/s" if "tasks_per_second" in case else f"{'-':>9} tasks/s"
+            print(f"{shape:>8} {count:>7}: load {case['load_seconds']:8.3f}s  "
+                  f"schedule {case['schedule_us_per_task']:6.2f}us/task  {rate}  peak RSS {case['peak_rss_kb']} KiB")
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
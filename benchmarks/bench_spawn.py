@@ -0,0 +1,77 @@
+"""
+Spawn latency microbenchmark.
+
+Starts the same command many times through executor.spawn_process, once through /bin/sh and
+once executed directly, both in the current directory and in another directory. For every
+combination it reports, in microseconds:
+
+    spawn_us       time until spawn_process returns with the child running
+    round_trip_us  time until the child's output is read and the child is reaped
+
+    python benchmarks/bench_spawn.py --iterations 500 --command "date"
+
+The default command is not a shell builtin, so the shell has to execute it as well.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from executor import spawn_process  # noqa: E402
+
+
+async def measure(command, cwd, shell, iterations):
+    """
+    Spawns a command 'iterations' times, one at a time.
+
+    Returns:
+        dict: The median spawn latency and round trip in microseconds.
+    """
+    spawns, round_trips = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        process = await spawn_process(command, cwd, shell)
+        spawned = time.perf_counter()
+        await asyncio.gather(process.stdout.read(), process.stderr.read())
+        await process.wait()
+        finished = time.perf_counter()
+        spawns.append((spawned - start) * 1e6)
+        round_trips.append((finished - start) * 1e6)
+    return {"spawn_us": statistics.median(spawns), "round_trip_us": statistics.median(round_trips)}
+
+
+async def run(command, iterations):
+    results = []
+    with tempfile.TemporaryDirectory() as other_dir:
+        for directory, cwd in (("current", None), ("other", other_dir)):
+            for mode, shell in (("shell", True), ("direct", False)):
+                await measure(command, cwd, shell, max(iterations // 10, 1))  # Warm up
+                case = {"mode": mode, "cwd": directory, **await measure(command, cwd, shell, iterations)}
+                results.append(case)
+                print(f"{mode:>6} {directory:>7} dir: spawn {case['spawn_us']:8.0f}us  "
+                      f"round trip {case['round_trip_us']:8.0f}us")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the spawn latency of shell and direct commands")
+    parser.add_argument("--command", default="date", help="Command to spawn (default: date).")
+    parser.add_argument("--iterations", type=int, default=500, help="Spawns per case (default: 500).")
+    parser.add_argument("--output", help="JSON file receiving the results.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.command, args.iterations))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"command": args.command, "python": sys.version.split()[0], "cases": results}, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Memory benchmark for the compiled task representation.
+
+Generates a script shaped like our generated component scripts (shared command templates,
+a few arguments and dependencies per task), compiles it and reports the memory retained
+per task, as measured by tracemalloc.
+
+Usage:
+    python benchmarks/bench_task_memory.py [--tasks N]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from executor import compile_script, validate_script  # noqa: E402
+
+
+def generate_script(count):
+    """
+    Generates a script dictionary like the ones produced by our component generators.
+
+    Args:
+        count (int): The number of tasks.
+
+    Returns:
+        dict: The script dictionary, as read_script would return it.
+    """
+    script = {}
+    for i in range(count):
+        # Build fresh strings, like the YAML loader does for every occurrence
+        script[f"component-{i}"] = {
+            "command": "".join(["python build.py ", "{component} {target}"]),
+            "arguments": {"component": f"component-{i}", "target": "release"},
+            "dependencies": [f"component-{i // 2}"] if i else [],
+        }
+    return script
+
+
+def measure(count):
+    """
+    Measures the memory still held once a generated script has been validated and compiled,
+    including whatever the graph keeps alive from the parsed script.
+
+    Args:
+        count (int): The number of tasks.
+
+    Returns:
+        float: The number of bytes retained per task.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    script = generate_script(count)
+    with contextlib.redirect_stdout(io.StringIO()):
+        validate_script(script)
+    graph = compile_script(script, "/tmp")
+    del script  # The executor only keeps the compiled graph
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(graph) == count
+    return retained / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the memory retained per compiled task")
+    parser.add_argument("--tasks", type=int, default=200_000, help="Number of generated tasks (default: 200000).")
+    args = parser.parse_args()
+
+    print(f"{args.tasks} tasks: {measure(args.tasks):.0f} bytes per task")
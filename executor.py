@@ -5,246 +5,4185 @@ This script allows defining tasks in a YAML file and executing them
 based on dependencies and conditions.
 """
 import argparse
+import asyncio
+import bisect
+import contextlib
+import ctypes
 import datetime
+import errno
+import fcntl
+import fnmatch
+import glob
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import math
 import os
+import pickle
+import queue
+import re
+import runpy
+import shlex
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
 import yaml
+import zlib
 
-from collections import namedtuple
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from sys import exit
+from types import MappingProxyType
 from yaml import YAMLError
 
 
+OUTPUT_TAIL_SIZE = 64 * 1024   # bytes of stdout/stderr kept in memory per task for error reporting
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes read from a child's pipe at a time
+LOG_DIR = "log"                # directory of the log store, relative to the current directory
+LOG_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes of compressed records in a log segment before the next one is started
+LOG_SEGMENT_AGE = 24 * 3600    # seconds a log segment receives records before the next one is started
+LOG_MAX_SIZE = 1024            # megabytes of log segments kept before the oldest ones are deleted
+LOG_MAX_AGE = 30 * 24 * 3600   # seconds after which a log segment that received no record is deleted
+LOG_FLUSH_INTERVAL = 0.2       # seconds a log record may wait in memory before it is written
+LOG_FLUSH_SIZE = 1024 * 1024   # bytes of pending log records that trigger an immediate write
+CACHE_DIR = ".executor_cache"
+CACHE_SIZE = 1024              # megabytes kept in the result cache before the least recently used entries are evicted
+NO_ARGUMENTS = MappingProxyType({})  # Read-only, so every task without arguments can share it
+DEFAULT_RESOURCES = MappingProxyType({"cpus": 1.0})  # What a task without 'resources' holds while it runs
+SIZE_UNITS = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}  # Memory sizes are counted in megabytes
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)  # The libyaml loader, if PyYAML was built with it
+PLAN_VERSION = 7               # Bumped whenever the pickled TaskGraph layout changes
+DEFAULT_DURATION = 1.0         # seconds assumed for a task that never ran, when no other task ran either
+HISTORY_DB = ".executor_history.db"
+HISTORY_WINDOW = 5             # latest successful runs of a task averaged into its expected duration
+HISTORY_RUNS = 50              # runs kept per task when the history is compacted
+HISTORY_MAX_AGE = 90 * 86400   # seconds after which the runs of tasks that stopped running are dropped
+RUNNERS = ("shell", "python-pool")
+TIMEOUT_EXIT_CODE = 124        # The exit code of a task that was killed for running too long, like timeout(1)
+KILL_GRACE = 2.0               # seconds between SIGTERM and SIGKILL when a task is killed
+HEDGE_PERCENTILE = 0.95        # a hedged task gets a second copy once it runs longer than this share of its runs
+HEDGE_MIN_RUNS = 5             # successful runs needed before a task is hedged
+BATCH_SIZE = 100               # tasks coalesced into one batched invocation, unless the task's 'batch' sets 'size'
+BATCH_LENGTH = 128 * 1024      # characters of a batched command line, unless the task's 'batch' sets 'length'
+BATCH_DELIMITER = "EXECUTOR_BATCH_DELIMITER"  # Environment variable telling a batched command what to print after each task
+BATCH_FIELD = re.compile(r"(?<!\{)\{(?!\{)")  # The first placeholder of a command template, '{{' being a literal brace
+MESSAGE_LIMIT = 16 * 1024 * 1024  # bytes of a JSON line exchanged between the coordinator and its workers
+WORKER_CONNECT_TIMEOUT = 30.0  # seconds a worker keeps trying to reach the coordinator
+EVENTS_INTERVAL = 0.1          # seconds between two writes of the coalesced events to the event bus clients
+EVENTS_OUTPUT_LIMIT = 16 * 1024  # bytes of a task's output published per interval, the older ones are skipped
+EVENTS_BUFFER_LIMIT = 1024 * 1024  # bytes an event bus client may lag behind before it gets no more output
+EVENTS_DRAIN_TIMEOUT = 5.0     # seconds the event bus lets its clients receive the last events of a run
+WATCH_DEBOUNCE = 0.2           # seconds without file changes before a watch run starts
+WATCH_POLL_INTERVAL = 0.5      # seconds between two scans of the watched directories when polling
+INOTIFY_EVENTS = 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE
+DAEMON_SOCKET = os.path.join(tempfile.gettempdir(), f"executor-{os.getuid()}.sock")
+POOL_RECYCLE = 100             # tasks run by a Python pool worker before it is replaced by a fresh one
+POOL_PYTHON = re.compile(r"python(3(\.\d+)?)?")  # Commands the Python pool can run in place of the interpreter
+PROGRAM_PATHS = {}             # Programs found on the PATH, by name and PATH
+LOG_ATTEMPTS = itertools.count()  # Tells apart the log records of copies of a task running at the same time
+SHELL_BUILTINS = frozenset(("cd", "exit", "export", "unset", "set", "source", ".", "exec", "eval", "alias",
+                            "ulimit", "umask", "trap", "wait", "shift", "read", "return", "readonly",
+                            "if", "for", "while", "until", "case", "!"))  # Commands only a shell can run
+SHELL_SYNTAX = set("|&;<>()$`\\\"'*?[]{}~#\n")  # Characters that need a real shell to be interpreted
+
+
+class LogWriter:
+    def __init__(self, path, flush_interval=LOG_FLUSH_INTERVAL, flush_size=LOG_FLUSH_SIZE, mode="a"):
+        """
+        Initializes a LogWriter object that writes log records to a file from a background thread.
+
+        The text a task logs is kept in memory until the task is over, then handed over through a
+        queue as one record and written in batches, whenever 'flush_interval' seconds have passed
+        since the oldest pending record or 'flush_size' bytes are pending. Every record is written
+        whole, so the output of tasks running in parallel never interleaves.
+
+        Args:
+            path (str): The path of the log file.
+            flush_interval (float, optional): Maximum seconds a record stays pending. Defaults to LOG_FLUSH_INTERVAL.
+            flush_size (int, optional): Pending bytes that trigger a write. Defaults to LOG_FLUSH_SIZE.
+            mode (str, optional): The mode the log file is opened in, "w" to truncate it. Defaults to "a", appending.
+        """
+        self.path = path
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.queue = queue.SimpleQueue()
+        self.records = {}  # (Task, attempt) -> text of its unfinished record
+        self.log_file = None
+        self.thread = threading.Thread(target=self._run, name="executor-log-writer", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        Opens the log file and starts the background thread that writes the records.
+
+        Raises:
+            OSError: If the log file cannot be opened.
+        """
+        self.log_file = open(self.path, self.mode)
+        self.thread.start()
+
+    def write(self, record, task=None, last=False, attempt=None):
+        """
+        Adds text to the record of a task, queued for writing once complete. This never blocks on file I/O.
+
+        Args:
+            record (str): The text to append to the task's record.
+            task (str, optional): The name of the task. Defaults to None, for text of no task, queued at once.
+            last (bool, optional): Whether the task's record is complete. Defaults to False.
+            attempt (hashable, optional): Tells apart the records of copies of the task running at the same
+                time, e.g. hedged ones. Defaults to None.
+        """
+        if task is None:
+            self.queue.put(record)
+            return
+        self.records.setdefault((task, attempt), []).append(record)
+        if last:
+            self.queue.put("".join(self.records.pop((task, attempt))))
+
+    async def drain(self):
+        """
+        Waits until the writer can take more records. Records are queued in memory, so this returns at once.
+        """
+
+    def close(self):
+        """
+        Writes all the pending records, including those of tasks that never finished, and stops the background thread.
+        """
+        for chunks in self.records.values():
+            self.queue.put("".join(chunks))
+        self.records.clear()
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        with self.log_file as log_file:
+            batch = []
+            pending = 0
+            deadline = None
+            closing = False
+            while not closing:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    record = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    record = ""
+                closing = record is None
+                if record:
+                    batch.append(record)
+                    pending += len(record)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if batch and (closing or pending >= self.flush_size or time.monotonic() >= deadline):
+                    log_file.write("".join(batch))
+                    log_file.flush()
+                    batch.clear()
+                    pending = 0
+                    deadline = None
+
+
+class LogStore(LogWriter):
+    def __init__(self, directory=LOG_DIR, script_file="", flush_interval=LOG_FLUSH_INTERVAL):
+        """
+        Initializes a LogStore object, which keeps one compressed record per task and per run.
+
+        The text a task logs is compressed as it arrives, and once the task is over, appended whole to
+        the current segment file of the directory by the background thread. An SQLite index maps every
+        record to its run, task, start time and byte range, so a record is read with a single seek.
+        Copies of a task running at the same time, e.g. hedged ones, keep records of their own. A new
+        segment is started after LOG_SEGMENT_SIZE bytes or LOG_SEGMENT_AGE seconds since the index
+        recorded its creation, and the oldest segments are deleted once they take more than
+        LOG_MAX_SIZE megabytes or received nothing for LOG_MAX_AGE seconds.
+
+        Args:
+            directory (str, optional): The directory of the segments and of their index. Defaults to LOG_DIR.
+            script_file (str, optional): The script whose run is logged, recorded in the index. Defaults to "".
+            flush_interval (float, optional): Maximum seconds a finished record stays pending. Defaults to LOG_FLUSH_INTERVAL.
+        """
+        super().__init__(directory, flush_interval)
+        self.script = os.path.abspath(script_file) if script_file else ""
+        self.index_path = os.path.join(directory, "index.db")
+        self.run_id = None
+
+    def connect(self):
+        """
+        Opens the index, creating its schema if needed.
+
+        Returns:
+            sqlite3.Connection: The connection, to be closed by the caller.
+        """
+        connection = sqlite3.connect(self.index_path, timeout=10)
+        # Never waits for the disk, which would double the cost of a short run: a crash of the executor
+        # loses nothing, but a power loss may lose or damage the index, never the segments
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, script TEXT NOT NULL, started REAL NOT NULL)")
+        connection.execute("""CREATE TABLE IF NOT EXISTS records (
+            run INTEGER NOT NULL, task TEXT NOT NULL, started REAL NOT NULL, segment INTEGER NOT NULL,
+            offset INTEGER NOT NULL, length INTEGER NOT NULL, size INTEGER NOT NULL)""")
+        connection.execute("CREATE INDEX IF NOT EXISTS records_by_task ON records (task, started)")
+        connection.execute("CREATE INDEX IF NOT EXISTS records_by_run ON records (run)")
+        connection.execute("CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY, created REAL NOT NULL)")
+        return connection
+
+    def start(self):
+        """
+        Registers the run in the index and starts the background thread that writes the records.
+
+        Raises:
+            OSError: If the directory cannot be created.
+            sqlite3.Error: If the index cannot be written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with contextlib.closing(self.connect()) as connection, connection:
+            self.run_id = connection.execute("INSERT INTO runs (script, started) VALUES (?, ?)",
+                                             (self.script, time.time())).lastrowid
+        self.thread.start()
+
+    def write(self, record, task=None, last=False, attempt=None):
+        """
+        Queues text logged by a task. This never blocks on file I/O.
+
+        Args:
+            record (str): The text to append to the task's record.
+            task (str, optional): The name of the task. Defaults to None, for text of no task.
+            last (bool, optional): Whether the task's record is complete. Defaults to False.
+            attempt (hashable, optional): Tells apart the records of copies of the task running at the same
+                time, e.g. hedged ones, which are kept apart. Defaults to None.
+        """
+        self.queue.put((task or "", attempt, record, last))
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, f"segment-{segment:06d}.z")
+
+    def segments(self):
+        """
+        Returns the numbers of the segment files of the store, oldest first.
+        """
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[8:-2]) for name in names if re.fullmatch(r"segment-\d+\.z", name))
+
+    def find(self, task=None, run=None):
+        """
+        Looks records up in the index.
+
+        Args:
+            task (str, optional): Only the records of this task. Defaults to None.
+            run (int, optional): Only the records of this run. Defaults to None.
+
+        Returns:
+            list: The matching records, oldest first, as dictionaries with the 'run', 'task', 'started',
+                'segment', 'offset', 'length' and 'size' (uncompressed) of each.
+        """
+        if not os.path.exists(self.index_path):
+            return []
+        conditions = [("task = ?", task), ("run = ?", run)]
+        where = " AND ".join(condition for condition, value in conditions if value is not None) or "1"
+        with contextlib.closing(self.connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(
+                f"SELECT * FROM records WHERE {where} ORDER BY started, rowid",
+                [value for _, value in conditions if value is not None])]
+
+    def read(self, record):
+        """
+        Returns the text of a record found in the index.
+
+        Raises:
+            OSError: If its segment was deleted meanwhile.
+        """
+        with open(self.segment_path(record["segment"]), "rb") as segment:
+            segment.seek(record["offset"])
+            return zlib.decompress(segment.read(record["length"])).decode(errors="replace")
+
+    def export(self, output, task=None, run=None):
+        """
+        Writes records in the plain-text format of the log, oldest first.
+
+        Args:
+            output (file): The text file receiving the records.
+            task (str, optional): Only the records of this task. Defaults to None.
+            run (int, optional): Only the records of this run. Defaults to None.
+
+        Returns:
+            int: The number of records written.
+        """
+        records = self.find(task, run)
+        for record in records:
+            with contextlib.suppress(OSError):
+                output.write(self.read(record))
+        return len(records)
+
+    def _run(self):
+        pending = {}   # (Task, attempt) -> [start time, compressor, compressed chunks, uncompressed size]
+        finished = []  # Complete records waiting to be appended
+        deadline = None
+        closing = False
+        with contextlib.closing(self.connect()) as connection:
+            while not closing:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = ()
+                closing = item is None
+                if item:
+                    task, attempt, text, last = item
+                    if (task, attempt) not in pending:
+                        pending[task, attempt] = [time.time(), zlib.compressobj(), [], 0]
+                    entry = pending[task, attempt]
+                    data = text.encode()
+                    entry[3] += len(data)
+                    if (chunk := entry[1].compress(data)):
+                        entry[2].append(chunk)
+                    if last:
+                        finished.append((task, pending.pop((task, attempt))))
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                if closing:
+                    finished.extend((task, entry) for (task, _), entry in pending.items())  # Tasks that never finished
+                if finished and (closing or time.monotonic() >= deadline):
+                    self._append(connection, finished)
+                    finished.clear()
+                    deadline = None
+            self._expire(connection)
+
+    def _append(self, connection, finished):
+        # Segments may be shared with other runs, so the end is found under an exclusive lock
+        segments = self.segments()
+        segment = segments[-1] if segments else 1
+        path = self.segment_path(segment)
+        with contextlib.suppress(FileNotFoundError):
+            size = os.stat(path).st_size
+            # The age is counted from the first record, which the index keeps since appends change every file time
+            with connection:
+                connection.execute("INSERT OR IGNORE INTO segments VALUES (?, ?)", (segment, time.time()))
+            created, = connection.execute("SELECT created FROM segments WHERE id = ?", (segment,)).fetchone()
+            if size >= LOG_SEGMENT_SIZE or time.time() - created >= LOG_SEGMENT_AGE:
+                segment += 1
+                path = self.segment_path(segment)
+        rows = []
+        with open(path, "ab") as segment_file:
+            fcntl.flock(segment_file, fcntl.LOCK_EX)
+            offset = segment_file.seek(0, os.SEEK_END)
+            for task, (started, compressor, chunks, size) in finished:
+                blob = b"".join(chunks) + compressor.flush()
+                segment_file.write(blob)
+                rows.append((self.run_id, task, started, segment, offset, len(blob), size))
+                offset += len(blob)
+            segment_file.flush()
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO segments VALUES (?, ?)", (segment, time.time()))
+            connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _expire(self, connection):
+        # Whole segments go, oldest first, never the one being written
+        sizes = {}
+        for segment in self.segments()[:-1]:
+            with contextlib.suppress(FileNotFoundError):
+                sizes[segment] = os.stat(self.segment_path(segment))
+        segments = list(sizes)
+        total = sum(info.st_size for info in sizes.values())
+        for segment in segments:
+            if total <= LOG_MAX_SIZE * 1024 * 1024 and time.time() - sizes[segment].st_mtime < LOG_MAX_AGE:
+                break
+            with connection:
+                connection.execute("DELETE FROM records WHERE segment = ?", (segment,))
+                connection.execute("DELETE FROM segments WHERE id = ?", (segment,))
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.segment_path(segment))
+            total -= sizes[segment].st_size
+
+
+class ChildProcess:
+    def __init__(self, popen):
+        """
+        Initializes a ChildProcess object, a running command supervised by the event loop.
+
+        The child is reaped with wait4, which also reports the CPU time and peak memory it used,
+        something asyncio's own subprocess support discards.
+
+        Args:
+            popen (subprocess.Popen): The started child, with its standard output and error piped.
+        """
+        self.popen = popen
+        self.pid = popen.pid
+        self.group = False
+        self.stdout = None
+        self.stderr = None
+        self.returncode = None
+        self.rusage = None
+
+    async def wait(self):
+        """
+        Waits for the child to exit without blocking the event loop.
+
+        On Linux the loop polls a pid file descriptor of the child, so no thread is needed per child.
+        Elsewhere the blocking wait4 runs in a worker thread.
+
+        Returns:
+            int: The return code of the child (negative if it was killed by a signal).
+        """
+        if self.returncode is None:
+            try:
+                pidfd = os.pidfd_open(self.pid)
+            except (AttributeError, OSError):
+                _, status, self.rusage = await asyncio.to_thread(os.wait4, self.pid, 0)
+            else:
+                loop = asyncio.get_running_loop()
+                exited = loop.create_future()
+                loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+                try:
+                    await exited
+                finally:
+                    loop.remove_reader(pidfd)
+                    os.close(pidfd)
+                _, status, self.rusage = os.wait4(self.pid, 0)
+            self.returncode = self.popen.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def kill(self, signum=signal.SIGKILL):
+        """
+        Sends a signal to the child, and to every process it started if it leads its own process group.
+        """
+        if self.returncode is None:
+            try:
+                if self.group:
+                    os.killpg(self.pid, signum)
+                else:
+                    os.kill(self.pid, signum)
+            except ProcessLookupError:
+                pass
+
+
+def direct_command(command, cwd=None, shell=None, env=None):
+    """
+    Tokenizes a command that can be executed directly, without starting /bin/sh for it.
+
+    Args:
+        command (str): The formatted command of a task.
+        cwd (str, optional): The directory the command runs in, to resolve a relative program path. Defaults to None.
+        shell (bool, optional): True to always use the shell, False to never use it (the command is then
+            split with shell quoting rules), None to use it only when the command needs it. Defaults to None.
+        env (dict, optional): The environment whose PATH the program is looked up on. Defaults to None, the executor's own.
+
+    Returns:
+        tuple: The path of the program and the argument list, or None if the command runs through the shell.
+    """
+    if shell:
+        return None
+    if shell is None:
+        # Anything a shell would interpret, or a program only a shell provides, keeps the shell
+        if not SHELL_SYNTAX.isdisjoint(command):
+            return None
+        argv = command.split()
+        if not argv or argv[0] in SHELL_BUILTINS:
+            return None
+    else:
+        argv = shlex.split(command)
+
+    if "/" in argv[0]:
+        program = os.path.join(cwd or "", argv[0])
+        if not os.access(program, os.X_OK):
+            program = None
+    else:
+        key = (argv[0], (os.environ if env is None else env).get("PATH"))
+        if key not in PROGRAM_PATHS:
+            PROGRAM_PATHS[key] = shutil.which(argv[0], path=key[1])
+        program = PROGRAM_PATHS[key]
+    if program is None and shell is None:
+        return None  # Let the shell report it as not found
+    return program or argv[0], argv
+
+
+async def spawn_process(command, cwd=None, shell=None, env=None):
+    """
+    Starts a command whose output is read through the running event loop.
+
+    Simple commands are executed directly (see direct_command), which saves starting /bin/sh
+    for them. File descriptors other than the pipes of the command are closed in the child, so
+    none opened meanwhile by another thread or library leaks into it. The command leads a new
+    process group, so ChildProcess.kill reaches every process it starts.
+
+    Args:
+        command (str): The command to run.
+        cwd (str, optional): The directory the command runs in. Defaults to None, the current directory.
+        shell (bool, optional): Whether to run the command with /bin/sh, see direct_command. Defaults to None.
+        env (dict, optional): The environment of the command. Defaults to None, the executor's own.
+
+    Returns:
+        ChildProcess: The started child, with asyncio.StreamReader objects as stdout and stderr.
+
+    Raises:
+        OSError: If the command or its directory cannot be found.
+    """
+    loop = asyncio.get_running_loop()
+    direct = direct_command(command, cwd, shell, env)
+    if direct:
+        program, argv = direct
+        popen = subprocess.Popen(argv, executable=program, cwd=cwd, process_group=0,
+                                 env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    else:
+        popen = subprocess.Popen(command, shell=True, cwd=cwd, process_group=0,
+                                 env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process = ChildProcess(popen)
+    process.group = True
+    for name in ("stdout", "stderr"):
+        reader = asyncio.StreamReader(limit=STREAM_CHUNK_SIZE)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), getattr(popen, name))
+        setattr(process, name, reader)
+    return process
+
+
+def python_command(command):
+    """
+    Parses a command that can run in a Python pool worker instead of a new interpreter.
+
+    Only plain 'python script.py args...' and 'python -m module args...' commands qualify; anything
+    using shell syntax (redirections, pipes, variables, quoting, globs...) or interpreter options is
+    left to the shell.
+
+    Args:
+        command (str): The formatted command of a task.
+
+    Returns:
+        dict: The script 'path' or 'module' to run and its 'argv', or None if the command needs a shell.
+    """
+    if not SHELL_SYNTAX.isdisjoint(command):
+        return None
+    argv = command.split()
+    if len(argv) < 2 or not POOL_PYTHON.fullmatch(argv[0]):
+        return None
+    if argv[1] == "-m" and len(argv) > 2:
+        return {"module": argv[2], "argv": argv[2:]}
+    if argv[1].startswith("-"):
+        return None
+    return {"path": argv[1], "argv": argv[1:]}
+
+
+def python_pool_worker(channel_fd):
+    """
+    Runs Python scripts sent by a PythonPool, one at a time, in this interpreter.
+
+    Every request carries the script and its argv, the directory and environment to run in, and the
+    write ends of the pipes receiving its standard output and error, which replace file descriptors 1 and 2 while
+    the script runs. The interpreter state a script may change (working directory, environment,
+    sys.path, sys.argv and imported modules) is restored afterwards, and the exit code is sent back.
+    The worker exits when the pool closes its end of the channel.
+
+    Args:
+        channel_fd (int): The worker's end of the SOCK_SEQPACKET socket pair shared with the pool.
+    """
+    channel = socket.socket(fileno=channel_fd)
+    console = os.dup(1), os.dup(2)
+    cwd, environ, path, modules = os.getcwd(), dict(os.environ), list(sys.path), set(sys.modules)
+
+    while True:
+        message, fds, _, _ = socket.recv_fds(channel, 1024 * 1024, 2)
+        if not message:
+            return
+        request = json.loads(message)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+
+        try:
+            os.chdir(request["cwd"] or cwd)
+            if request.get("env") is not None:
+                os.environ.clear()
+                os.environ.update(request["env"])
+            sys.argv = list(request["argv"])
+            if "module" in request:
+                sys.path.insert(0, os.getcwd())
+                runpy.run_module(request["module"], run_name="__main__", alter_sys=True)
+            else:
+                sys.path.insert(0, os.path.dirname(os.path.abspath(request["path"])))
+                runpy.run_path(request["path"], run_name="__main__")
+            retcode = 0
+        except SystemExit as exit_request:
+            if exit_request.code is None or isinstance(exit_request.code, int):
+                retcode = exit_request.code or 0
+            else:
+                print(exit_request.code, file=sys.stderr)
+                retcode = 1
+        except BaseException:
+            traceback.print_exc()
+            retcode = 1
+
+        for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except (AttributeError, OSError, ValueError):
+                pass
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        os.dup2(console[0], 1)
+        os.dup2(console[1], 2)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+        sys.path[:] = path
+        for name in set(sys.modules) - modules:
+            del sys.modules[name]
+        channel.send(json.dumps({"retcode": retcode}).encode())
+
+
+class PythonWorker:
+    def __init__(self):
+        """
+        Initializes a PythonWorker object, starting a warm interpreter that runs scripts for a PythonPool.
+        """
+        channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        bootstrap = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+                     f"import executor; del sys.path[0]; executor.python_pool_worker({worker_channel.fileno()})")
+        self.popen = subprocess.Popen([sys.executable, "-c", bootstrap], stdout=subprocess.DEVNULL,
+                                      pass_fds=(worker_channel.fileno(),))
+        worker_channel.close()
+        channel.setblocking(False)
+        self.channel = channel
+        self.pid = self.popen.pid
+        self.tasks = 0
+
+    def close(self):
+        """
+        Asks the worker to exit by closing its channel.
+        """
+        self.channel.close()
+
+
+class PoolProcess:
+    def __init__(self, pool, worker, stdout, stderr):
+        """
+        Initializes a PoolProcess object, a script running in a Python pool worker.
+
+        It offers the same interface as ChildProcess, so tasks handle both alike. No resource
+        usage is available for a script sharing its interpreter with others.
+
+        Args:
+            pool (PythonPool): The pool the worker is returned to.
+            worker (PythonWorker): The worker running the script.
+            stdout (asyncio.StreamReader): The standard output of the script.
+            stderr (asyncio.StreamReader): The standard error of the script.
+        """
+        self.pool = pool
+        self.worker = worker
+        self.pid = worker.pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self.rusage = None
+
+    def kill(self, signum=signal.SIGKILL):
+        """
+        Ends the script by killing its worker, which cannot be trusted after the script was interrupted.
+        """
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def wait(self):
+        """
+        Waits for the script to finish and hands the worker back to the pool.
+
+        Returns:
+            int: The exit code of the script, or the return code of the worker if the script ended it.
+        """
+        if self.returncode is None:
+            reply = await asyncio.get_running_loop().sock_recv(self.worker.channel, 4096)
+            if reply:
+                self.returncode = json.loads(reply)["retcode"]
+                self.pool.release(self.worker)
+            else:  # The script ended the interpreter itself, e.g. with os._exit
+                self.returncode = await asyncio.to_thread(self.worker.popen.wait)
+                self.pool.retire(self.worker)
+        return self.returncode
+
+
+class PythonPool:
+    def __init__(self, size, recycle=POOL_RECYCLE):
+        """
+        Initializes a PythonPool object, warm interpreters running the tasks with 'runner: python-pool'.
+
+        Starting a script in an interpreter that is already running saves the start of a shell and
+        of a new interpreter per task. Every worker is replaced after 'recycle' tasks, so state leaking
+        from one script to the next cannot pile up. The workers run the executor's own interpreter, so
+        only commands whose 'python' is that interpreter on the PATH run in the pool. None do when the
+        executor is a frozen build, e.g. the PyInstaller one, which has no interpreter to start.
+
+        Args:
+            size (int): The number of workers started up front, at most the number of tasks running at the same time.
+            recycle (int, optional): The number of tasks a worker runs before it is replaced. Defaults to POOL_RECYCLE.
+        """
+        self.size = size
+        self.recycle = recycle
+        self.idle = []
+        self.retired = []
+        # A program is the interpreter if it is the same file in the same directory, e.g. not the one a venv links to
+        self.interpreter = None if getattr(sys, "frozen", False) else \
+            (os.path.dirname(os.path.abspath(sys.executable)), os.path.realpath(sys.executable))
+
+    def start(self):
+        """
+        Starts the workers, which get ready while the first tasks are scheduled.
+        """
+        if self.interpreter:
+            self.idle.extend(PythonWorker() for _ in range(self.size - len(self.idle)))
+
+    async def spawn(self, command, cwd=None, env=None):
+        """
+        Starts a Python command in an idle worker, starting a new worker if none is idle.
+
+        Args:
+            command (str): The formatted command of the task.
+            cwd (str, optional): The directory the script runs in. Defaults to None, the current directory.
+            env (dict, optional): The environment the script runs with. Defaults to None, the worker's own.
+
+        Returns:
+            PoolProcess: The running script, or None if the command cannot run in the pool (see python_command),
+                or names another interpreter than the pool's.
+        """
+        request = python_command(command)
+        direct = request and direct_command(command, cwd, None, env)
+        if not direct or not self.interpreter \
+                or (os.path.dirname(os.path.abspath(direct[0])), os.path.realpath(direct[0])) != self.interpreter:
+            return None
+        request["cwd"] = cwd
+        request["env"] = env
+        loop = asyncio.get_running_loop()
+        while True:
+            worker = self.idle.pop() if self.idle else PythonWorker()
+            stdout_read, stdout_write = os.pipe()
+            stderr_read, stderr_write = os.pipe()
+            try:
+                socket.send_fds(worker.channel, [json.dumps(request).encode()], [stdout_write, stderr_write])
+                break
+            except OSError:  # The worker died while idle
+                self.retire(worker)
+                os.close(stdout_read)
+                os.close(stderr_read)
+            finally:
+                os.close(stdout_write)
+                os.close(stderr_write)
+
+        streams = []
+        for fd in (stdout_read, stderr_read):
+            reader = asyncio.StreamReader(limit=STREAM_CHUNK_SIZE)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0))
+            streams.append(reader)
+        return PoolProcess(self, worker, *streams)
+
+    def release(self, worker):
+        """
+        Returns a worker to the idle workers, replacing it once it has run 'recycle' tasks.
+        """
+        worker.tasks += 1
+        if worker.tasks >= self.recycle:
+            self.retire(worker)
+            worker = PythonWorker()
+        self.idle.append(worker)
+
+    def retire(self, worker):
+        """
+        Stops using a worker; it exits on its own once its channel is closed.
+        """
+        worker.close()
+        self.retired.append(worker.popen)
+        self.retired = [popen for popen in self.retired if popen.poll() is None]
+
+    def close(self):
+        """
+        Stops every worker and waits for them to exit.
+        """
+        for worker in self.idle:
+            self.retire(worker)
+        self.idle.clear()
+        for popen in self.retired:
+            popen.wait()
+        self.retired.clear()
+
+
+class FileStream:
+    def __init__(self, file):
+        """
+        Initializes a FileStream object, reading a binary file like an asyncio.StreamReader.
+
+        Args:
+            file (file): The binary file to read.
+        """
+        self.file = file
+
+    async def read(self, n=-1):
+        return await asyncio.to_thread(self.file.read, n)
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_DIR, max_size=CACHE_SIZE):
+        """
+        Initializes a ResultCache object storing the results of cacheable tasks in a directory.
+
+        An entry is keyed by a hash of everything the result depends on, so unchanged tasks can be
+        replayed instead of run. It holds the return code, the complete standard output and error,
+        and copies of the task's declared output files. Only successful runs are stored.
+
+        Args:
+            path (str, optional): The cache directory. Defaults to CACHE_DIR.
+            max_size (int, optional): Megabytes kept before the least recently used entries are evicted.
+                Defaults to CACHE_SIZE.
+        """
+        self.path = path
+        self.max_size = max_size * 1024 * 1024
+
+    def key(self, task, formatted_command, env=None):
+        """
+        Computes the cache key of a task.
+
+        Args:
+            task (Task): The task about to be executed.
+            formatted_command (str): The command with its arguments filled in.
+            env (dict, optional): The environment the task runs with. Defaults to None, the executor's own.
+
+        Returns:
+            str: The hex digest of the command, the test directory, the names and contents of
+                the declared input files, and the values of the selected environment variables.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{formatted_command}\0{task.test_dir}\0".encode())
+        for path in task.expand_paths(task.inputs):
+            with open(os.path.join(task.test_dir, path), "rb") as input_file:
+                digest.update(f"{path}\0".encode())
+                digest.update(hashlib.file_digest(input_file, "sha256").digest())
+        for name in sorted(task.cache_env):
+            digest.update(f"{name}={(os.environ if env is None else env).get(name)!r}\0".encode())
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def restore(self, key, test_dir):
+        """
+        Looks up an entry and copies its output files back into the test directory.
+
+        Args:
+            key (str): The cache key of the task.
+            test_dir (str): The directory the output files are restored into.
+
+        Returns:
+            dict: The recorded 'retcode' and the paths of the recorded 'stdout' and 'stderr',
+                or None if there is no usable entry.
+        """
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, "result.json")) as result_file:
+                result = json.load(result_file)
+            for path in result["outputs"]:
+                destination = os.path.join(test_dir, path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(os.path.join(entry, "outputs", path), destination)
+            os.utime(os.path.join(entry, "result.json"))  # Mark the entry as recently used
+        except (OSError, ValueError, KeyError):
+            return None
+        return {"retcode": result["retcode"],
+                "stdout": os.path.join(entry, "stdout"),
+                "stderr": os.path.join(entry, "stderr")}
+
+    def stage(self):
+        """
+        Creates a private directory where a running task records its result.
+
+        Returns:
+            str: The path of the staging directory, to be passed to store.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        return tempfile.mkdtemp(prefix="tmp-", dir=self.path)
+
+    def store(self, key, staging, retcode, test_dir, outputs):
+        """
+        Completes a staged result and publishes it under its key.
+
+        Args:
+            key (str): The cache key of the task.
+            staging (str): The staging directory holding the recorded 'stdout' and 'stderr'.
+            retcode (int): The return code of the task.
+            test_dir (str): The directory the output files are relative to.
+            outputs (list): The output files written by the task, relative to test_dir.
+        """
+        for path in outputs:
+            destination = os.path.join(staging, "outputs", path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy2(os.path.join(test_dir, path), destination)
+        with open(os.path.join(staging, "result.json"), "w") as result_file:
+            json.dump({"retcode": retcode, "outputs": outputs}, result_file)
+
+        entry = self.entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:  # Another run stored the same result first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in its maximum size.
+        """
+        entries = []
+        total = 0
+        if not os.path.isdir(self.path):
+            return
+        for shard in os.scandir(self.path):
+            if not shard.is_dir() or shard.name.startswith("tmp-"):
+                continue
+            for entry in os.scandir(shard.path):
+                size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, names in os.walk(entry.path) for name in names)
+                try:
+                    last_used = os.stat(os.path.join(entry.path, "result.json")).st_mtime
+                except OSError:
+                    last_used = 0
+                entries.append((last_used, size, entry.path))
+                total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class RunHistory:
+    def __init__(self, path=HISTORY_DB, script_file=""):
+        """
+        Initializes a RunHistory object, the runs of the tasks of a script recorded in an SQLite database.
+
+        Every run of a task records its duration, return code, output size and whether it was restored
+        from the cache. The expected duration of a task is the average of its latest successful runs.
+        The database is shared by all scripts, which are told apart by their absolute path.
+
+        Args:
+            path (str, optional): The SQLite database file. Defaults to HISTORY_DB.
+            script_file (str, optional): The script the tasks belong to. Defaults to "".
+        """
+        self.path = path
+        self.script = os.path.abspath(script_file)
+        self.durations = {}
+        self.runs = []
+
+    def connect(self):
+        """
+        Opens the database, creating its schema if needed.
+
+        Returns:
+            sqlite3.Connection: The connection, to be closed by the caller.
+        """
+        connection = sqlite3.connect(self.path, timeout=10)
+        if not connection.execute("PRAGMA page_count").fetchone()[0]:
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Only effective, and cheap, on a new database
+        connection.execute("""CREATE TABLE IF NOT EXISTS runs (
+            script TEXT NOT NULL, task TEXT NOT NULL, finished REAL NOT NULL, duration REAL NOT NULL,
+            retcode INTEGER NOT NULL, output_size INTEGER NOT NULL, cached INTEGER NOT NULL)""")
+        connection.execute("CREATE INDEX IF NOT EXISTS runs_by_task ON runs (script, task, finished)")
+        return connection
+
+    def load(self):
+        """
+        Reads the expected durations of the tasks, starting an empty history if the database is unusable.
+        """
+        try:
+            with contextlib.closing(self.connect()) as connection:
+                self.durations = dict(connection.execute("""
+                    SELECT task, AVG(duration) FROM (
+                        SELECT task, duration, ROW_NUMBER() OVER (PARTITION BY task ORDER BY finished DESC, rowid DESC) AS latest
+                        FROM runs WHERE script = ? AND retcode = 0 AND NOT cached)
+                    WHERE latest <= ? GROUP BY task""", (self.script, HISTORY_WINDOW)))
+        except sqlite3.Error:
+            self.durations = {}
+        return self
+
+    def percentile(self, name, fraction):
+        """
+        Returns a percentile of the durations of the latest successful runs of a task, e.g. 0.95 for the p95.
+
+        Returns:
+            float: The duration in seconds, or None if the task has fewer than HEDGE_MIN_RUNS such runs.
+        """
+        try:
+            with contextlib.closing(self.connect()) as connection:
+                durations = sorted(duration for duration, in connection.execute("""
+                    SELECT duration FROM runs WHERE script = ? AND task = ? AND retcode = 0 AND NOT cached
+                    ORDER BY finished DESC LIMIT ?""", (self.script, name, HISTORY_RUNS)))
+        except sqlite3.Error:
+            return None
+        if len(durations) < HEDGE_MIN_RUNS:
+            return None
+        return durations[math.ceil(fraction * len(durations)) - 1]
+
+    def record(self, name, seconds, retcode=0, output_size=0, cached=False):
+        """
+        Records a run of a task, written to the database by save.
+        """
+        self.runs.append((self.script, name, time.time(), seconds, retcode, output_size, int(cached)))
+
+    def estimates(self, graph):
+        """
+        Returns the expected duration of every task of a graph.
+
+        Tasks that never ran are assumed to take the average duration of the tasks that did,
+        and disabled tasks take no time.
+
+        Args:
+            graph (TaskGraph): The compiled graph of the tasks.
+
+        Returns:
+            array: The expected duration in seconds, indexed by task ID.
+        """
+        known = [self.durations[task.name] for task in graph.tasks if task.name in self.durations]
+        default = sum(known) / len(known) if known else DEFAULT_DURATION
+        return array("d", (self.durations.get(task.name, default) if task.enabled else 0.0 for task in graph.tasks))
+
+    def save(self):
+        """
+        Writes the recorded runs in a single transaction and compacts the history of the script.
+
+        Only the latest HISTORY_RUNS runs of every task are kept, and runs older than HISTORY_MAX_AGE
+        are dropped whatever script they belong to. Failures are ignored since the history only steers
+        scheduling and estimates.
+        """
+        try:
+            with contextlib.closing(self.connect()) as connection:
+                with connection:
+                    connection.executemany("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)", self.runs)
+                    connection.execute("""
+                        DELETE FROM runs WHERE rowid IN (
+                            SELECT rowid FROM (
+                                SELECT rowid, ROW_NUMBER() OVER (PARTITION BY task ORDER BY finished DESC, rowid DESC) AS latest
+                                FROM runs WHERE script = ?)
+                            WHERE latest > ?)""", (self.script, HISTORY_RUNS))
+                    connection.execute("DELETE FROM runs WHERE finished < ?", (time.time() - HISTORY_MAX_AGE,))
+                connection.execute("PRAGMA incremental_vacuum")
+            self.runs.clear()
+        except sqlite3.Error:
+            pass
+
+
+def parse_amount(name, amount):
+    """
+    Converts the amount of a resource to a number, memory sizes such as "512M" or "2G" to megabytes.
+
+    Args:
+        name (str): The name of the resource.
+        amount (int, float or str): The amount, which may have a K, M, G or T suffix for 'memory'.
+
+    Returns:
+        float: The amount, in megabytes for 'memory'.
+
+    Raises:
+        ValueError: If the amount is not a non-negative number or size.
+    """
+    number = amount
+    if isinstance(amount, str):
+        unit = SIZE_UNITS.get(amount[-1:].upper()) if name == "memory" else None
+        try:
+            number = float(amount[:-1] if unit else amount) * (unit or 1)
+        except ValueError:
+            number = None
+    if isinstance(number, bool) or not isinstance(number, (int, float)) or not 0 <= number < float("inf"):
+        raise ValueError(f"Invalid amount of resource '{name}': {amount!r}")
+    return float(number)
+
+
 class Task:
-    def __init__(self, name, command, arguments={}, dependencies=[], enabled=True, test_dir=""):
+    __slots__ = ("name", "command", "arguments", "dependencies", "enabled", "test_dir",
+                 "inputs", "outputs", "cache", "cache_env", "runner", "shell", "resources",
+                 "timeout", "hedge", "batch")
+
+    def __init__(self, name, command, arguments=None, dependencies=None, enabled=True, test_dir="",
+                 inputs=(), outputs=(), cache=False, cache_env=(), runner="shell", shell=None, resources=None,
+                 timeout=None, hedge=False, batch=None):
+        """
+        Initializes a Task object.
+
+        Scripts can hold hundreds of thousands of tasks, so the object is slotted, and the name,
+        the command template, the dependency names and the argument names are interned to share
+        them between tasks.
+
+        Args:
+            name (str): The name of the task.
+            command (str): The command to be executed.
+            arguments (dict, optional): A dictionary containing arguments for the command. Defaults to {}.
+            dependencies (list, optional): A list of task names that this task depends on. Defaults to [].
+            enabled (bool, optional): A boolean value indicating whether the task is enabled. Defaults to True.
+            test_dir (str, optional): The directory the command runs in. Defaults to "".
+            inputs (list, optional): Glob patterns of the files the command reads, relative to test_dir. Defaults to ().
+            outputs (list, optional): Glob patterns of the files the command writes, relative to test_dir. Defaults to ().
+            cache (bool, optional): Whether results of the task may be replayed from the result cache. Defaults to False.
+            cache_env (list, optional): Names of the environment variables the result depends on. Defaults to ().
+            runner (str, optional): "shell" to run the command with /bin/sh, or "python-pool" to run a
+                'python script.py ...' command in a warm interpreter of the context's 'python_pool'. Defaults to "shell".
+            shell (bool, optional): True to always run the command with /bin/sh, False to always execute it
+                directly. Defaults to None, using the shell only when the command needs it.
+            resources (dict, optional): The 'cpus', 'memory' (megabytes, or a size such as "512M" or "2G") and
+                amounts of named pools the task holds while it runs. Defaults to one CPU.
+            timeout (float, optional): Seconds after which the command and every process it started are killed.
+                Defaults to None, no limit.
+            hedge (bool, optional): Whether a second copy of the command may be started when it runs much longer
+                than usual; only for commands that can safely run twice at the same time. Defaults to False.
+            batch (dict or bool, optional): True, or the 'size' (number of tasks) and 'length' (characters of the command
+                line) limits of the batched invocations the task may be coalesced into with other ready tasks
+                sharing its command template (see execute_batch_async); the command must then take the
+                arguments of many tasks at once. Defaults to None, the task runs on its own.
+        """
+        self.name = sys.intern(name)
+        self.command = sys.intern(command)
+        self.arguments = {sys.intern(key): value for key, value in arguments.items()} if arguments else NO_ARGUMENTS
+        self.dependencies = [sys.intern(dependency) for dependency in dependencies] if dependencies else []
+        self.enabled = enabled
+        self.test_dir = test_dir
+        self.inputs = inputs or ()
+        self.outputs = outputs or ()
+        self.cache = cache
+        self.cache_env = cache_env or ()
+        self.runner = sys.intern(runner)
+        self.shell = shell
+        self.resources = MappingProxyType({**DEFAULT_RESOURCES, **{sys.intern(name): parse_amount(name, amount)
+                                                                   for name, amount in resources.items()}}) \
+            if resources else DEFAULT_RESOURCES
+        self.timeout = timeout
+        self.hedge = hedge
+        if batch is True:
+            batch = {}
+        self.batch = (batch.get("size", BATCH_SIZE), batch.get("length", BATCH_LENGTH)) if isinstance(batch, dict) \
+            else tuple(batch) if batch else None
+
+    def expand_paths(self, patterns):
+        """
+        Expands glob patterns relative to the task's test directory.
+
+        Args:
+            patterns (list): The glob patterns to expand, e.g. the task's inputs or outputs.
+
+        Returns:
+            list: The sorted paths of the existing files matching any of the patterns, relative to test_dir.
+        """
+        root_dir = self.test_dir or None
+        paths = set()
+        for pattern in patterns:
+            for path in glob.glob(pattern, root_dir=root_dir, recursive=True):
+                if os.path.isfile(os.path.join(self.test_dir, path)):
+                    paths.add(path)
+        return sorted(paths)
+
+    def __reduce__(self):
+        # Rebuild through __init__ when unpickled, so the strings are interned again
+        return (Task, (self.name, self.command, dict(self.arguments), self.dependencies, self.enabled,
+                       self.test_dir, self.inputs, self.outputs, self.cache, self.cache_env, self.runner,
+                       self.shell, dict(self.resources), self.timeout, self.hedge, self.batch))
+
+    def is_up_to_date(self):
+        """
+        Checks whether the task's declared outputs are newer than its declared inputs, like make does.
+
+        Returns:
+            bool: True if the task declares outputs, every input and output pattern matches at least
+                one existing file, and the oldest output is newer than the newest input.
+        """
+        if not self.outputs:
+            return False
+
+        modification_times = []
+        for patterns in (self.inputs, self.outputs):
+            times = []
+            for pattern in patterns:
+                paths = self.expand_paths([pattern])
+                if not paths:
+                    return False
+                times.extend(os.stat(os.path.join(self.test_dir, path)).st_mtime_ns for path in paths)
+            modification_times.append(times)
+
+        input_times, output_times = modification_times
+        return not input_times or min(output_times) > max(input_times)
+
+    def reads(self, path):
+        """
+        Tells whether a file is read by the task: matched by its inputs or, if it declares none,
+        named in its command, e.g. the helper in 'python read_from_file.py test.txt'.
+
+        Args:
+            path (str): The absolute path of the file.
+
+        Returns:
+            bool: True if a change to the file makes the task stale.
+        """
+        relative = os.path.relpath(path, self.test_dir or os.getcwd())
+        if self.inputs:
+            return self._matches(relative, self.inputs)
+        words = re.split(r"[\s\"'=;&|<>(),]+", self.command.format(**self.arguments))
+        return relative in {os.path.normpath(word) for word in words if word}
+
+    def writes(self, path):
+        """
+        Tells whether a file is one of the task's declared outputs.
+        """
+        return self._matches(os.path.relpath(path, self.test_dir or os.getcwd()), self.outputs)
+
+    @staticmethod
+    def _matches(relative, patterns):
+        # Like glob, '**/' also matches no directory at all
+        return any(fnmatch.fnmatchcase(relative, os.path.normpath(pattern))
+                   or fnmatch.fnmatchcase(relative, os.path.normpath(pattern.replace("**/", "")))
+                   for pattern in patterns)
+
+    def batch_parts(self):
+        """
+        Splits the formatted command before the word holding the first placeholder of its template.
+
+        Returns:
+            tuple: The part of the command shared by the tasks of a batch, and the part this task adds to it.
+        """
+        match = BATCH_FIELD.search(self.command)
+        split = len(re.sub(r"\S*$", "", self.command[:match.start()])) if match else len(self.command)
+        return self.command[:split].format(**self.arguments).strip(), self.command[split:].format(**self.arguments)
+
+    def watched_directories(self):
+        """
+        Returns the directories holding the files the task reads: its test directory, and those of its inputs.
+        """
+        root = os.path.normpath(self.test_dir or os.getcwd())
+        directories = {root}
+        for pattern in self.inputs:
+            static = re.split(r"[*?\[]", pattern)[0]  # The part of the pattern before any wildcard
+            directories.add(os.path.normpath(os.path.join(root, os.path.dirname(static))))
+        for path in self.expand_paths(self.inputs):
+            directories.add(os.path.dirname(os.path.join(root, path)))
+        return directories
+
+    def execute(self, context):
+        """
+        Executes the task's command with arguments and context, blocking until it finishes.
+
+        Args:
+            context (dict): A dictionary containing values for arguments and condition evaluation.
+
+        Returns:
+            tuple: A tuple containing the process return code, standard output, and standard error (if any).
+        """
+        return run_async(self.execute_async(context))
+
+    async def execute_async(self, context):
+        """
+        Executes the task's command with arguments and context on the running event loop.
+
+        The command runs in the task's test directory without changing the working directory
+        of the executor, so any number of tasks can be awaited concurrently. Its output is streamed
+        to the 'log_writer' from the context while it runs (a LogStore of its own is used if there
+        is none); only the last 'output_tail' bytes are kept. Tasks with 'cache' set are replayed from
+        the context's 'cache' when nothing they depend on has changed since a successful run. The run
+        is recorded in the context's 'history' RunHistory, if any. Tasks with 'runner: python-pool' run
+        in the context's 'python_pool' when their command allows it, and through the shell otherwise.
+        The command is killed with its whole process group when it outlives the task's 'timeout' or the
+        context's 'deadline' (a time.monotonic() value), or when the coroutine is cancelled.
+
+        Args:
+            context (dict): A dictionary containing values for arguments and condition evaluation.
+
+        Returns:
+            tuple: A tuple containing the process return code, and the tails of standard output and standard error.
+        """
+        if not self.enabled:
+            print(f"Task '{self.name}' skipped since it is disabled.")
+            retcode = -1    # return code defined for skipped task
+            output = None
+            error = ""
+            return retcode, output, error
+
+        log_writer = context.get("log_writer")
+        if log_writer is None:  # Called on its own, outside of execute_script
+            with LogStore(os.path.join(os.getcwd(), LOG_DIR)) as log_writer:
+                return await self.execute_async(dict(context, log_writer=log_writer))
+        formatted_command = self.command.format(**self.arguments)
+        print(f"Task '{self.name}' command: {formatted_command}")
+        tail_size = context.get("output_tail", OUTPUT_TAIL_SIZE)
+        attempt = next(LOG_ATTEMPTS)  # Hedged copies of the task keep records of their own
+
+        cache = context.get("cache") if self.cache else None
+        if cache:
+            key = await asyncio.to_thread(cache.key, self, formatted_command, context.get("env"))
+            if (cached := await asyncio.to_thread(cache.restore, key, self.test_dir)):
+                start = time.perf_counter()
+                retcode, output, error, output_size = await self._replay(cached, formatted_command, log_writer, tail_size,
+                                                                     attempt)
+                if (history := context.get("history")):
+                    history.record(self.name, time.perf_counter() - start, retcode, output_size, cached=True)
+                return retcode, output, error
+            staging = await asyncio.to_thread(cache.stage)
+
+        timeout = self.timeout
+        if (deadline := context.get("deadline")) is not None:
+            timeout = min(timeout or math.inf, max(deadline - time.monotonic(), 0.0))
+
+        started = time.time()
+        spawn_start = time.perf_counter()
+        pool = context.get("python_pool") if self.runner == "python-pool" else None
+        try:
+            process = pool and await pool.spawn(formatted_command, self.test_dir or None, context.get("env"))
+            if process is None:
+                process = await spawn_process(formatted_command, self.test_dir or None, self.shell, context.get("env"))
+        except OSError as error:
+            print(f"Task '{self.name}' could not be started: {error}")
+            if cache:
+                await asyncio.to_thread(shutil.rmtree, staging, True)
+            return 127, None, str(error)  # The exit code of a shell for a command it cannot find
+        spawn_latency = time.perf_counter() - spawn_start
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_writer.write(f"\n** Task: {self.name} ({timestamp}) **\nCommand: {formatted_command}\n", self.name,
+                         attempt=attempt)
+
+        loop = asyncio.get_running_loop()
+        expired = []
+
+        def expire():
+            # Ask politely first, the output keeps being read until the process group is gone
+            expired.append(True)
+            process.kill(signal.SIGTERM)
+            loop.call_later(KILL_GRACE, process.kill, signal.SIGKILL)
+        timer = loop.call_later(timeout, expire) if timeout is not None else None
+
+        try:
+            if cache:
+                with open(os.path.join(staging, "stdout"), "wb") as stdout, open(os.path.join(staging, "stderr"), "wb") as stderr:
+                    (output, output_size), (error, error_size) = await asyncio.gather(
+                        self._stream_output(process.stdout, "stdout", log_writer, tail_size, attempt, copy=stdout),
+                        self._stream_output(process.stderr, "stderr", log_writer, tail_size, attempt, copy=stderr))
+            else:
+                (output, output_size), (error, error_size) = await asyncio.gather(
+                    self._stream_output(process.stdout, "stdout", log_writer, tail_size, attempt),
+                    self._stream_output(process.stderr, "stderr", log_writer, tail_size, attempt))
+            retcode = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            log_writer.write(f"** Task: {self.name} cancelled **\n\n" + 50*"-" + "\n", self.name, True, attempt)
+            if cache:
+                await asyncio.to_thread(shutil.rmtree, staging, True)
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+        if expired:
+            print(f"Task '{self.name}' timed out after {timeout:g} seconds.")
+            retcode = TIMEOUT_EXIT_CODE
+        log_writer.write(f"** Task: {self.name} finished with exit code {retcode} **\n\n" + 50*"-" + "\n", self.name,
+                         True, attempt)
+        if (history := context.get("history")):
+            history.record(self.name, time.perf_counter() - spawn_start, retcode, output_size + error_size)
+        if (trace := context.get("trace")):
+            trace.write(json.dumps({
+                "task": self.name, "command": formatted_command, "pid": process.pid, "start": started,
+                "spawn_latency": spawn_latency, "wall": time.perf_counter() - spawn_start,
+                "user_cpu": process.rusage.ru_utime if process.rusage else None,
+                "system_cpu": process.rusage.ru_stime if process.rusage else None,
+                "max_rss_kb": process.rusage.ru_maxrss if process.rusage else None,
+                "retcode": retcode}) + "\n")
+
+        if cache and retcode == 0:
+            await asyncio.to_thread(cache.store, key, staging, retcode, self.test_dir, self.expand_paths(self.outputs))
+        elif cache:
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+
+        return retcode, output, error
+
+    async def _replay(self, cached, formatted_command, log_writer, tail_size, attempt=None):
+        """
+        Replays a result restored from the result cache into the log, as if the command had run.
+
+        Args:
+            cached (dict): The cache entry returned by ResultCache.restore.
+            formatted_command (str): The command the entry was recorded for.
+            log_writer (LogStore): The writer receiving the log records.
+            tail_size (int): The number of trailing bytes of each stream to keep.
+            attempt (int, optional): The run of the task the log records belong to. Defaults to None.
+
+        Returns:
+            tuple: A tuple containing the recorded return code, the tails of standard output and standard error,
+                and the total size of both in bytes.
+        """
+        print(f"Task '{self.name}' restored from cache.")
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_writer.write(f"\n** Task: {self.name} ({timestamp}) [cached] **\nCommand: {formatted_command}\n", self.name,
+                         attempt=attempt)
+        with open(cached["stdout"], "rb") as stdout, open(cached["stderr"], "rb") as stderr:
+            output, output_size = await self._stream_output(FileStream(stdout), "stdout", log_writer, tail_size, attempt)
+            error, error_size = await self._stream_output(FileStream(stderr), "stderr", log_writer, tail_size, attempt)
+        retcode = cached["retcode"]
+        log_writer.write(f"** Task: {self.name} finished with exit code {retcode} **\n\n" + 50*"-" + "\n", self.name,
+                         True, attempt)
+        return retcode, output, error, output_size + error_size
+
+    async def _stream_output(self, stream, label, log_writer, tail_size, attempt=None, copy=None):
+        """
+        Copies one of the child's output streams to the log, line by line, as it is produced.
+
+        Every line is tagged with the task name and stream, so output of tasks running in parallel
+        stays attributable. Lines longer than STREAM_CHUNK_SIZE are split.
+
+        Args:
+            stream (asyncio.StreamReader): The child's stdout or stderr pipe.
+            label (str): The name of the stream written in the log ("stdout" or "stderr").
+            log_writer (LogStore): The writer receiving the log records.
+            tail_size (int): The number of trailing bytes of the stream to keep.
+            attempt (int, optional): The run of the task the log records belong to. Defaults to None.
+            copy (file, optional): A binary file receiving a verbatim copy of the stream. Defaults to None.
+
+        Returns:
+            tuple: The last 'tail_size' bytes of the stream, and the size of the whole stream in bytes.
+        """
+        prefix = f"   [{self.name}:{label}] "
+        tail = bytearray()
+        size = 0
+        pending = b""
+        while True:
+            chunk = await stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if copy:
+                copy.write(chunk)
+            size += len(chunk)
+            tail += chunk
+            del tail[:max(0, len(tail) - tail_size)]
+
+            *lines, pending = (pending + chunk).split(b"\n")
+            if len(pending) >= STREAM_CHUNK_SIZE:
+                lines.append(pending)
+                pending = b""
+            if lines:
+                log_writer.write("".join(f"{prefix}{line.decode(errors='replace')}\n" for line in lines), self.name,
+                                 attempt=attempt)
+                await log_writer.drain()  # A slow log, e.g. a coordinator's connection, slows the reading down
+
+        if pending:
+            log_writer.write(f"{prefix}{pending.decode(errors='replace')}\n", self.name, attempt=attempt)
+        return tail.decode(errors="replace"), size
+
+    def __str__(self):
+        return f"Task Name: {self.name}\n \
+                Command: {self.command}\n \
+                Arguments: {self.arguments}\n \
+                Dependencies: {self.dependencies}\n \
+                Enabled: {self.enabled}\n \
+                Test Directory: {self.test_dir}"
+
+
+async def execute_batch_async(tasks, context):
+    """
+    Executes tasks sharing a command template in a single invocation of the command, like xargs.
+
+    The batched command is the part of the template before the word holding its first placeholder,
+    followed by the rest of the formatted command of every task, in order (see Task.batch_parts).
+    The command must handle all of the arguments it is given: one reading only its first argument
+    would compute the first task and report the others as done.
+    The command is told it runs a batch by the BATCH_DELIMITER environment variable: once it is done
+    with the arguments of a task, it prints a line with the variable's value and the task's exit code
+    to stdout, and the same line to stderr. The output up to a delimiter line belongs to the task, so
+    each task appears in the log, the history and the trace as if it had run on its own. The tasks a
+    command left without a delimiter line, e.g. one that does not know the protocol or only reads its
+    first argument, are run again on their own, since nothing tells whether they were done. The tasks'
+    'timeout' applies to each task in turn, and the context's 'deadline' to the whole batch.
+
+    Args:
+        tasks (list): The enabled tasks, sharing their command template, test directory and shell setting.
+        context (dict): See Task.execute_async.
+
+    Returns:
+        list: A tuple per task, containing its return code, and the tails of standard output and standard error.
+    """
+    if len(tasks) < 2:
+        return [await task.execute_async(context) for task in tasks]
+
+    parts = [task.batch_parts() for task in tasks]
+    command = " ".join([parts[0][0], *(argument for _, argument in parts)])
+    for task, (prefix, argument) in zip(tasks, parts):
+        print(f"Task '{task.name}' command: {f'{prefix} {argument}'.strip()}")
+    print(f"Batch of {len(tasks)} tasks started with a single command.")
+    tail_size = context.get("output_tail", OUTPUT_TAIL_SIZE)
+    log_writer = context["log_writer"]
+    delimiter = f"--executor-batch-{os.urandom(8).hex()}--"  # Unlikely to be printed by accident
+    test_dir = tasks[0].test_dir
+
+    def limit():
+        timeout = tasks[0].timeout
+        if (deadline := context.get("deadline")) is not None:
+            timeout = min(timeout or math.inf, max(deadline - time.monotonic(), 0.0))
+        return timeout
+
+    started = time.time()
+    spawn_start = time.perf_counter()
+    try:
+        process = await spawn_process(command, test_dir or None, tasks[0].shell,
+                                      env=dict(context.get("env") or os.environ, **{BATCH_DELIMITER: delimiter}))
+    except OSError as error:
+        print(f"Batch of {len(tasks)} tasks could not be started: {error}")
+        return [(127, None, str(error))] * len(tasks)
+    spawn_latency = time.perf_counter() - spawn_start
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for task, (prefix, argument) in zip(tasks, parts):
+        log_writer.write(f"\n** Task: {task.name} ({timestamp}) **\nCommand: {f'{prefix} {argument}'.strip()}\n",
+                         task.name)
+
+    loop = asyncio.get_running_loop()
+    retcodes = [None] * len(tasks)
+    ended = [spawn_start] * len(tasks)
+    expired = []
+    timer = timeout = None
+
+    def expire():
+        expired.append(True)
+        process.kill(signal.SIGTERM)
+        loop.call_later(KILL_GRACE, process.kill, signal.SIGKILL)
+
+    def restart_timer():
+        # Every task of the batch gets the full timeout
+        nonlocal timer, timeout
+        if timer:
+            timer.cancel()
+        timeout = limit()
+        timer = loop.call_later(timeout, expire) if timeout is not None else None
+
+    def task_ended(index, retcode):
+        try:
+            retcodes[index] = int(retcode)
+        except ValueError:
+            retcodes[index] = 1
+        ended[index] = time.perf_counter()
+        restart_timer()
+
+    restart_timer()
+    try:
+        (outputs, output_sizes), (errors, error_sizes) = await asyncio.gather(
+            _split_batch_output(process.stdout, "stdout", tasks, delimiter, log_writer, tail_size, task_ended),
+            _split_batch_output(process.stderr, "stderr", tasks, delimiter, log_writer, tail_size))
+        retcode = await process.wait()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        for task in tasks:
+            log_writer.write(f"** Task: {task.name} cancelled **\n\n" + 50*"-" + "\n", task.name, last=True)
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+
+    finished = time.perf_counter()
+    history = context.get("history")
+    trace = context.get("trace")
+    results = []
+    unreported = []
+    for index, task in enumerate(tasks):
+        if retcodes[index] is None and not expired:
+            log_writer.write(f"** Task: {task.name} not reported by the batched command **\n\n" + 50*"-" + "\n",
+                             task.name, last=True)
+            unreported.append(index)
+            results.append(None)
+            continue
+        if retcodes[index] is None:
+            if index == 0 or retcodes[index - 1] is not None:
+                print(f"Task '{task.name}' timed out after {timeout:g} seconds.")
+            retcodes[index] = TIMEOUT_EXIT_CODE
+            ended[index] = finished
+        log_writer.write(f"** Task: {task.name} finished with exit code {retcodes[index]} **\n\n" + 50*"-" + "\n",
+                         task.name, last=True)
+        start = ended[index - 1] if index else spawn_start
+        if history:
+            history.record(task.name, ended[index] - start, retcodes[index], output_sizes[index] + error_sizes[index])
+        if trace:
+            trace.write(json.dumps({
+                "task": task.name, "command": f"{parts[index][0]} {parts[index][1]}".strip(), "pid": process.pid,
+                "start": started + start - spawn_start, "spawn_latency": spawn_latency if index == 0 else 0.0,
+                "wall": ended[index] - start, "user_cpu": None, "system_cpu": None, "max_rss_kb": None,
+                "retcode": retcodes[index], "batch": len(tasks)}) + "\n")
+        results.append((retcodes[index], outputs[index], errors[index]))
+    if unreported:
+        print(f"Batched command exited with code {retcode} without reporting {len(unreported)} of its "
+              f"{len(tasks)} tasks, running them on their own.")
+        for index in unreported:
+            results[index] = await tasks[index].execute_async(context)
+    return results
+
+
+async def _split_batch_output(stream, label, tasks, delimiter, log_writer, tail_size, task_ended=None):
+    """
+    Copies one of the output streams of a batched command to the log, line by line, attributing
+    each line to the task the command was busy with (see execute_batch_async).
+
+    Args:
+        stream (asyncio.StreamReader): The command's stdout or stderr pipe.
+        label (str): The name of the stream written in the log ("stdout" or "stderr").
+        tasks (list): The tasks of the batch, in the order of their arguments.
+        delimiter (str): The value of BATCH_DELIMITER, which starts the line printed after each task.
+        log_writer (LogStore): The writer receiving the log records.
+        tail_size (int): The number of trailing bytes of the stream to keep per task.
+        task_ended (callable, optional): Called with the index of a task and the rest of its delimiter
+            line, the exit code, once the task is done. Defaults to None.
+
+    Returns:
+        tuple: The last 'tail_size' bytes of the stream, and its size in bytes, each as a list indexed like 'tasks'.
+    """
+    marker = delimiter.encode()
+    tails = [bytearray() for _ in tasks]
+    sizes = [0] * len(tasks)
+    index = 0  # Output printed after the last delimiter line still belongs to the last task
+    pending = b""
+
+    def copy(lines):
+        current = min(index, len(tasks) - 1)
+        text = b"".join(line + b"\n" for line in lines)
+        sizes[current] += len(text)
+        tails[current] += text
+        del tails[current][:max(0, len(tails[current]) - tail_size)]
+        prefix = f"   [{tasks[current].name}:{label}] "
+        log_writer.write("".join(f"{prefix}{line.decode(errors='replace')}\n" for line in lines), tasks[current].name)
+
+    while True:
+        chunk = await stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            lines, pending = [pending] if pending else [], b""
+        else:
+            *lines, pending = (pending + chunk).split(b"\n")
+            if len(pending) >= STREAM_CHUNK_SIZE:
+                lines.append(pending)
+                pending = b""
+        block = []
+        for line in lines:
+            if not line.startswith(marker):
+                block.append(line)
+                continue
+            if block:
+                copy(block)
+                block = []
+            if index < len(tasks):
+                if task_ended:
+                    task_ended(index, line[len(marker):].decode(errors="replace").strip())
+                index += 1
+        if block:
+            copy(block)
+        if not chunk:
+            break
+    return [tail.decode(errors="replace") for tail in tails], sizes
+
+
+class TaskMatrix:
+    def __init__(self, task, matrix):
+        """
+        Initializes a TaskMatrix object, one task definition run once per cell of a parameter grid.
+
+        The cells are never stored: cell i is decoded from its position, the last parameter changing
+        fastest, and its Task is only built when asked for, so a sweep over tens of thousands of cells
+        costs about as much memory as a single task. A cell is named after the template and its values,
+        e.g. 'test[linux,3.12]', gets its values as arguments, and formats the template's dependencies,
+        inputs and outputs with them, so 'build[{os}]' depends on the cell of 'build' with the same 'os'
+        and 'dist/{os}.tar' is the output of that cell only.
+
+        Args:
+            task (Task): The template of the cells.
+            matrix (dict): The values of every parameter, e.g. {"os": ["linux", "mac"], "python": ["3.11", "3.12"]}.
+        """
+        self.task = task
+        self.parameters = tuple(sys.intern(str(name)) for name in matrix)
+        self.values = tuple(tuple(values) for values in matrix.values())
+        self.positions = tuple({str(value): position for position, value in enumerate(values)} for values in self.values)
+        self.size = math.prod(map(len, self.values))
+
+    def __len__(self):
+        return self.size
+
+    def cell(self, index):
+        """
+        Returns the parameter values of a cell, e.g. {"os": "mac", "python": "3.11"}.
+        """
+        values = {}
+        for name, choices in zip(reversed(self.parameters), reversed(self.values)):
+            index, position = divmod(index, len(choices))
+            values[name] = choices[position]
+        return dict(reversed(values.items()))
+
+    def name(self, cell):
+        return f"{self.task.name}[{','.join(map(str, cell.values()))}]"
+
+    def index(self, name):
+        """
+        Returns the position of the cell with the given name, or None if it is not a cell of the matrix.
+        """
+        prefix = f"{self.task.name}["
+        if not (name.startswith(prefix) and name.endswith("]")):
+            return None
+        values = name[len(prefix):-1].split(",")
+        if len(values) != len(self.parameters):
+            return None
+        index = 0
+        for value, positions, choices in zip(values, self.positions, self.values):
+            if (position := positions.get(value)) is None:
+                return None
+            index = index * len(choices) + position
+        return index
+
+    def dependencies(self, cell):
+        """
+        Returns the dependencies of a cell, its template's dependencies formatted with its values.
+        """
+        return [dependency.format(**cell) for dependency in self.task.dependencies]
+
+    def task_at(self, index):
+        """
+        Builds the Task of a cell.
+        """
+        cell = self.cell(index)
+        task = Task.__new__(Task)
+        for slot in Task.__slots__:
+            setattr(task, slot, getattr(self.task, slot))
+        task.name = self.name(cell)
+        task.arguments = {**self.task.arguments, **cell}
+        task.dependencies = self.dependencies(cell)
+        task.inputs = [path.format(**cell) for path in self.task.inputs]
+        task.outputs = [path.format(**cell) for path in self.task.outputs]
+        return task
+
+
+class TaskList:
+    def __init__(self, definitions):
+        """
+        Initializes a TaskList object, the tasks of a graph indexed by ID, with task matrices expanded on access.
+
+        Args:
+            definitions (list): The Task and TaskMatrix objects, in script order.
+        """
+        self.definitions = definitions
+        self.starts = array("l", [0])
+        for definition in definitions:
+            self.starts.append(self.starts[-1] + (len(definition) if isinstance(definition, TaskMatrix) else 1))
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getitem__(self, task_id):
+        position = bisect.bisect_right(self.starts, task_id) - 1
+        definition = self.definitions[position]
+        if isinstance(definition, TaskMatrix):
+            return definition.task_at(task_id - self.starts[position])
+        return definition
+
+    def __iter__(self):
+        for definition in self.definitions:
+            if isinstance(definition, TaskMatrix):
+                yield from map(definition.task_at, range(len(definition)))
+            else:
+                yield definition
+
+
+class TaskIds:
+    def __init__(self, tasks):
+        """
+        Initializes a TaskIds object, the IDs of the tasks of a graph by name, cells of task matrices included.
+
+        Args:
+            tasks (TaskList): The tasks of the graph.
+        """
+        self.plain = {}
+        self.matrices = {}  # Template name -> (ID of the first cell, TaskMatrix)
+        for definition, start in zip(tasks.definitions, tasks.starts):
+            if isinstance(definition, TaskMatrix):
+                self.matrices[definition.task.name] = start, definition
+            else:
+                self.plain[definition.name] = start
+
+    def get(self, name, default=None):
+        if (task_id := self.plain.get(name)) is not None:
+            return task_id
+        template, bracket, _ = name.partition("[")
+        if bracket and template in self.matrices:
+            start, matrix = self.matrices[template]
+            if (index := matrix.index(name)) is not None:
+                return start + index
+        return default
+
+    def __getitem__(self, name):
+        if (task_id := self.get(name)) is None:
+            raise KeyError(name)
+        return task_id
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+def read_script(filename):
+    """
+    Reads the script from a YAML file.
+
+    Args:
+        filename (str): The name of the YAML file containing the script.
+
+    Returns:
+        dict: The script dictionary parsed from the YAML file.
+
+    Raises:
+        FileNotFoundError: If the YAML file is not found.
+        YAMLError: If there's an error parsing the YAML content.
+
+    This function reads a script from a YAML file and returns the parsed script dictionary.
+    If the YAML file is not found, it raises a FileNotFoundError. If there's an error parsing
+    the YAML content, it raises a YAMLError. The safe loader of libyaml is used when available.
+    """
+    try:
+        with open(filename, 'r') as file:
+            return yaml.load(file, Loader=YAML_LOADER)
+    except FileNotFoundError:
+        print(f"Error: Script file '{filename}' not found.")
+        #exit(1)
+        raise FileNotFoundError(f"Error: Script file '{filename}' not found.")
+
+    except yaml.YAMLError as e:
+        print(f"Error: Error parsing YAML file '{filename}': {e}")
+        #exit(1)
+        raise YAMLError(f"Error: Error parsing YAML file '{filename}': {e}")
+
+
+def validate_script(script, script_file=""):
+    """
+    Validates the structure of the script dictionary.
+
+    Args:
+        script (dict): The script dictionary parsed from YAML.
+        script_file (str, optional): The filename the script was read from, used in messages. Defaults to "".
+
+    Raises:
+        ValueError: If a task definition is missing a required key (command).
+        ValueError: If an optional key has an invalid data type.
+    """
+
+    # Validate each task definition
+    for task_name, task_def in script.items():
+        task_def = {key: value for key, value in task_def.items() if value is not None}  # A null key is absent
+
+        # Check for required key
+        if not task_def.get("command"):
+            raise ValueError(f"Task '{task_name}' is missing required key 'command'.")
+
+        # Check optional keys if present
+        if not isinstance(task_def.get("enabled", True), bool):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'enabled' (expected bool).")
+
+        if not isinstance(task_def.get("arguments", {}), dict):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'arguments' (expected dict).")
+
+        if not isinstance(task_def.get("dependencies", []), list):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'dependencies' (expected list).")
+
+        for key in ("inputs", "outputs", "cache_env"):
+            value = task_def.get(key, [])
+            if not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+                raise ValueError(f"Task '{task_name}' has invalid data type for '{key}' (expected list of strings).")
+
+        if not isinstance(task_def.get("cache", False), bool):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'cache' (expected bool).")
+
+        if not isinstance(task_def.get("shell", False), bool):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'shell' (expected bool).")
+
+        resources = task_def.get("resources", {})
+        if not isinstance(resources, dict):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'resources' (expected dict).")
+        for name, amount in resources.items():
+            try:
+                parse_amount(name, amount)
+            except ValueError:
+                raise ValueError(f"Task '{task_name}' has invalid amount for resource '{name}' "
+                                 f"(expected a non-negative number{', or a size like 512M' if name == 'memory' else ''}).")
+
+        timeout = task_def.get("timeout")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError(f"Task '{task_name}' has invalid value for 'timeout' (expected a positive number of seconds).")
+
+        if not isinstance(task_def.get("hedge", False), bool):
+            raise ValueError(f"Task '{task_name}' has invalid data type for 'hedge' (expected bool).")
+
+        if task_def.get("runner", "shell") not in RUNNERS:
+            raise ValueError(f"Task '{task_name}' has invalid value for 'runner' (expected one of {', '.join(RUNNERS)}).")
+
+        batch = task_def.get("batch")
+        if batch is not None and batch is not False:
+            if not (batch is True or isinstance(batch, dict) and set(batch) <= {"size", "length"} and all(
+                    isinstance(limit, int) and not isinstance(limit, bool) and limit > 0 for limit in batch.values())):
+                raise ValueError(f"Task '{task_name}' has invalid value for 'batch' "
+                                 f"(expected true, or a dict of positive 'size' and 'length' limits).")
+            match = BATCH_FIELD.search(task_def["command"])
+            head = re.sub(r"\S*$", "", task_def["command"][:match.start()]) if match else ""
+            if not head.strip():
+                raise ValueError(f"Task '{task_name}' cannot be batched: its command template needs a placeholder "
+                                 f"after the first word.")
+            # Every task appends its tail to the shared head, so the tail may only hold its argument words
+            tail = task_def["command"][len(head):].split()
+            literals = [re.sub(r"\{[^{}]*\}", "", word) for word in tail]
+            if any(literal == word or not SHELL_SYNTAX.isdisjoint(literal) for word, literal in zip(tail, literals)):
+                raise ValueError(f"Task '{task_name}' cannot be batched: its command template must end with "
+                                 f"argument words holding placeholders, without shell syntax.")
+            for key in ("cache", "hedge"):
+                if task_def.get(key):
+                    raise ValueError(f"Task '{task_name}' cannot be batched with '{key}' set.")
+            if task_def.get("runner", "shell") != "shell":
+                raise ValueError(f"Task '{task_name}' cannot be batched with 'runner: {task_def['runner']}'.")
+
+        matrix = task_def.get("matrix")
+        if matrix is not None:
+            if not (isinstance(matrix, dict) and matrix and all(
+                    isinstance(values, list) and values and all(isinstance(value, (str, int, float)) for value in values)
+                    for values in matrix.values())):
+                raise ValueError(f"Task '{task_name}' has invalid data type for 'matrix' (expected dict of non-empty lists).")
+            for name, values in matrix.items():
+                names = [str(value) for value in values]
+                if len(set(names)) < len(names) or any(character in value for value in names for character in ",[]"):
+                    raise ValueError(f"Task '{task_name}' has invalid values for matrix parameter '{name}' "
+                                     f"(expected distinct values without ',', '[' or ']').")
+            cell = {str(name): values[0] for name, values in matrix.items()}
+            for key, kind in (("dependencies", "dependency"), ("inputs", "input"), ("outputs", "output")):
+                for template in task_def.get(key, []):
+                    try:
+                        template.format(**cell)
+                    except (KeyError, IndexError, ValueError):
+                        raise ValueError(f"Task '{task_name}' has invalid {kind} template '{template}' "
+                                         f"(expected only matrix parameters in braces).")
+
+        # Add further validation for arguments and dependencies structure if needed here.
+
+    print(f"Script '{script_file}' structure is valid.")
+
+
+def get_all_tasks(build_script):
+    """
+    Extracts all tasks from the provided script dictionary and returns a dictionary where
+    task names are keys and Task objects are values.
+
+    Args:
+        build_script (dict): The script dictionary parsed from a YAML file.
+
+    Returns:
+        dict: A dictionary containing task names as keys and Task objects as values, or TaskMatrix
+            objects for the tasks with a 'matrix'.
+    """
+    tasks = {}
+    for task_name, task_def in build_script.items():
+        task_def = {key: value for key, value in task_def.items() if value is not None}  # A null key is absent
+        if "matrix" in task_def:
+            matrix = task_def.pop("matrix")
+            tasks[task_name] = TaskMatrix(Task(task_name, **task_def), matrix)
+        else:
+            tasks[task_name] = Task(task_name, **task_def)
+    return tasks
+
+
+class TaskGraph:
+    def __init__(self, tasks):
+        """
+        Initializes a TaskGraph object, compiling the tasks into an indexed dependency graph.
+
+        Every task gets an integer ID, its position in the script. The dependency edges are kept in
+        flat integer arrays (compressed sparse rows): the dependencies of task i are
+        dependency_ids[dependency_offsets[i]:dependency_offsets[i + 1]], and likewise for its
+        dependents, so scheduling never has to look task names up again.
+
+        Task matrices are kept whole (see TaskMatrix): their cells get consecutive IDs, and their Task
+        objects are only built when looked up in 'tasks'. Depending on the name of a matrix means
+        depending on every cell of it.
+
+        Args:
+            tasks (dict): A dictionary containing task names as keys and Task or TaskMatrix objects as values,
+                in the order they were defined in the script.
+
+        Raises:
+            ValueError: If a task depends on a task that does not exist.
+            ValueError: If the dependencies form a cycle.
+        """
+        if any(isinstance(task, TaskMatrix) for task in tasks.values()):
+            self.tasks = TaskList(list(tasks.values()))
+            self.ids = TaskIds(self.tasks)
+        else:
+            self.tasks = list(tasks.values())
+            self.ids = {name: task_id for task_id, name in enumerate(tasks)}
+        self.dependency_offsets = array("l", [0])
+        self.dependency_ids = array("l")
+        outdegree = array("l", bytes(array("l").itemsize * len(self.tasks)))
+
+        for name, dependencies in self._dependency_names(tasks.values()):
+            resolved = {}
+            for dependency in dependencies:
+                dependency_ids = self.resolve(dependency)
+                if dependency_ids is None:
+                    raise ValueError(f"Task '{name}' has an invalid dependency: '{dependency}'")
+                resolved.update(dict.fromkeys(dependency_ids))  # Drop duplicates, keep the order
+            for dependency_id in resolved:
+                self.dependency_ids.append(dependency_id)
+                outdegree[dependency_id] += 1
+            self.dependency_offsets.append(len(self.dependency_ids))
+
+        # Fill the dependents in the same layout, from the running sum of the out-degrees
+        self.dependent_offsets = array("l", [0])
+        for count in outdegree:
+            self.dependent_offsets.append(self.dependent_offsets[-1] + count)
+        self.dependent_ids = array("l", bytes(self.dependency_ids.itemsize * len(self.dependency_ids)))
+        position = array("l", self.dependent_offsets[:-1])
+        for task_id in range(len(self.tasks)):
+            for dependency_id in self.dependencies_of(task_id):
+                self.dependent_ids[position[dependency_id]] = task_id
+                position[dependency_id] += 1
+
+        self.indegree = array("l", (self.dependency_offsets[task_id + 1] - self.dependency_offsets[task_id]
+                                    for task_id in range(len(self.tasks))))
+        self.order = self._topological_order()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    @staticmethod
+    def _dependency_names(definitions):
+        # The names of the tasks and of their dependencies, without building the Task of every matrix cell
+        for definition in definitions:
+            if isinstance(definition, TaskMatrix) and not definition.task.dependencies:
+                yield from itertools.repeat((definition.task.name, ()), len(definition))
+            elif isinstance(definition, TaskMatrix):
+                for index in range(len(definition)):
+                    cell = definition.cell(index)
+                    yield definition.name(cell), definition.dependencies(cell)
+            else:
+                yield definition.name, definition.dependencies
+
+    def definitions(self):
+        """
+        Returns the Task objects of the graph, with the template of every task matrix instead of its cells.
+        """
+        if isinstance(self.tasks, TaskList):
+            return [definition.task if isinstance(definition, TaskMatrix) else definition
+                    for definition in self.tasks.definitions]
+        return self.tasks
+
+    def resolve(self, name):
+        """
+        Returns the IDs of the tasks a dependency name stands for: one task, or every cell of a task matrix.
+
+        Returns:
+            sequence: The IDs, or None if no task has this name.
+        """
+        if (task_id := self.ids.get(name)) is not None:
+            return (task_id,)
+        if isinstance(self.ids, TaskIds) and name in self.ids.matrices:
+            start, matrix = self.ids.matrices[name]
+            return range(start, start + len(matrix))
+        return None
+
+    def subgraph(self, names):
+        """
+        Returns the graph of the given tasks and of the tasks they depend on, directly or not.
+
+        Args:
+            names (list): The names of the tasks, which may be cells or whole task matrices.
+
+        Returns:
+            TaskGraph: This graph if it has no other task, otherwise a new graph of plain tasks.
+
+        Raises:
+            ValueError: If a task does not exist.
+        """
+        needed = set()
+        pending = []
+        for name in names:
+            if (task_ids := self.resolve(name)) is None:
+                raise ValueError(f"Task '{name}' does not exist.")
+            pending.extend(task_ids)
+        while pending:
+            task_id = pending.pop()
+            if task_id not in needed:
+                needed.add(task_id)
+                pending.extend(self.dependencies_of(task_id))
+        if len(needed) == len(self):
+            return self
+
+        tasks = {}
+        for task_id in sorted(needed):
+            task = self.tasks[task_id]
+            task.dependencies = [self.tasks[dependency].name for dependency in self.dependencies_of(task_id)]
+            tasks[task.name] = task
+        return TaskGraph(tasks)
+
+    def dependencies_of(self, task_id):
+        """
+        Returns the IDs of the tasks that a task depends on.
+        """
+        return self.dependency_ids[self.dependency_offsets[task_id]:self.dependency_offsets[task_id + 1]]
+
+    def dependents_of(self, task_id):
+        """
+        Returns the IDs of the tasks that depend on a task.
+        """
+        return self.dependent_ids[self.dependent_offsets[task_id]:self.dependent_offsets[task_id + 1]]
+
+    def downstream_of(self, task_ids):
+        """
+        Returns the IDs of the given tasks and of every task depending on them, directly or not.
+        """
+        reached = set(task_ids)
+        pending = list(reached)
+        while pending:
+            for dependent in self.dependents_of(pending.pop()):
+                if dependent not in reached:
+                    reached.add(dependent)
+                    pending.append(dependent)
+        return reached
+
+    def remaining_paths(self, durations):
+        """
+        Computes, for every task, the longest chain of work from its start to the end of the script.
+
+        Args:
+            durations (sequence): The expected duration of every task, indexed by task ID.
+
+        Returns:
+            array: The duration of the task plus the longest remaining path through its dependents, per task ID.
+        """
+        remaining = array("d", bytes(8 * len(self.tasks)))
+        for task_id in reversed(self.order):
+            remaining[task_id] = durations[task_id] + max(
+                (remaining[dependent] for dependent in self.dependents_of(task_id)), default=0.0)
+        return remaining
+
+    def critical_path(self, durations):
+        """
+        Returns the chain of tasks that bounds the duration of the script, however many tasks run in parallel.
+
+        Args:
+            durations (sequence): The expected duration of every task, indexed by task ID.
+
+        Returns:
+            list: The IDs of the tasks on the critical path, in execution order.
+        """
+        remaining = self.remaining_paths(durations)
+        path = []
+        candidates = [task_id for task_id, count in enumerate(self.indegree) if count == 0]
+        while candidates:
+            path.append(max(candidates, key=remaining.__getitem__))
+            candidates = self.dependents_of(path[-1])
+        return path
+
+    def _topological_order(self):
+        """
+        Sorts the task IDs so that every task comes after its dependencies (Kahn's algorithm).
+
+        Returns:
+            array: The task IDs in topological order, ties broken by script order.
+
+        Raises:
+            ValueError: If the dependencies form a cycle.
+        """
+        indegree = array("l", self.indegree)
+        order = array("l", (task_id for task_id, count in enumerate(indegree) if count == 0))
+        position = 0
+        while position < len(order):
+            for dependent in self.dependents_of(order[position]):
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    order.append(dependent)
+            position += 1
+
+        if len(order) < len(self.tasks):
+            # Every task left over still waits on a left over dependency, so following them must loop
+            task_id = next(task_id for task_id, count in enumerate(indegree) if count)
+            path = []
+            seen = {}
+            while task_id not in seen:
+                seen[task_id] = len(path)
+                path.append(task_id)
+                task_id = next(dependency for dependency in self.dependencies_of(task_id) if indegree[dependency])
+            cycle = path[seen[task_id]:] + [task_id]
+            names = " -> ".join(f"'{self.tasks[task_id].name}'" for task_id in reversed(cycle))
+            raise ValueError(f"Tasks {names} form a dependency cycle.")
+        return order
+
+
+class Scheduler:
+    def __init__(self, graph, priorities=None, on_ready=None, resources=None, durations=None, group=None,
+                 clock=time.monotonic):
+        """
+        Initializes a Scheduler object that hands out tasks as soon as their dependencies have finished.
+
+        Among the ready tasks, the one with the highest priority is handed out first, ties broken by
+        script order. Passing the remaining path lengths of TaskGraph.remaining_paths as priorities
+        starts the tasks of the critical path as early as possible.
+
+        Given a ResourcePool, a task is only handed out once its resources are left. A ready task that
+        does not fit is parked on the resource it lacks, and only looked at again when some of that
+        resource is released, so every call costs the same however many tasks are waiting. The most
+        urgent parked task holds a reservation: less urgent tasks only start in the meantime if they are
+        expected to finish before it can start, or leave enough for it at that point, so a stream of
+        small tasks never starves a large one.
+
+        Args:
+            graph (TaskGraph): The compiled graph of the tasks to schedule.
+            priorities (sequence, optional): The priority of every task, indexed by task ID. Defaults to None,
+                in which case ready tasks are handed out in script order.
+            on_ready (callable, optional): Called with the ID of every task that becomes ready. Defaults to None.
+            resources (ResourcePool, optional): The resources the tasks are packed against. Defaults to None,
+                every task fits.
+            durations (sequence, optional): The expected duration of every task, indexed by task ID, which
+                lets small tasks run ahead of the reservation. Defaults to None, durations are unknown.
+            group (callable, optional): Returns the group of the task with the given ID, or None, for
+                take_ready. Defaults to None, tasks are not grouped.
+            clock (callable, optional): The clock the durations are measured against. Defaults to time.monotonic.
+        """
+        self.graph = graph
+        self.priorities = priorities or bytes(len(graph))
+        self.on_ready = on_ready
+        self.resources = resources
+        self.durations = durations
+        self.group = group
+        self.clock = clock
+        self.pending = array("l", graph.indegree)
+        self.succeeded = bytearray(len(graph))
+        self.handed_out = bytearray(len(graph))  # Entries of handed out tasks are dropped lazily from the heaps
+        self.unfinished = len(graph)
+        self.waiting = {}     # Resource -> heap of the ready tasks parked until some of it is released
+        self.deferred = []    # Heap of the ready tasks that fit but would delay the reserved task
+        self.reserved = None  # Entry of the most urgent parked task
+        self.ends = {}        # Task holding resources -> expected end
+        self.groups = {}      # Group -> heap of its ready tasks
+        self.ready = [(-self.priorities[task_id], task_id) for task_id, count in enumerate(self.pending) if count == 0]
+        heapq.heapify(self.ready)
+        for entry in sorted(self.ready):
+            self._grouped(entry)
+            if on_ready:
+                on_ready(entry[1])
+
+    def next_ready(self):
+        """
+        Hands out the next task that can be executed, taking its resources if the scheduler has a ResourcePool.
+
+        Returns:
+            int: The ID of the ready task with the highest priority that fits, or None if there is none at the moment.
+        """
+        if self.resources is None:
+            while self.ready:
+                task_id = heapq.heappop(self.ready)[1]
+                if not self.handed_out[task_id]:
+                    self.handed_out[task_id] = 1
+                    return task_id
+            return None
+        if not self.ready and not self.ends:
+            self._wake_all()  # Nothing holds resources any more, so whatever is parked fits now
+        now = self.clock()
+        reservation = None  # Start time and spare resources of the reserved task, once needed
+        free = self.resources.free
+        while self.ready:
+            entry = heapq.heappop(self.ready)
+            task_id = entry[1]
+            if self.handed_out[task_id]:
+                continue
+            demand = self.resources.demand(task_id)
+            lacking = next((name for name, amount in demand.items() if free[name] < amount), None)
+            if lacking is not None:
+                heapq.heappush(self.waiting.setdefault(lacking, []), entry)
+                if self.reserved is None or entry < self.reserved:
+                    self.reserved = entry
+                    reservation = None
+                continue
+            if self.reserved is not None and entry > self.reserved:
+                if reservation is None:
+                    reservation = self._reservation(now)
+                start, spare = reservation
+                if self.durations is None or now + self.durations[task_id] > start:
+                    if any(spare[name] < amount for name, amount in demand.items()):
+                        heapq.heappush(self.deferred, entry)
+                        continue
+                    for name, amount in demand.items():
+                        spare[name] -= amount
+            self._hand_out(entry, now)
+            return task_id
+        return None
+
+    def take_ready(self, task_id, matches, limit):
+        """
+        Hands out more ready tasks of the group of one that was just handed out, to run with it, e.g. in a batch.
+
+        The tasks taken share the resources of the task they join.
+
+        Args:
+            task_id (int): The ID of the task just handed out.
+            matches (callable): Tells whether the task with the given ID can join, asked about the ready
+                tasks of the group in priority order until it refuses one.
+            limit (int): The maximum number of tasks handed out.
+
+        Returns:
+            list: The IDs of the tasks handed out, in priority order.
+        """
+        heap = self.groups.get(self.group(task_id)) if self.group else None
+        taken = []
+        while heap and len(taken) < limit:
+            entry = heap[0]
+            if self.handed_out[entry[1]]:
+                heapq.heappop(heap)
+            elif matches(entry[1]):
+                heapq.heappop(heap)
+                self._hand_out(entry)
+                taken.append(entry[1])
+            else:
+                break
+        return taken
+
+    def release(self, task_id):
+        """
+        Gives back the resources of a task handed out by next_ready, and wakes the tasks parked on them.
+
+        The parked tasks are woken in priority order, as long as what was released may be enough for them.
+        """
+        if self.resources is None:
+            return
+        self.resources.release(task_id)
+        self.ends.pop(task_id, None)
+        for name in self.resources.demand(task_id):
+            waiting = self.waiting.get(name)
+            left = self.resources.free[name]
+            while waiting:
+                parked_id = waiting[0][1]
+                if not self.handed_out[parked_id]:
+                    left -= self.resources.demand(parked_id)[name]
+                    if left < 0:
+                        break
+                    heapq.heappush(self.ready, waiting[0])
+                heapq.heappop(waiting)
+
+    def next_priority(self):
+        """
+        Returns the priority of the most urgent task waiting to be handed out, or None if there is none.
+        """
+        heaps = [heap for heap in (self.ready, self.deferred, *self.waiting.values()) if heap]
+        return -min(heap[0] for heap in heaps)[0] if heaps else None
+
+    def task_finished(self, task_id, succeeded):
+        """
+        Records the outcome of a task and releases the tasks that were waiting on it.
+
+        A released task with a dependency that did not complete successfully is reported and
+        dropped, which in turn releases its own dependents.
+
+        Args:
+            task_id (int): The ID of the finished task.
+            succeeded (bool): Whether the task completed successfully.
+        """
+        finished = [(task_id, succeeded)]
+        while finished:
+            task_id, succeeded = finished.pop()
+            self.succeeded[task_id] = succeeded
+            self.unfinished -= 1
+            for dependent in self.graph.dependents_of(task_id):
+                self.pending[dependent] -= 1
+                if self.pending[dependent] == 0:
+                    if self._check_dependencies(dependent):
+                        entry = (-self.priorities[dependent], dependent)
+                        heapq.heappush(self.ready, entry)
+                        self._grouped(entry)
+                        if self.on_ready:
+                            self.on_ready(dependent)
+                    else:
+                        finished.append((dependent, False))
+
+    def _hand_out(self, entry, now=None):
+        task_id = entry[1]
+        self.handed_out[task_id] = 1
+        if now is not None:
+            self.resources.acquire(task_id)
+            self.ends[task_id] = now + self.durations[task_id] if self.durations is not None else math.inf
+        if entry == self.reserved:
+            self.reserved = None
+            for deferred in self.deferred:
+                heapq.heappush(self.ready, deferred)
+            self.deferred.clear()
+
+    def _grouped(self, entry):
+        if self.group and (group := self.group(entry[1])) is not None:
+            heapq.heappush(self.groups.setdefault(group, []), entry)
+
+    def _reservation(self, now):
+        # The reserved task starts once enough of the running tasks end, at their expected end
+        demand = self.resources.demand(self.reserved[1])
+        free = dict(self.resources.free)
+        start = now
+        for end, task_id in sorted((end, task_id) for task_id, end in self.ends.items()):
+            if all(free[name] >= amount for name, amount in demand.items()):
+                break
+            start = max(end, now)
+            for name, amount in self.resources.demand(task_id).items():
+                free[name] += amount
+        return start, {name: amount - demand.get(name, 0.0) for name, amount in free.items()}
+
+    def _wake_all(self):
+        for heap in (self.deferred, *self.waiting.values()):
+            for entry in heap:
+                heapq.heappush(self.ready, entry)
+            heap.clear()
+        self.reserved = None
+
+    def _check_dependencies(self, task_id):
+        """
+        Checks that all dependencies of a task completed successfully, reporting the ones that did not.
+        """
+        can_run = True
+        for dependency in self.graph.dependencies_of(task_id):
+            if not self.succeeded[dependency]:
+                print(f"Task '{self.graph.tasks[task_id].name}' depends on incomplete task "
+                      f"'{self.graph.tasks[dependency].name}'")
+                can_run = False
+        return can_run
+
+
+class ResourcePool:
+    def __init__(self, graph, capacity):
+        """
+        Initializes a ResourcePool object, the resources left for the tasks of a graph to start.
+
+        A task starts only when everything it declared in 'resources' is left, so tasks are packed
+        against every resource at once instead of a single number of slots. A task asking for more
+        than the whole capacity of a resource gets all of it, so it can still run on its own.
+        Resources without a capacity, e.g. pools that were not configured, are unlimited.
+
+        Args:
+            graph (TaskGraph): The compiled graph of the tasks.
+            capacity (dict): The amount of every limited resource, e.g. {"cpus": 8, "memory": 16384, "license": 2}.
+        """
+        self.graph = graph
+        self.capacity = capacity
+        self.free = dict(capacity)
+
+    def demand(self, task_id):
+        """
+        Returns the resources a task holds while it runs, limited to the capacity.
+        """
+        return {name: min(amount, self.capacity[name])
+                for name, amount in self.graph.tasks[task_id].resources.items() if name in self.capacity}
+
+    def acquire(self, task_id):
+        """
+        Takes the resources of a starting task.
+        """
+        for name, amount in self.demand(task_id).items():
+            self.free[name] -= amount
+
+    def release(self, task_id):
+        """
+        Gives back the resources of a finished task.
+        """
+        for name, amount in self.demand(task_id).items():
+            self.free[name] += amount
+
+
+def machine_capacity(jobs, overrides=None):
+    """
+    Returns the capacity tasks are packed against.
+
+    Args:
+        jobs (int): The number of tasks running in parallel, the default number of CPUs.
+        overrides (dict, optional): Capacities configured by the user, e.g. {"memory": "8G", "license": 2},
+            replacing or adding to the defaults. Defaults to None.
+
+    Returns:
+        dict: The amount of 'cpus', 'memory' in megabytes (the physical memory of the machine) and named pools.
+
+    Raises:
+        ValueError: If an amount is invalid.
+    """
+    capacity = {"cpus": float(jobs)}
+    try:
+        capacity["memory"] = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        pass
+    for name, amount in (overrides or {}).items():
+        capacity[name] = parse_amount(name, amount)
+    return capacity
+
+
+def compile_script(build_script, test_dir=""):
+    """
+    Compiles the script dictionary into a task graph.
+
+    Args:
+        build_script (dict): The script dictionary parsed from a YAML file.
+        test_dir (str, optional): The directory the commands run in. Tasks of included scripts
+            run in their own directory, relative to it. Defaults to "".
+
+    Returns:
+        TaskGraph: The indexed dependency graph of the tasks.
+
+    Raises:
+        ValueError: If a task depends on a task that does not exist, or the dependencies form a cycle.
+    """
+    tasks = get_all_tasks(build_script)
+    for task in tasks.values():
+        task = task.task if isinstance(task, TaskMatrix) else task
+        task.test_dir = os.path.join(test_dir, task.test_dir) if task.test_dir else test_dir
+    return TaskGraph(tasks)
+
+
+def plan_path(script_file):
+    """
+    Returns the path of the compiled plan stored next to a script, e.g. '.hello.yaml.plan'.
+    """
+    directory, filename = os.path.split(script_file)
+    return os.path.join(directory, f".{filename}.plan")
+
+
+class ScriptLoader:
+    def __init__(self, script_file):
+        """
+        Initializes a ScriptLoader object, reading a script and the scripts it includes on demand.
+
+        A script may include other YAML files or directories under a namespace with the top-level
+        'include' key. The tasks of an included file are named '<namespace>:<task>', which is also
+        how any other file refers to them in its dependencies, while dependencies without a
+        namespace refer to tasks of the same file. A directory includes every YAML file in it,
+        under '<namespace>/<file name without extension>'. Includes of included files are nested
+        the same way, e.g. 'net/tls:build'. Tasks run in the directory of the file defining them.
+
+        Args:
+            script_file (str): The filename of the root YAML script.
+        """
+        self.root_dir = os.path.dirname(script_file)
+        self.namespaces = {"": script_file}
+        self.scripts = {}
+        self.directories = {}
+
+    def load(self, namespaces):
+        """
+        Reads the files of the given namespaces that were not read yet, in parallel.
+
+        Args:
+            namespaces (set): The namespaces whose tasks are needed.
+
+        Raises:
+            ValueError: If a namespace was never included.
+        """
+        missing = [namespace for namespace in namespaces if namespace not in self.scripts]
+        if not missing:
+            return
+        for namespace in missing:
+            if namespace not in self.namespaces:
+                raise ValueError(f"Namespace '{namespace}' is not included by any script.")
+        with ThreadPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1)) as pool:
+            for namespace, tasks in zip(missing, pool.map(self._read, missing)):
+                self.scripts[namespace] = tasks
+
+    def _read(self, namespace):
+        """
+        Reads one file, registers the namespaces it includes and qualifies its task names.
+
+        Returns:
+            dict: The task definitions of the file, keyed by their full names.
+        """
+        script_file = self.namespaces[namespace]
+        script = read_script(script_file) or {}
+        includes = script.pop("include", None) or {}
+        if not isinstance(includes, dict) or not all(isinstance(path, str) for path in includes.values()):
+            raise ValueError(f"Script '{script_file}' has invalid data type for 'include' (expected dict of paths).")
+
+        directory = os.path.dirname(script_file)
+        for child, path in includes.items():
+            child = f"{namespace}/{child}" if namespace else str(child)
+            path = os.path.join(directory, path)
+            if os.path.isdir(path):
+                listing = sorted(name for name in os.listdir(path) if name.endswith((".yaml", ".yml")))
+                self.directories[path] = listing
+                for name in listing:
+                    self.namespaces[f"{child}/{os.path.splitext(name)[0]}"] = os.path.join(path, name)
+            else:
+                self.namespaces[child] = path
+
+        if not namespace:
+            return script
+        test_dir = os.path.relpath(directory or ".", self.root_dir or ".")
+        tasks = {}
+        for name, task_def in script.items():
+            if isinstance(task_def, dict):
+                task_def = dict(task_def, test_dir=test_dir)
+                if isinstance(task_def.get("dependencies"), list):
+                    task_def["dependencies"] = [dependency if ":" in dependency else f"{namespace}:{dependency}"
+                                                for dependency in task_def["dependencies"]]
+            tasks[f"{namespace}:{name}"] = task_def
+        return tasks
+
+    def read(self, targets=None):
+        """
+        Reads the tasks needed to run the given targets, or every task of every included file.
+
+        Args:
+            targets (list, optional): The names of the tasks to run. Defaults to None, meaning all tasks.
+
+        Returns:
+            dict: The script dictionary holding the needed tasks.
+
+        Raises:
+            ValueError: If a target does not exist.
+        """
+        self.load({""})
+        if targets is None:
+            while (pending := set(self.namespaces) - set(self.scripts)):
+                self.load(pending)
+            return {name: task_def for tasks in self.scripts.values() for name, task_def in tasks.items()}
+
+        needed = {}
+        wave = list(dict.fromkeys(targets))
+        while wave:
+            self.load({name.rpartition(":")[0] for name in wave})
+            next_wave = []
+            for name in wave:
+                tasks = self.scripts[name.rpartition(":")[0]]
+                if name not in tasks and name.endswith("]"):
+                    name = name.partition("[")[0]  # A cell of a matrix, or a dependency template
+                task_def = tasks.get(name)
+                if task_def is None:
+                    raise ValueError(f"Task '{name}' does not exist.")
+                needed[name] = task_def
+                if isinstance(task_def, dict) and isinstance(task_def.get("dependencies"), list):
+                    next_wave.extend(dependency for dependency in task_def["dependencies"]
+                                     if dependency not in needed and dependency not in next_wave)
+            wave = next_wave
+        return needed
+
+    @property
+    def files(self):
+        """
+        The paths of all the files read so far.
+        """
+        return [self.namespaces[namespace] for namespace in self.scripts]
+
+
+def file_key(path):
+    """
+    Returns the size, modification time and content hash identifying the current version of a file.
+    """
+    with open(path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        return stat.st_size, stat.st_mtime_ns, hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def plan_is_current(key, targets):
+    """
+    Tells whether a compiled plan was made for the same targets from the files as they are now.
+    """
+    return (key["version"] == PLAN_VERSION and key["targets"] == targets
+            and all(file_key(path) == version for path, version in key["files"].items())
+            and all(sorted(name for name in os.listdir(path) if name.endswith((".yaml", ".yml"))) == listing
+                    for path, listing in key["directories"].items()))
+
+
+def load_script(script_file, test_dir="", plan_cache=True, targets=None, plans=None):
+    """
+    Reads, validates and compiles a script, reusing its compiled plan when the script has not changed.
+
+    Only the files holding the targets and their dependencies are read (see ScriptLoader). The
+    compiled TaskGraph is pickled next to the script together with the size, modification time and
+    content hash of every file read and the listing of every included directory. As long as they all
+    still match, later runs for the same targets load the graph directly and skip both YAML parsing
+    and validate_script. Failing to write the plan (e.g. in a read-only directory) only costs the speed-up.
+
+    Args:
+        script_file (str): The filename of the YAML file containing the script.
+        test_dir (str, optional): The directory the commands of the script run in. Defaults to "".
+        plan_cache (bool, optional): Whether to use and store the compiled plan. Defaults to True.
+        targets (list, optional): The names of the tasks to run, with their dependencies. Defaults to None, meaning all tasks.
+        plans (dict, optional): Graphs kept in memory by a long-running process, reused as long as their
+            plan is current. Defaults to None.
+
+    Returns:
+        TaskGraph: The indexed dependency graph of the tasks.
+
+    Raises:
+        FileNotFoundError: If the YAML file is not found.
+        YAMLError: If there's an error parsing the YAML content.
+        ValueError: If the script is invalid, has unknown dependencies or dependency cycles.
+    """
+    def place(graph):
+        # Task directories are stored relative to the script, so the plan stays valid from anywhere
+        for task in graph.definitions():
+            task.test_dir = os.path.join(test_dir, task.test_dir) if task.test_dir else test_dir
+        return graph
+
+    targets = sorted(targets) if targets else None
+    memory_key = (os.path.abspath(script_file), test_dir, tuple(targets or ()))
+    if plans is not None and memory_key in plans:
+        key, graph = plans[memory_key]
+        try:
+            if plan_is_current(key, targets):
+                print(f"Script '{script_file}' reused from memory.")
+                return graph
+        except OSError:
+            pass
+        del plans[memory_key]
+
+    if plan_cache:
+        try:
+            with open(plan_path(script_file), "rb") as plan_file:
+                key = pickle.load(plan_file)
+                if plan_is_current(key, targets):
+                    graph = place(pickle.load(plan_file))
+                    print(f"Script '{script_file}' loaded from its compiled plan.")
+                    if plans is not None:
+                        plans[memory_key] = key, graph
+                    return graph
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, KeyError):
+            pass  # No usable plan, compile the script
+
+    loader = ScriptLoader(script_file)
+    build_script = loader.read(targets)
+    validate_script(build_script, script_file)
+    graph = compile_script(build_script)
+    if targets:
+        graph = graph.subgraph(targets)  # Targets may be single cells of a matrix
+
+    if plan_cache or plans is not None:
+        key = {"version": PLAN_VERSION, "targets": targets, "directories": loader.directories,
+               "files": {path: file_key(path) for path in loader.files}}
+    if plan_cache:
+        try:
+            with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(script_file) or ".", delete=False) as plan_file:
+                pickle.dump(key, plan_file, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(graph, plan_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(plan_file.name, plan_path(script_file))
+        except OSError:
+            pass
+    graph = place(graph)
+    if plans is not None:
+        plans[memory_key] = key, graph
+    return graph
+
+
+def estimate_makespan(graph, durations, jobs, capacity=None):
+    """
+    Simulates a run of the graph to estimate how long it takes with critical-path-first scheduling.
+
+    Args:
+        graph (TaskGraph): The compiled graph of the tasks.
+        durations (sequence): The expected duration of every task, indexed by task ID.
+        jobs (int): The maximum number of tasks running at the same time.
+        capacity (dict, optional): The resources the tasks are packed against, see machine_capacity.
+            Defaults to None, one CPU per job.
+
+    Returns:
+        float: The estimated wall time of the run in seconds.
+    """
+    clock = 0.0
+    scheduler = Scheduler(graph, graph.remaining_paths(durations), resources=ResourcePool(graph, capacity or machine_capacity(jobs)),
+                          durations=durations, clock=lambda: clock)
+    running = []  # Heap of (end time, task ID)
+    while True:
+        while len(running) < jobs and (task_id := scheduler.next_ready()) is not None:
+            heapq.heappush(running, (clock + durations[task_id], task_id))
+        if not running:
+            return clock
+        clock, task_id = heapq.heappop(running)
+        scheduler.release(task_id)
+        scheduler.task_finished(task_id, True)
+
+
+def plan_script(script_file, context):
+    """
+    Prints the critical path and the estimated duration of a script without running anything.
+
+    Args:
+        script_file (str): The filename of the YAML file containing the script.
+        context (dict): The same context as for execute_script_async; 'jobs', 'resources', 'targets',
+            'plan_cache' and 'history_db' are used.
+
+    Returns:
+        float: The estimated wall time of the run in seconds.
+
+    Raises:
+        FileNotFoundError: If the YAML file is not found.
+        YAMLError: If there's an error parsing the YAML content.
+        ValueError: If the number of jobs or the script is invalid, has unknown dependencies or dependency cycles.
+    """
+    check_jobs(context.get("jobs"))
+    graph = load_script(script_file, os.path.join(os.getcwd(), os.path.dirname(script_file)),
+                        context.get("plan_cache", True), context.get("targets"))
+    history = RunHistory(context.get("history_db", HISTORY_DB), script_file).load()
+    durations = history.estimates(graph)
+    jobs = context.get("jobs") or os.cpu_count() or 1
+
+    path = graph.critical_path(durations)
+    print(f"Critical path ({sum(durations[task_id] for task_id in path):.2f}s):")
+    for task_id in path:
+        name = graph.tasks[task_id].name
+        print(f"  {name:<30} {durations[task_id]:8.2f}s{'' if name in history.durations else '  (no history)'}")
+
+    makespan = estimate_makespan(graph, durations, jobs, machine_capacity(jobs, context.get("resources")))
+    print(f"Estimated makespan with {jobs} jobs: {makespan:.2f}s "
+          f"({len(graph)} tasks, {sum(durations):.2f}s of work).")
+    return makespan
+
+
+def export_chrome_trace(trace_file, chrome_file):
+    """
+    Converts a JSONL task trace into the Chrome trace-event format, viewable in chrome://tracing or Perfetto.
+
+    Every task becomes a complete event. Tasks are laid out on as few rows as possible without
+    overlapping, so the number of rows shows the parallelism reached during the run.
+
+    Args:
+        trace_file (str): The JSONL trace written while executing the script.
+        chrome_file (str): The JSON file receiving the trace events.
+
+    Returns:
+        float: The average number of tasks running at the same time over the traced period.
+    """
+    with open(trace_file) as file:
+        records = sorted((json.loads(line) for line in file if line.strip()), key=lambda record: record["start"])
+    if not records:
+        return 0.0
+
+    origin = records[0]["start"]
+    rows = []  # End time of the last task placed on every row
+    events = []
+    for record in records:
+        end = record["start"] + record["wall"]
+        row = next((index for index, row_end in enumerate(rows) if row_end <= record["start"]), len(rows))
+        rows[row:row + 1] = [end]
+        events.append({"name": record["task"], "cat": "task", "ph": "X", "pid": 1, "tid": row,
+                       "ts": (record["start"] - origin) * 1e6, "dur": record["wall"] * 1e6,
+                       "args": {key: value for key, value in record.items() if key not in ("task", "start", "wall")}})
+
+    with open(chrome_file, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    makespan = max(record["start"] + record["wall"] for record in records) - origin
+    return sum(record["wall"] for record in records) / makespan if makespan else float(len(records))
+
+
+def parse_address(address):
+    """
+    Splits a 'host:port' address, e.g. '127.0.0.1:7070'.
+
+    Raises:
+        ValueError: If the address has no valid port.
+    """
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid address '{address}' (expected HOST:PORT).")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host):
+    """
+    Tells whether a host only reaches the local machine, e.g. '127.0.0.1' or 'localhost'.
+    """
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError):
+        return False
+
+
+def encode_message(message):
+    """
+    Encodes a message as a JSON line of a coordinator, worker, daemon or event bus connection.
+    """
+    return json.dumps(message).encode() + b"\n"
+
+
+async def send_message(writer, message):
+    """
+    Writes a message as a JSON line to a connection, waiting while the peer does not keep up.
+
+    Raises:
+        ConnectionError: If the connection broke.
+    """
+    writer.write(encode_message(message))
+    await writer.drain()
+
+
+class WorkerLost(ConnectionError):
+    """Raised for the tasks of a worker whose connection to the coordinator broke."""
+
+
+class RemoteChannel:
+    def __init__(self, writer, run_id):
+        """
+        Initializes a RemoteChannel object, which forwards what a task running on a worker logs and
+        records to the coordinator.
+
+        It stands in for both the LogStore and the RunHistory of the context, so Task.execute_async
+        runs unchanged on a worker. Messages are written at once, and the task waits in drain while
+        the connection does not keep up.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection to the coordinator.
+            run_id (int): The ID the coordinator gave to this run of the task.
         """
-        Initializes a Task object.
+        self.writer = writer
+        self.run_id = run_id
+
+    def write(self, record, task=None, last=False, attempt=None):
+        self.writer.write(encode_message({"type": "log", "id": self.run_id, "record": record, "last": last}))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def record(self, name, seconds, retcode=0, output_size=0, cached=False):
+        self.writer.write(encode_message({"type": "run", "id": self.run_id, "seconds": seconds, "retcode": retcode,
+                                          "output_size": output_size, "cached": cached}))
+
+
+class RemoteWorker:
+    def __init__(self, name, slots, writer):
+        """
+        Initializes a RemoteWorker object, the coordinator's view of a connected worker.
 
         Args:
-            name (str): The name of the task.
-            command (str): The command to be executed.
-            arguments (dict, optional): A dictionary containing arguments for the command. Defaults to {}.
-            dependencies (list, optional): A list of task names that this task depends on. Defaults to [].
-            enabled (bool, optional): A boolean value indicating whether the task is enabled. Defaults to True.
+            name (str): The name the worker registered with.
+            slots (int): The number of tasks the worker runs at the same time.
+            writer (asyncio.StreamWriter): The connection to the worker.
         """
         self.name = name
-        self.command = command
-        self.arguments = arguments
-        self.dependencies = dependencies
-        self.enabled = enabled
-        self.test_dir = test_dir
+        self.slots = slots
+        self.writer = writer
+        self.running = {}  # Run ID -> (task, future of the result)
+        self.lost = False
+
 
-    def check_dependencies(self, completed_tasks, tasks):
+class Coordinator:
+    def __init__(self, address, log_writer, history=None, token=None):
         """
-        Checks if all dependencies of the task are completed and enabled.
+        Initializes a Coordinator object, which runs tasks on the workers connected to it over TCP.
+
+        Workers register with a 'hello' message telling how many tasks they run at once, then receive
+        tasks, stream their log records back and report their results, as JSON lines. When the
+        connection to a worker breaks, the tasks it was running are queued again for the other workers.
 
         Args:
-            completed_tasks (set): A set containing names of completed and enabled tasks.
+            address (str): The 'host:port' address to listen on.
+            log_writer (LogStore): The writer receiving the log records of the remote tasks.
+            history (RunHistory, optional): The history recording the remote runs. Defaults to None.
+            token (str, optional): A secret the workers must present to register. Defaults to None,
+                only allowed on a loopback address.
 
-        Returns:
-            bool: A boolean value indicating whether the task can be executed based on its dependencies.
+        Raises:
+            ValueError: If the address is invalid, or not a loopback address while there is no token.
+        """
+        self.address = parse_address(address)
+        if not token and not is_loopback(self.address[0]):
+            raise ValueError(f"Refusing to accept workers on '{address}' without a token, "
+                             f"since whoever reaches it could run commands.")
+        self.log_writer = log_writer
+        self.history = history
+        self.token = token
+        self.workers = []
+        self.changed = asyncio.Event()
+        self.run_ids = itertools.count()
+        self.server = None
 
-        Note:
-            This method assumes that the 'tasks' dictionary contains all tasks defined in the script,
-            with their names as keys and Task objects as values.
+    async def start(self):
         """
-        can_run = True
-        for dependency in self.dependencies:
-            if dependency not in completed_tasks or not tasks[dependency].enabled:
-                error_msg = f"Task '{self.name}' depends on incomplete task '{dependency}'"
-                print(error_msg)
-                can_run = False
+        Starts listening for workers.
+        """
+        self.server = await asyncio.start_server(self.serve, *self.address, limit=MESSAGE_LIMIT)
+        port = self.server.sockets[0].getsockname()[1]
+        print(f"Coordinator listening on {self.address[0]}:{port}.")
 
-        return can_run
+    async def serve(self, reader, writer):
+        """
+        Registers a worker and handles its messages until its connection ends.
+        """
+        try:
+            hello = json.loads(await asyncio.wait_for(reader.readline(), WORKER_CONNECT_TIMEOUT) or b"{}")
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            hello = {}
+        if not isinstance(hello, dict) or hello.get("type") != "hello" \
+                or not hmac.compare_digest(str(hello.get("token") or ""), self.token or ""):
+            writer.close()
+            return
+        name, slots = str(hello.get("name", "?")), hello.get("slots", 1)
+        if isinstance(slots, bool) or not isinstance(slots, int) or slots < 1:
+            print(f"Worker '{name}' rejected: invalid number of slots {slots!r}.")
+            writer.close()
+            return
 
-    def execute(self, context):
+        worker = RemoteWorker(name, slots, writer)
+        self.workers.append(worker)
+        self.changed.set()
+        print(f"Worker '{worker.name}' joined with {worker.slots} slots.")
+        try:
+            while (line := await reader.readline()):
+                message = json.loads(line)
+                run_id = message.get("id")
+                task, result = worker.running.get(run_id, (None, None))
+                if task is None:
+                    continue  # A task that was cancelled meanwhile
+                if message["type"] == "log":
+                    self.log_writer.write(message["record"], task.name, message.get("last", False), (worker.name, run_id))
+                elif message["type"] == "run" and self.history:
+                    self.history.record(task.name, message["seconds"], message["retcode"], message["output_size"],
+                                        message["cached"])
+                elif message["type"] == "result" and not result.done():
+                    result.set_result((message["retcode"], message["output"], message["error"]))
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            worker.lost = True
+            self.workers.remove(worker)
+            for task, result in worker.running.values():
+                if not result.done():
+                    result.set_exception(WorkerLost(worker.name))
+            writer.close()
+            if self.server and self.server.is_serving():
+                print(f"Worker '{worker.name}' left.")
+
+    async def acquire(self):
+        """
+        Waits for a worker with a free slot, preferring the least busy one.
+        """
+        while True:
+            free = [worker for worker in self.workers if len(worker.running) < worker.slots]
+            if free:
+                return min(free, key=lambda worker: len(worker.running) / worker.slots)
+            self.changed.clear()
+            await self.changed.wait()
+
+    async def execute(self, task, deadline=None):
         """
-        Executes the task's command with arguments and context.
+        Runs a task on a worker, moving it to another worker if the connection to the first one breaks.
 
         Args:
-            context (dict): A dictionary containing values for arguments and condition evaluation.
+            task (Task): The task to run.
+            deadline (float, optional): The time.monotonic() value at which the task is killed. Defaults to None.
 
         Returns:
-            tuple: A tuple containing the process return code, standard output, and standard error (if any).
+            tuple: A tuple containing the process return code, and the tails of standard output and standard error.
         """
-        if not self.enabled:
-            print(f"Task '{self.name}' skipped since it is disabled.")
-            retcode = -1    # return code defined for skipped task
-            output = None
-            error = ""
-            return retcode, output, error
+        fields = {name: getattr(task, name) for name in Task.__slots__}
+        fields.update(arguments=dict(task.arguments), resources=dict(task.resources),
+                      test_dir=os.path.relpath(task.test_dir or os.getcwd()))  # Workers share the layout, not the path
+        while True:
+            worker = await self.acquire()
+            if deadline is not None:  # Clocks differ between machines, so the worker gets the time left
+                fields["timeout"] = min(task.timeout or math.inf, max(deadline - time.monotonic(), 0.001))
+            run_id = next(self.run_ids)
+            result = asyncio.get_running_loop().create_future()
+            worker.running[run_id] = task, result
+            try:
+                await send_message(worker.writer, {"type": "task", "id": run_id, "task": fields})
+                return await result
+            except (WorkerLost, ConnectionError):
+                print(f"Worker '{worker.name}' was lost while running task '{task.name}', queueing it again.")
+            except asyncio.CancelledError:
+                if not worker.lost:
+                    with contextlib.suppress(ConnectionError):
+                        await send_message(worker.writer, {"type": "cancel", "id": run_id})
+                raise
+            finally:
+                del worker.running[run_id]
+                self.changed.set()
 
-        saved_dir = os.getcwd()
-        os.chdir(self.test_dir)
+    async def close(self):
+        """
+        Stops listening and disconnects the workers, which then exit.
+        """
+        self.server.close()
+        for worker in list(self.workers):
+            worker.writer.close()
+        await self.server.wait_closed()
 
-        formatted_command = self.command.format(**self.arguments)
-        print(f"Task '{self.name}' command: {formatted_command}")
-        with open(f"{saved_dir}/log/executor_log.txt", "a") as log_file:  # Open log file in append mode
-            process = subprocess.Popen(formatted_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, error = process.communicate()
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"\n** Task: {self.name} ({timestamp}) **\n")
-            log_file.write(f"Command: {formatted_command}\n")
-            log_file.write(f"Standard Output:\n")
-            prefix = "   "
-            for line in output.decode().splitlines():
-                log_file.write(f"{prefix}{line}\n")
-            if error:
-                log_file.write(f"Standard Error:\n")
-                for line in error.decode().splitlines():
-                    log_file.write(f"{prefix}{line}\n")
-            log_file.write("\n")
-            log_file.write(50*"-")
-            log_file.write("\n")
-
-        os.chdir(saved_dir)
-        return process.returncode, output.decode(), error.decode()
 
-    def __str__(self):
-        return f"Task Name: {self.name}\n \
-                Command: {self.command}\n \
-                Arguments: {self.arguments}\n \
-                Dependencies: {self.dependencies}\n \
-                Enabled: {self.enabled}\n \
-                Test Directory: {self.test_dir}"
+async def run_worker(address, slots, context, token=None):
+    """
+    Connects to a coordinator and runs the tasks it sends until it disconnects.
 
+    Every task runs with Task.execute_async in the current directory, which must hold the same
+    checkout as the coordinator's; its log records and result are sent back to the coordinator.
 
-def read_script(filename):
+    Args:
+        address (str): The 'host:port' address of the coordinator.
+        slots (int): The number of tasks run at the same time.
+        context (dict): The context the tasks run with, as for execute_script_async.
+        token (str, optional): The secret the coordinator expects. Defaults to None.
+
+    Raises:
+        ConnectionError: If the coordinator cannot be reached within WORKER_CONNECT_TIMEOUT seconds.
     """
-    Reads the script from a YAML file.
+    host, port = parse_address(address)
+    give_up = time.monotonic() + WORKER_CONNECT_TIMEOUT
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT)
+            break
+        except OSError:
+            if time.monotonic() > give_up:
+                raise ConnectionError(f"Coordinator '{address}' cannot be reached.")
+            await asyncio.sleep(0.5)
 
-    Args:
-        filename (str): The name of the YAML file containing the script.
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    await send_message(writer, {"type": "hello", "name": name, "slots": slots, "token": token})
+    print(f"Worker '{name}' connected to '{address}' with {slots} slots.")
+    context = dict(context, jobs=slots,
+                   cache=ResultCache(context.get("cache_dir", CACHE_DIR), context.get("cache_size", CACHE_SIZE)))
+    running = {}
+
+    async def run(run_id, fields):
+        task = Task(**dict(fields, test_dir=os.path.join(os.getcwd(), fields["test_dir"])))
+        channel = RemoteChannel(writer, run_id)
+        try:
+            retcode, output, error = await task.execute_async(dict(context, log_writer=channel, history=channel))
+        except Exception as exception:  # Reported like a command that failed, the worker keeps serving
+            retcode, output, error = 1, None, f"Task '{task.name}' failed on worker '{name}': {exception}"
+        finally:
+            del running[run_id]
+        with contextlib.suppress(ConnectionError):  # The coordinator left, the worker stops with it
+            await send_message(writer, {"type": "result", "id": run_id, "retcode": retcode, "output": output,
+                                        "error": error})
+
+    try:
+        while (line := await reader.readline()):
+            message = json.loads(line)
+            if message["type"] == "task":
+                running[message["id"]] = asyncio.create_task(run(message["id"], message["task"]))
+            elif message["type"] == "cancel" and message["id"] in running:
+                running[message["id"]].cancel()
+    except ConnectionError:
+        pass
+    finally:
+        for task in running.values():
+            task.cancel()
+        await asyncio.gather(*running.values(), return_exceptions=True)
+        writer.close()
+    print(f"Worker '{name}' disconnected.")
 
-    Returns:
-        dict: The script dictionary parsed from the YAML file.
+
+class EventBus:
+    def __init__(self, address, log_writer=None, wait=0.0):
+        """
+        Initializes an EventBus object, which publishes the events of a run to the clients connected to it over TCP.
+
+        Events are JSON lines with a 'type': 'run' (the script and its tasks, with their dependencies
+        as indexes into the list), then 'queued', 'started', 'output' and 'finished' (with the return
+        code, start time and duration) per task, and 'done'. Like RemoteChannel, the bus stands in for
+        the log writer of the tasks: the records it passes on are published as output. Events are
+        coalesced and written every EVENTS_INTERVAL seconds; a task's output beyond EVENTS_OUTPUT_LIMIT
+        bytes per interval is skipped, keeping the end, and a client whose connection has fallen
+        EVENTS_BUFFER_LIMIT bytes behind gets no output until it catches up. A client connecting late
+        first receives the 'run' event and the latest event of every task.
+
+        Args:
+            address (str): The 'host:port' address to listen on. Port 0 picks a free port, which start
+                prints and stores in 'address'.
+            log_writer (LogStore, optional): The writer the log records are passed on to. Defaults to None.
+            wait (float, optional): Seconds start waits for a first client. Defaults to 0.0.
+        """
+        self.address = parse_address(address)
+        self.log_writer = log_writer
+        self.wait = wait
+        self.clients = []
+        self.connected = asyncio.Event()
+        self.run = None
+        self.latest = {}
+        self.pending = []
+        self.output = {}
+        self.output_sizes = {}
+        self.skipped = {}
+        self.server = None
+        self.flusher = None
+
+    async def start(self):
+        """
+        Starts listening for clients, and waits for the first one if 'wait' was given.
+        """
+        self.server = await asyncio.start_server(self.serve, *self.address)
+        self.address = (self.address[0], self.server.sockets[0].getsockname()[1])
+        print(f"Publishing events on {self.address[0]}:{self.address[1]}.", flush=True)
+        self.flusher = asyncio.create_task(self._flush_periodically())
+        if self.wait:
+            try:
+                await asyncio.wait_for(self.connected.wait(), self.wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def serve(self, reader, writer):
+        """
+        Sends the state of the run to a new client, then the events published until it disconnects.
+        """
+        self.flush()  # The state sent includes the queued events
+        if self.run:
+            writer.write(b"".join(json.dumps(event).encode() + b"\n" for event in [self.run, *self.latest.values()]))
+        self.clients.append(writer)
+        self.connected.set()
+        try:
+            await reader.read()  # Clients only listen, until they disconnect
+        except ConnectionError:
+            pass
+        finally:
+            if writer in self.clients:
+                self.clients.remove(writer)
+            writer.close()
+
+    def publish(self, event):
+        """
+        Queues an event for the next flush, stamped with the current time.
+        """
+        event = {**event, "time": time.time()}
+        if event["type"] == "run":
+            self.run = event
+        elif "task" in event:
+            self.latest[event["task"]] = event
+        self.pending.append(event)
+
+    def write(self, record, task=None, last=False, attempt=None):
+        """
+        Passes a log record on to the log writer, and queues it as output of its task.
+        """
+        if self.log_writer:
+            self.log_writer.write(record, task, last, attempt)
+        if task:
+            if task not in self.output:
+                self.pending.append(task)  # The output goes out in the order it started
+            pieces = self.output.setdefault(task, [])
+            pieces.append(record)
+            size = self.output_sizes.get(task, 0) + len(record)
+            while size > EVENTS_OUTPUT_LIMIT and len(pieces) > 1:
+                size -= len(pieces[0])
+                self.skipped[task] = self.skipped.get(task, 0) + len(pieces.pop(0))
+            self.output_sizes[task] = size
+
+    async def drain(self):
+        """
+        Waits until the log writer can take more records. Slow clients lose output instead of slowing the tasks down.
+        """
+        if self.log_writer:
+            await self.log_writer.drain()
+
+    def flush(self):
+        """
+        Writes the queued events to every client, leaving out the output for the clients lagging behind.
+        """
+        if not self.clients:
+            self.pending = []  # A client connecting later gets the state instead
+            self.output = {}
+            self.output_sizes = {}
+            self.skipped = {}
+        if not self.pending:
+            return
+        statuses = []
+        everything = []
+        for event in self.pending:
+            if isinstance(event, str):
+                event = {"type": "output", "task": event, "text": "".join(self.output[event])[-EVENTS_OUTPUT_LIMIT:],
+                         "skipped": self.skipped.pop(event, 0)}
+            line = json.dumps(event).encode() + b"\n"
+            everything.append(line)
+            if event["type"] != "output":
+                statuses.append(line)
+        statuses = b"".join(statuses)
+        everything = b"".join(everything)
+        self.pending = []
+        self.output = {}
+        self.output_sizes = {}
+        for writer in self.clients:
+            if not writer.is_closing():
+                lagging = writer.transport.get_write_buffer_size() > EVENTS_BUFFER_LIMIT
+                writer.write(statuses if lagging else everything)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(EVENTS_INTERVAL)
+            self.flush()
+
+    async def close(self):
+        """
+        Writes the remaining events, lets the clients receive them and disconnects them.
+        """
+        if self.flusher:
+            self.flusher.cancel()
+        self.flush()
+        for writer in list(self.clients):
+            try:
+                await asyncio.wait_for(writer.drain(), EVENTS_DRAIN_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            writer.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+def read_events(address, connect_timeout=WORKER_CONNECT_TIMEOUT):
+    """
+    Yields the events an EventBus publishes, until its run is done or the connection ends.
+
+    Args:
+        address (str): The 'host:port' address of the event bus.
+        connect_timeout (float, optional): Seconds to keep trying to connect. Defaults to WORKER_CONNECT_TIMEOUT.
 
     Raises:
-        FileNotFoundError: If the YAML file is not found.
-        YAMLError: If there's an error parsing the YAML content.
+        ConnectionError: If the event bus cannot be reached within 'connect_timeout' seconds.
+    """
+    host, port = parse_address(address)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            connection = socket.create_connection(("127.0.0.1" if host == "0.0.0.0" else host, port), timeout=1.0)
+            break
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise ConnectionError(f"No event bus is listening on '{address}'.")
+            time.sleep(0.1)
+    connection.settimeout(None)
+    with connection, connection.makefile("rb") as lines:
+        for line in lines:
+            event = json.loads(line)
+            yield event
+            if event["type"] == "done":
+                return
 
-    This function reads a script from a YAML file and returns the parsed script dictionary.
-    If the YAML file is not found, it raises a FileNotFoundError. If there's an error parsing
-    the YAML content, it raises a YAMLError.
+
+class ClientStream:
+    def __init__(self, writer):
+        """
+        Initializes a ClientStream object, a text stream that sends what is printed to a daemon client.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection to the client.
+        """
+        self.writer = writer
+        self.pending = ""
+
+    def write(self, text):
+        # Whole lines only, so a client reading messages can print them as they come
+        self.pending += text
+        if "\n" in self.pending:
+            lines, _, self.pending = self.pending.rpartition("\n")
+            self.writer.write(encode_message({"type": "output", "text": lines + "\n"}))
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.writer.write(encode_message({"type": "output", "text": self.pending}))
+            self.pending = ""
+
+
+async def serve(socket_path, context):
     """
-    try:
-        with open(filename, 'r') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Error: Script file '{filename}' not found.")
-        #exit(1)
-        raise FileNotFoundError(f"Error: Script file '{filename}' not found.")
+    Runs a daemon executing the scripts submitted on a Unix socket, one at a time.
 
-    except yaml.YAMLError as e:
-        print(f"Error: Error parsing YAML file '{filename}': {e}")
-        #exit(1)
-        raise YAMLError(f"Error: Error parsing YAML file '{filename}': {e}")
+    A client sends a single JSON line, {"type": "run", "script": ..., "cwd": ..., "env": {...}, "context": {...}},
+    and receives the status lines of the run as {"type": "output", "text": ...} messages, followed by
+    {"type": "done", "succeeded": ...}. Compiled scripts stay in memory and Python pool workers stay
+    warm between submissions, so a run starts without any parsing, compiling or interpreter start.
+    The workers are only started by the first task that runs in the pool. The commands of a run see
+    the working directory and the environment of its client, and only the owner of the daemon may
+    connect to the socket.
 
+    Args:
+        socket_path (str): The path of the Unix socket to listen on.
+        context (dict): The default context of the runs, updated with the one of every submission.
 
-def validate_script(script):
+    Raises:
+        RuntimeError: If another daemon is listening on the socket.
     """
-    Validates the structure of the script dictionary.
+    if os.path.exists(socket_path):
+        try:
+            _, writer = await asyncio.open_unix_connection(socket_path)
+            writer.close()
+            raise RuntimeError(f"A daemon is already listening on '{socket_path}'.")
+        except ConnectionError:
+            os.unlink(socket_path)  # Left behind by a daemon that died
+
+    plans = {}
+    python_pool = PythonPool(os.cpu_count() or 1, context.get("pool_recycle", POOL_RECYCLE))  # Started on demand
+    lock = asyncio.Lock()
+    housekeeping = []
+
+    async def reply(writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def submit(reader, writer):
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+        except ValueError:
+            request = {}
+        if request.get("type") == "run" and request.get("script"):
+            async with lock:  # Runs change the working directory and the printed output of the process
+                stream = ClientStream(writer)
+                cwd = os.getcwd()
+                try:
+                    os.chdir(request.get("cwd") or cwd)
+                    with contextlib.redirect_stdout(stream):
+                        succeeded = await execute_script_async(request["script"], dict(
+                            context, **request.get("context", {}), env=request.get("env"), plans=plans,
+                            python_pool=python_pool, housekeeping=housekeeping))
+                    stream.flush()
+                    writer.write(encode_message({"type": "done", "succeeded": succeeded}))
+                    await reply(writer)
+                    while housekeeping:  # Off the client's clock, but before the next run reads the history
+                        await asyncio.to_thread(housekeeping.pop(0))
+                except Exception as error:
+                    stream.write(f"Error: {error}\n")
+                    stream.flush()
+                    writer.write(encode_message({"type": "done", "succeeded": False}))
+                    await reply(writer)
+                finally:
+                    housekeeping.clear()
+                    os.chdir(cwd)
+            return
+        writer.write(encode_message({"type": "done", "succeeded": False, "error": "Invalid request."}))
+        await reply(writer)
+
+    umask = os.umask(0o177)  # Private from the start, whatever the umask of the daemon
+    try:
+        server = await asyncio.start_unix_server(submit, path=socket_path, limit=MESSAGE_LIMIT)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o600)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    print(f"Daemon listening on '{socket_path}'.")
+    try:
+        await stop.wait()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        server.close()
+        await server.wait_closed()
+        await asyncio.to_thread(python_pool.close)
+        os.unlink(socket_path)
+        print("Daemon stopped.")
+
+
+async def submit_script(socket_path, script_file, context):
+    """
+    Runs a script in the daemon listening on a Unix socket, printing its output as it comes.
 
     Args:
-        script (dict): The script dictionary parsed from YAML.
+        socket_path (str): The path of the daemon's Unix socket.
+        script_file (str): The filename of the YAML file containing the script, relative to the current directory.
+        context (dict): The context of the run, which must be JSON serializable.
+
+    Returns:
+        bool: True if no task failed and the run was not stopped.
 
     Raises:
-        ValueError: If a task definition is missing a required key (command).
-        ValueError: If an optional key has an invalid data type.
+        ConnectionError: If no daemon is listening on the socket.
     """
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=MESSAGE_LIMIT)
+    await send_message(writer, {"type": "run", "script": script_file, "cwd": os.getcwd(), "env": dict(os.environ),
+                                "context": context})
+    succeeded = False
+    while (line := await reader.readline()):
+        message = json.loads(line)
+        if message["type"] == "output":
+            print(message["text"], end="", flush=True)
+        elif message["type"] == "done":
+            succeeded = message["succeeded"]
+            if message.get("error"):
+                print(f"Error: {message['error']}")
+    writer.close()
+    return succeeded
 
-    TaskDef = namedtuple("TaskDef", ["command", "enabled", "arguments", "dependencies"])
 
-    # Validate each task definition
-    for task_name, task_def in script.items():
-        # Convert task definition to namedtuple for type checking
-        task_def = TaskDef(command=task_def.get("command"), enabled=task_def.get("enabled", True), arguments=task_def.get("arguments", None), dependencies=task_def.get("dependencies", None))
+class FileWatcher:
+    def __init__(self, polling=False, poll_interval=WATCH_POLL_INTERVAL):
+        """
+        Initializes a FileWatcher object, reporting the files changed in a set of directories.
 
-        # Check for required key
-        if not task_def.command:
-            raise ValueError(f"Task '{task_name}' is missing required key 'command'.")
+        Changes are received from inotify, called through ctypes, and found by scanning the
+        directories every 'poll_interval' seconds where inotify is not available. Directories
+        are watched without their subdirectories.
 
-        # Check optional keys if present
-        if task_def.enabled is not None and not isinstance(task_def.enabled, bool):
-            raise ValueError(f"Task '{task_name}' has invalid data type for 'enabled' (expected bool).")
+        Args:
+            polling (bool, optional): Whether to scan the directories even if inotify is available,
+                e.g. on network file systems. Defaults to False.
+            poll_interval (float, optional): Seconds between two scans. Defaults to WATCH_POLL_INTERVAL.
+        """
+        self.poll_interval = poll_interval
+        self.directories = set()
+        self.paths = set()
+        self.overflowed = False
+        self.changed = asyncio.Event()
+        self.watches = {}  # inotify watch descriptor -> directory
+        self.snapshot = {}
+        self.poller = None
+        self.libc = None
+        self.fd = -1
+        if not polling:
+            try:
+                self.libc = ctypes.CDLL(None, use_errno=True)
+                self.libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+                self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (OSError, AttributeError):
+                self.fd = -1
+        if self.fd >= 0:
+            asyncio.get_running_loop().add_reader(self.fd, self._read_events)
+        else:
+            self.poller = asyncio.create_task(self._poll())
 
-        if task_def.arguments is not None and not isinstance(task_def.arguments, dict):
-            raise ValueError(f"Task '{task_name}' has invalid data type for 'arguments' (expected dict).")
+    @property
+    def method(self):
+        return "polling" if self.poller else "inotify"
 
-        if task_def.dependencies is not None and not isinstance(task_def.dependencies, list):
-            raise ValueError(f"Task '{task_name}' has invalid data type for 'dependencies' (expected list).")
+    def watch(self, directories):
+        """
+        Watches exactly the given directories from now on. Missing directories are skipped.
+        """
+        directories = {directory for directory in directories if os.path.isdir(directory)}
+        if self.poller:
+            self.snapshot.update(self._scan(directories - self.directories))
+            self.directories = directories
+            return
+        for wd, directory in list(self.watches.items()):
+            if directory not in directories:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+        for directory in directories - set(self.watches.values()):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_EVENTS)
+            if wd >= 0:
+                self.watches[wd] = directory
+            elif ctypes.get_errno() not in (errno.ENOENT, errno.ENOTDIR):  # e.g. out of watches
+                print(f"Cannot watch '{directory}' with inotify ({os.strerror(ctypes.get_errno())}), polling instead.")
+                self.close()
+                self.poller = asyncio.create_task(self._poll())
+                self.directories = set()
+                return self.watch(directories)
+        self.directories = directories
 
-        # Add further validation for arguments and dependencies structure if needed here.
+    async def changes(self, debounce=WATCH_DEBOUNCE):
+        """
+        Waits for files to change, until no more change for 'debounce' seconds.
 
-    print(f"Script '{script_file}' structure is valid.")
+        Returns:
+            set: The absolute paths of the changed files, or None if too many changed to tell.
+        """
+        await self.changed.wait()
+        while True:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), debounce)
+            except TimeoutError:
+                break
+        paths, self.paths = self.paths, set()
+        overflowed, self.overflowed = self.overflowed, False
+        return None if overflowed else paths
 
+    def close(self):
+        """
+        Stops watching.
+        """
+        if self.fd >= 0:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = -1
+            self.watches.clear()
+        if self.poller:
+            self.poller.cancel()
 
-def get_all_tasks(build_script):
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            if mask & 0x4000:  # IN_Q_OVERFLOW
+                self.overflowed = True
+            elif mask & 0x8000:  # IN_IGNORED, the directory is gone
+                self.watches.pop(wd, None)
+            elif name and not mask & 0x40000000 and wd in self.watches:  # Files only, not IN_ISDIR
+                self.paths.add(os.path.join(self.watches[wd], os.fsdecode(name)))
+            else:
+                continue
+            self.changed.set()
+
+    @staticmethod
+    def _scan(directories):
+        snapshot = {}
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        with contextlib.suppress(OSError):
+                            if entry.is_file():
+                                info = entry.stat()
+                                snapshot[entry.path] = (info.st_mtime_ns, info.st_size, info.st_ino)
+            except OSError:
+                pass
+        return snapshot
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            directories = set(self.directories)
+            snapshot = await asyncio.to_thread(self._scan, directories)
+            previous = {path: key for path, key in self.snapshot.items() if os.path.dirname(path) in directories}
+            changed = {path for path in snapshot.keys() | previous.keys() if snapshot.get(path) != previous.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                self.paths |= changed
+                self.changed.set()
+
+
+async def watch_script(script_file, context, polling=False):
     """
-    Extracts all tasks from the provided script dictionary and returns a dictionary where
-    task names are keys and Task objects are values.
+    Runs a script, then runs again the tasks affected by every change to the files they read, until cancelled.
+
+    The compiled graph stays in memory. The test directories of the tasks and the directories of
+    their inputs are watched (see FileWatcher), and once the changes settle, only the tasks reading
+    a changed file (see Task.reads) and the tasks depending on them run again. Changes to the
+    declared outputs of the tasks, to hidden files and to the log are ignored. A change to the
+    script itself runs the whole script again. A run still going on is cancelled if the change
+    affects the tasks it runs, and its tasks are run again along with the new ones.
 
     Args:
-        build_script (dict): The script dictionary parsed from a YAML file.
+        script_file (str): The filename of the YAML file containing the script.
+        context (dict): The context of the runs, see execute_script_async.
+        polling (bool, optional): Whether to poll the files instead of using inotify. Defaults to False.
+
+    Raises:
+        FileNotFoundError: If the YAML file is not found.
+        YAMLError: If there's an error parsing the YAML content.
+        ValueError: If the script is invalid, has unknown dependencies or dependency cycles.
+    """
+    plans = {}
+    context = dict(context, plans=plans)
+    graph = load_script(script_file, os.path.join(os.getcwd(), os.path.dirname(script_file)),
+                        context.get("plan_cache", True), context.get("targets"), plans)
+    (key, graph), = plans.values()
+    log_directory = os.path.abspath(LOG_DIR)
+    watcher = FileWatcher(polling)
+    run = asyncio.create_task(execute_script_async(script_file, context))
+    running_ids = None  # The IDs of the tasks the current run may run, None for all of them
+    pending = set()     # The names of the tasks to run once the current run is over, None for all of them
+
+    def ignored(path):
+        name = os.path.basename(path)
+        return (name.startswith(".") or name.endswith("~") or os.path.dirname(path) == log_directory
+                or any(task.writes(path) for task in graph.tasks if task.outputs))
+
+    try:
+        while True:
+            if run is None and pending != set():
+                run = asyncio.create_task(execute_script_async(script_file, dict(context, changed_tasks=pending)))
+                running_ids = None if pending is None else graph.downstream_of(graph.ids[name] for name in pending)
+                pending = set()
+            if plans:  # Keeps the last good graph if the script was broken by a change
+                (key, graph), = plans.values()
+            script_files = {os.path.abspath(path) for path in key["files"]}
+            script_directories = {os.path.abspath(path) for path in key["directories"]}
+            watcher.watch(set().union(*(task.watched_directories() for task in graph.tasks if task.enabled),
+                                      map(os.path.dirname, script_files), script_directories))
+            if run is None:
+                print(f"Watching {len(watcher.directories)} directories for changes ({watcher.method}).")
+
+            changes = asyncio.create_task(watcher.changes())
+            done, _ = await asyncio.wait({changes, run} - {None}, return_when=asyncio.FIRST_COMPLETED)
+            if changes not in done:
+                changes.cancel()
+                await asyncio.gather(changes, return_exceptions=True)
+                try:
+                    run.result()
+                except (OSError, YAMLError, ValueError) as error:
+                    print(f"Error: {error}")
+                run = None
+                continue
+
+            paths = changes.result()
+            if paths is None or any(path in script_files or (os.path.dirname(path) in script_directories
+                                                             and path.endswith((".yaml", ".yml"))) for path in paths):
+                print("Script changed, running it again.")
+                affected = None
+            else:
+                paths = sorted(path for path in paths if not ignored(path))
+                affected = {task.name for task in graph.tasks if task.enabled and any(map(task.reads, paths))}
+                if not affected:
+                    continue
+                print(f"Changed: {', '.join(os.path.relpath(path) for path in paths)}. "
+                      f"Running again: {', '.join(sorted(affected))}.")
+
+            if run is not None and (affected is None or running_ids is None or not running_ids.isdisjoint(
+                    graph.downstream_of(graph.ids[name] for name in affected))):
+                print("Cancelling the current run, which the change made stale.")
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+                pending = None if running_ids is None else pending | {graph.tasks[task_id].name for task_id in running_ids}
+                run = None
+            pending = None if affected is None or pending is None else pending | affected
+    finally:
+        if run is not None:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+        watcher.close()
+
+
+def run_async(coroutine):
+    """
+    Runs a coroutine to completion on a new event loop.
+
+    Args:
+        coroutine (coroutine): The coroutine to run.
 
     Returns:
-        dict: A dictionary containing task names as keys and Task objects as values.
+        object: The value returned by the coroutine.
     """
-    tasks = {}
-    for task_name, task_def in build_script.items():
-        task = Task(task_name, **task_def)
-        tasks[task_name] = task
-    return tasks
+    return asyncio.run(coroutine)
 
 
 def execute_script(script_file, context):
     """
     Executes the script tasks based on dependencies and conditions.
 
+    This is the blocking entry point, see execute_script_async for the details.
+
     Args:
         script_file (str): The filename of the YAML file containing the script.
         context (dict): A dictionary containing values for arguments and condition evaluation.
 
     Returns:
-        None: This function does not return any value. It prints the status of each task execution.
+        bool: True if no task failed and the run was not stopped. The status of each task execution is printed.
 
     Raises:
         FileNotFoundError: If the YAML file is not found.
         YAMLError: If there's an error parsing the YAML content.
+        ValueError: If the script is invalid, has unknown dependencies or dependency cycles.
     """
-    build_script = read_script(script_file)
-    validate_script(build_script)
+    return run_async(execute_script_async(script_file, context))
 
-    tasks = get_all_tasks(build_script)
 
-    completed_tasks = set()
-    current_dir = os.path.dirname(script_file)
-    for task_name, task_def in build_script.items():
-        task_def['test_dir'] = os.path.join(os.getcwd(), current_dir)
+async def execute_script_async(script_file, context):
+    """
+    Executes the script tasks based on dependencies and conditions on the running event loop.
 
-        task = Task(task_name, **task_def)
+    Every task whose dependencies have finished is started right away, running up to
+    'jobs' tasks at the same time, as long as the resources they declare are left. All of them
+    are supervised by the event loop, so no thread is tied up per running command. When more
+    tasks are ready than can run, the ones with the longest remaining path to the end of the
+    script, weighted by the durations recorded in earlier runs, start first.
 
-        if can_run := task.check_dependencies(completed_tasks, tasks):
-            retcode, output, error = task.execute(context)
+    Args:
+        script_file (str): The filename of the YAML file containing the script.
+        context (dict): A dictionary containing values for arguments and condition evaluation.
+            The 'jobs' key limits the number of tasks running in parallel (defaults to the number of cores),
+            and 'output_tail' the bytes of output kept per task for error messages. A single LogStore
+            is created for the run and passed to the tasks as 'log_writer', and a ResultCache in
+            'cache_dir' holding at most 'cache_size' megabytes as 'cache'. Tasks whose outputs are up to
+            date are skipped unless 'force' is set. The compiled plan of the script is reused unless
+            'plan_cache' is False. Only the 'targets' and their dependencies run, if given. A JSONL
+            record with the timings and resource usage of every command is written to 'trace_file', if given,
+            replacing the trace of the previous run.
+            Every run is recorded in the RunHistory database 'history_db', whose durations order the tasks.
+            Tasks with 'runner: python-pool' share a PythonPool whose workers are replaced after 'pool_recycle' tasks.
+            No task starts, and running ones are killed, once the run took 'timeout' seconds. Tasks with
+            'hedge' set get a second copy once they run longer than HEDGE_PERCENTILE of their recorded runs.
+            The 'resources' key sets the capacity of 'cpus' (defaults to 'jobs'), 'memory' (defaults to the
+            physical memory) and named pools, which are unlimited unless given. With a 'coordinator'
+            address, the tasks run on the workers connected to it (see Coordinator) presenting 'token',
+            and 'jobs' is unlimited by default. A long-running process can pass the 'plans' it keeps in
+            memory (see load_script), its own 'python_pool', which is then left running, and a
+            'housekeeping' list receiving the functions saving the history and evicting the cache,
+            to call once it has replied. Given 'changed_tasks', only these tasks and the ones depending
+            on them run, without up-to-date checks for the former (see watch_script). The events of the
+            run are published on an EventBus listening on the 'events' address, which waits 'events_wait'
+            seconds for a first client before the tasks start. Ready tasks with
+            'batch' set that share a command template run in batched invocations (see execute_batch_async),
+            which count as one job and hold the resources of one task; not on a coordinator's workers.
+            Local commands run with the environment 'env', the executor's own if not given.
 
-            if retcode == -1:  # Task skipped
-                continue
-            elif retcode == 0:
-                print(f"Task '{task.name}' completed successfully.")
-                completed_tasks.add(task.name)
-            else:
-                print(f"Task '{task.name}' failed with exit code {retcode}.")
-                if error:
-                    print(f"Error output:\n{error}")
-                if not context.get("no_stop"):
-                    break  # Stop execution on failure (optional)
+    Returns:
+        bool: True if no task failed and the run was not stopped. The status of each task execution is printed.
+
+    Raises:
+        FileNotFoundError: If the YAML file is not found.
+        YAMLError: If there's an error parsing the YAML content.
+        ValueError: If the number of jobs or the script is invalid, has unknown dependencies or dependency cycles.
+    """
+    check_jobs(context.get("jobs"))
+    graph = load_script(script_file, os.path.join(os.getcwd(), os.path.dirname(script_file)),
+                        context.get("plan_cache", True), context.get("targets"), context.get("plans"))
+
+    jobs = context.get("jobs") or (math.inf if context.get("coordinator") else os.cpu_count() or 1)
+    history = await asyncio.to_thread(RunHistory(context.get("history_db", HISTORY_DB), script_file).load)
+    durations = history.estimates(graph)
+    log_writer = LogStore(os.path.join(os.getcwd(), LOG_DIR), script_file)
+    log_writer.start()
+    events = EventBus(context["events"], log_writer, context.get("events_wait", 0.0)) if context.get("events") else None
+    if events:
+        events.publish({"type": "run", "script": script_file, "tasks": [
+            {"name": task.name, "dependencies": list(graph.dependencies_of(task_id))}
+            for task_id, task in enumerate(graph.tasks)]})
+        await events.start()
+
+    def queued(task_id):
+        events.publish({"type": "queued", "task": graph.tasks[task_id].name})
+
+    def batch_group(task_id):
+        # Ready tasks sharing the command template of a batched task may join it
+        task = graph.tasks[task_id]
+        if context.get("coordinator") or not task.batch or not task.enabled:
+            return None
+        return task.batch, task.command, task.test_dir, task.shell, task.timeout
+
+    scheduler = Scheduler(graph, graph.remaining_paths(durations), queued if events else None,
+                          ResourcePool(graph, machine_capacity(jobs, context.get("resources"))), durations, batch_group)
+    remaining_work = sum(durations)
+    started = {}
+    stopped = False
+    succeeded = True
+    running = {}
+    rerun = set()  # The IDs of the tasks that ran
+    cache = ResultCache(context.get("cache_dir", CACHE_DIR), context.get("cache_size", CACHE_SIZE))
+    trace = LogWriter(context["trace_file"], mode="w") if context.get("trace_file") else None
+    if trace:
+        trace.start()
+    deadline = time.monotonic() + context["timeout"] if context.get("timeout") else None
+    coordinator = Coordinator(context["coordinator"], events or log_writer, history, context.get("token")) \
+        if context.get("coordinator") else None
+    if coordinator:
+        await coordinator.start()
+    pool_tasks = not coordinator and sum(task.runner == "python-pool" and task.enabled for task in graph.tasks)
+    python_pool = context.get("python_pool")
+    own_pool = python_pool is None and pool_tasks
+    if own_pool:
+        python_pool = PythonPool(min(jobs, pool_tasks), context.get("pool_recycle", POOL_RECYCLE))
+        python_pool.start()
+    context = dict(context, log_writer=events or log_writer, cache=cache, trace=trace, history=history,
+                   python_pool=python_pool, deadline=deadline)
+
+    changed_tasks = context.get("changed_tasks")
+
+    def execute(task):
+        return coordinator.execute(task, deadline) if coordinator else task.execute_async(context)
+
+    async def needs_run(task_id):
+        # Dependencies are compared by ID, a dependency on a whole matrix standing for all of its cells
+        task = graph.tasks[task_id]
+        dependencies_reran = not rerun.isdisjoint(graph.dependencies_of(task_id))
+        # Only the changed tasks and their dependents run again after a change in watch mode
+        if changed_tasks is not None and task.enabled and task.name not in changed_tasks and not dependencies_reran:
+            return False
+        # Like make, a task is skipped when its outputs are newer than its inputs and none of its dependencies reran
+        if task.enabled and task.outputs and not context.get("force") and task.name not in (changed_tasks or ()) \
+                and not dependencies_reran:
+            if await asyncio.to_thread(task.is_up_to_date):
+                print(f"Task '{task.name}' is up to date.")
+                return False
+        rerun.add(task_id)
+        return True
+
+    async def run_batch(task_ids):
+        tasks = [graph.tasks[task_id] for task_id in task_ids]
+        selected = [await needs_run(task_id) for task_id in task_ids]
+        results = iter(await execute_batch_async([task for task, run in zip(tasks, selected) if run], context))
+        return [next(results) if run else (0, None, "") for run in selected]
+
+    def take_batch(task_id):
+        # The ready tasks of the group of a batched task join it, within its limits
+        task = graph.tasks[task_id]
+        if batch_group(task_id) is None:
+            return []
+        size, length = task.batch
+        length -= len(" ".join(task.batch_parts()))
+
+        def matches(other_id):
+            nonlocal length
+            added = len(graph.tasks[other_id].batch_parts()[1]) + 1
+            if added > length:
+                return False
+            length -= added
+            return True
+        return scheduler.take_ready(task_id, matches, size - 1)
+
+    async def run(task_id):
+        task = graph.tasks[task_id]
+        if not await needs_run(task_id):
+            return 0, None, ""
+        if not task.hedge or (threshold := await asyncio.to_thread(history.percentile, task.name, HEDGE_PERCENTILE)) is None:
+            return await execute(task)
+
+        # Hedged: a copy started once the task runs longer than usual races the original
+        first = asyncio.create_task(execute(task))
+        done, _ = await asyncio.wait({first}, timeout=threshold)
+        if done:
+            return first.result()
+        print(f"Task '{task.name}' is running longer than {threshold:.2f} seconds, starting a second copy.")
+        second = asyncio.create_task(execute(task))
+        try:
+            done, _ = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for copy in (first, second):
+                copy.cancel()  # Kills the copy still running, if any
+            await asyncio.gather(first, second, return_exceptions=True)
+        winner = first if first in done else second
+        print(f"Task '{task.name}' finished first in its {'second copy' if winner is second else 'original run'}.")
+        return winner.result()
+
+    def eta():
+        # The remaining work spread over the jobs, unless a chain of remaining tasks takes longer
+        now = time.perf_counter()
+        running_ids = [task_id for task_ids in running.values() for task_id in task_ids]
+        chain = max((scheduler.priorities[task_id] - (now - started[task_id]) for task_id in running_ids), default=0.0)
+        if (priority := scheduler.next_priority()) is not None:
+            chain = max(chain, priority)
+        running_work = sum(min(durations[task_id], now - started[task_id]) for task_id in running_ids)
+        return max((remaining_work - running_work) / jobs, chain, 0.0)
+
+    try:
+        while True:
+            if deadline is not None and not stopped and time.monotonic() >= deadline:
+                print(f"Script timed out after {context['timeout']:g} seconds.")
+                stopped = True
+                succeeded = False  # The running tasks are killed by their own deadline
+            while not stopped and len(running) < jobs and (task_id := scheduler.next_ready()) is not None:
+                task_ids = (task_id, *take_batch(task_id))
+                process = run_batch(task_ids) if len(task_ids) > 1 else run(task_id)
+                running[asyncio.create_task(process)] = task_ids
+                for task_id in task_ids:
+                    started[task_id] = time.perf_counter()
+                    if events:
+                        events.publish({"type": "started", "task": graph.tasks[task_id].name})
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                task_ids = running.pop(finished)
+                scheduler.release(task_ids[0])  # A batch holds the resources of the task it was started for
+                results = finished.result() if len(task_ids) > 1 else [finished.result()]
+                for task_id, (retcode, output, error) in zip(task_ids, results):
+                    task = graph.tasks[task_id]
+                    remaining_work -= durations[task_id]
+                    duration = time.perf_counter() - started.pop(task_id)
+                    if events:
+                        events.publish({"type": "finished", "task": task.name, "retcode": retcode,
+                                        "ran": task_id in rerun, "started": time.time() - duration,
+                                        "duration": duration})
+                    if retcode == 0:
+                        if task_id in rerun:
+                            print(f"Task '{task.name}' completed successfully. "
+                                  f"[{len(graph) - scheduler.unfinished + 1}/{len(graph)}, ETA {eta():.1f}s]")
+                    elif retcode != -1:  # Task failed, -1 means skipped
+                        print(f"Task '{task.name}' failed with exit code {retcode}.")
+                        if error:
+                            print(f"Error output:\n{error}")
+                        succeeded = False
+                        if not context.get("no_stop"):
+                            stopped = True  # Stop starting new tasks on failure (optional)
+                    scheduler.task_finished(task_id, retcode == 0)
+    finally:
+        for running_task in running:
+            running_task.cancel()  # Kills their commands, when the run itself is cancelled
+        await asyncio.gather(*running, return_exceptions=True)
+        if coordinator:
+            await coordinator.close()
+        if events:
+            events.publish({"type": "done", "succeeded": succeeded and not scheduler.unfinished})
+            await events.close()
+        await asyncio.to_thread(log_writer.close)
+        if own_pool:
+            await asyncio.to_thread(python_pool.close)
+        if trace:
+            await asyncio.to_thread(trace.close)
+        housekeeping = [history.save] + ([cache.evict] if any(task.cache for task in graph.tasks) else [])
+        if "housekeeping" in context:
+            context["housekeeping"].extend(housekeeping)
+        else:
+            for job in housekeeping:
+                await asyncio.to_thread(job)
+    return succeeded and not scheduler.unfinished
+
+
+def print_logs(store, task=None, run=None, latest=True, listing=False):
+    """
+    Prints log records of a LogStore, read straight from their segment through the index.
+
+    Args:
+        store (LogStore): The log store.
+        task (str, optional): Only the records of this task. Defaults to None.
+        run (int, optional): Only the records of this run. Defaults to None.
+        latest (bool, optional): Only the latest matching record. Defaults to True.
+        listing (bool, optional): Print one line per record instead of their text. Defaults to False.
+
+    Returns:
+        int: The number of records printed.
+    """
+    records = store.find(task, run)
+    if latest:
+        records = records[-1:]
+    for record in records:
+        if listing:
+            started = datetime.datetime.fromtimestamp(record["started"]).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"run {record['run']:>6}  {started}  {record['size']:>10} bytes  {record['task']}")
+        else:
+            try:
+                print(store.read(record), end="")
+            except OSError as error:
+                print(f"Record of task '{record['task']}' in run {record['run']} is gone: {error}")
+    return len(records)
+
+
+def positive_int(text):
+    """
+    Parses a command line value that must be a whole number of at least 1, such as --jobs.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a positive integer.
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive integer {text!r}")
+    return value
+
+
+def check_jobs(jobs):
+    """
+    Checks the 'jobs' of a context, which is either absent (None) or a positive integer.
+
+    Raises:
+        ValueError: If the number of jobs is invalid.
+    """
+    if jobs is not None and (not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1):
+        raise ValueError(f"Invalid number of jobs {jobs!r} (expected a positive integer).")
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["logs"]:
+        parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} logs",
+                                         description="Print the log records of tasks")
+        parser.add_argument("task", nargs="?", help="Task whose latest record is printed.")
+        parser.add_argument("--run", type=int, help="Only the records of this run (see --list).")
+        parser.add_argument("--all", action="store_true", help="Print every matching record, not only the latest.")
+        parser.add_argument("--list", action="store_true", help="List the matching records instead of printing them.")
+        parser.add_argument("--export", metavar="FILE",
+                            help="Write the matching records, all of them by default, to FILE in plain text ('-' for standard output).")
+        parser.add_argument("--log-dir", default=LOG_DIR, help=f"Directory of the log store (default: {LOG_DIR}).")
+        args = parser.parse_args(sys.argv[2:])
+        store = LogStore(args.log_dir)
+        if args.export:
+            with contextlib.nullcontext(sys.stdout) if args.export == "-" else open(args.export, "w") as output:
+                count = store.export(output, args.task, args.run)
+            if args.export != "-":
+                print(f"{count} log records written to '{args.export}'.")
+            exit(0)
+        if not (args.task or args.run or args.list):
+            parser.error("a task, --run or --list is required")
+        if not print_logs(store, args.task, args.run, not (args.all or args.list or args.run and not args.task), args.list):
+            print("No log record found.")
+            exit(1)
+        exit(0)
+
     parser = argparse.ArgumentParser(description="Execute tasks defined in a YAML script")
-    parser.add_argument("script", nargs="?", help="YAML file containing the script definition.")
+    parser.add_argument("script", nargs="?",
+                        help="YAML file containing the script definition, or 'serve' to start a daemon (see --socket).")
     parser.add_argument("--no-stop", action="store_true", help="Continue execution even if a task fails.")
+    parser.add_argument("-t", "--target", action="append", dest="targets", metavar="TASK",
+                        help="Run only this task and its dependencies (repeatable). Included tasks are named 'namespace:task'.")
+    parser.add_argument("-j", "--jobs", type=positive_int,
+                        help="Maximum number of tasks running in parallel (default: number of cores, "
+                             "unlimited with --coordinator). With --worker, the tasks the worker runs at once.")
+    parser.add_argument("--output-tail", type=int, default=OUTPUT_TAIL_SIZE, metavar="BYTES",
+                        help="Bytes of each task's stdout/stderr kept in memory for error messages "
+                             f"(default: {OUTPUT_TAIL_SIZE}). The full output is streamed to the log.")
+    parser.add_argument("-B", "--force", action="store_true",
+                        help="Run every task, even those whose outputs are newer than their inputs.")
+    parser.add_argument("--no-plan-cache", action="store_true",
+                        help="Always parse and compile the script instead of reusing its compiled plan.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print the critical path and the estimated duration of the script without running it.")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a JSON line with the timings and resource usage of every task of the run to FILE.")
+    parser.add_argument("--chrome-trace", metavar="FILE",
+                        help="After the run, convert the --trace file into Chrome/Perfetto trace-event format.")
+    parser.add_argument("--history-db", default=HISTORY_DB, metavar="FILE",
+                        help=f"SQLite database recording the runs of every task (default: {HISTORY_DB}).")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        help="Kill the running tasks and stop once the whole run took this long.")
+    parser.add_argument("--resource", action="append", default=[], metavar="NAME=AMOUNT",
+                        help="Capacity of a resource tasks declare in 'resources' (repeatable), e.g. cpus=8, "
+                             "memory=16G or license=2. CPUs default to --jobs and memory to the physical memory.")
+    parser.add_argument("--pool-recycle", type=int, default=POOL_RECYCLE, metavar="N",
+                        help=f"Tasks run by a Python pool worker before it is replaced (default: {POOL_RECYCLE}).")
+    parser.add_argument("--coordinator", metavar="HOST:PORT",
+                        help="Run the tasks on the workers connecting to this address instead of locally.")
+    parser.add_argument("--worker", metavar="HOST:PORT",
+                        help="Run tasks for the coordinator at this address, in the current directory, until it finishes.")
+    parser.add_argument("--token", default=os.environ.get("EXECUTOR_TOKEN"),
+                        help="Secret shared by the coordinator and its workers (default: $EXECUTOR_TOKEN).")
+    parser.add_argument("--events", metavar="HOST:PORT",
+                        help="Publish the events of the run on this address, e.g. for the UI in ui/app.py. "
+                             "Port 0 picks a free port, printed when the run starts.")
+    parser.add_argument("--events-wait", type=float, default=0.0, metavar="SECONDS",
+                        help="With --events, wait up to SECONDS for a first client before starting the tasks.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET,
+                        help=f"Unix socket the daemon started with 'serve' listens on (default: {DAEMON_SOCKET}).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running: run again the tasks affected by every change to the files they read.")
+    parser.add_argument("--watch-poll", action="store_true",
+                        help="With --watch, poll the files instead of using inotify, e.g. on network file systems.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Submit the script to the daemon listening on --socket instead of running it here.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"Directory of the result cache used by tasks with 'cache: True' (default: {CACHE_DIR}).")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, metavar="MB",
+                        help=f"Size of the result cache before old entries are evicted (default: {CACHE_SIZE}).")
     args = parser.parse_args()
+    if args.chrome_trace and not args.trace:
+        parser.error("--chrome-trace requires --trace")
+    resources = {}
+    for resource in args.resource:
+        name, _, amount = resource.partition("=")
+        try:
+            resources[name] = parse_amount(name, amount)
+        except ValueError:
+            parser.error(f"invalid --resource {resource!r} (expected NAME=AMOUNT)")
+
+    if args.coordinator:
+        try:
+            host, _ = parse_address(args.coordinator)
+        except ValueError as error:
+            parser.error(str(error))
+        if not args.token and not is_loopback(host):
+            parser.error("--coordinator on an address other than the loopback requires --token or $EXECUTOR_TOKEN")
+
+    if args.worker:
+        run_async(run_worker(args.worker, args.jobs or os.cpu_count() or 1, {
+            "output_tail": args.output_tail,
+            "cache_dir": args.cache_dir,
+            "cache_size": args.cache_size,
+        }, args.token))
+        exit(0)
 
     # If script argument is not provided, check for environment variable
     if not args.script:
@@ -261,6 +4200,53 @@ if __name__ == "__main__":
     # Add environment variables or other context values here
     context = {
         "no_stop": args.no_stop,
+        "targets": args.targets,
+        "jobs": args.jobs,
+        "output_tail": args.output_tail,
+        "force": args.force,
+        "plan_cache": not args.no_plan_cache,
+        "cache_dir": args.cache_dir,
+        "cache_size": args.cache_size,
+        "trace_file": args.trace,
+        "history_db": args.history_db,
+        "pool_recycle": args.pool_recycle,
+        "resources": resources,
+        "timeout": args.timeout,
+        "coordinator": args.coordinator,
+        "token": args.token,
+        "events": args.events,
+        "events_wait": args.events_wait,
     }
 
-    execute_script(script_file, context)
+    if script_file == "serve":
+        try:
+            run_async(serve(args.socket, context))
+        except RuntimeError as error:
+            print(f"Error: {error}")
+            exit(1)
+        exit(0)
+
+    if args.plan:
+        plan_script(script_file, context)
+        exit(0)
+
+    if args.watch:
+        try:
+            run_async(watch_script(script_file, context, args.watch_poll))
+        except KeyboardInterrupt:
+            pass
+        exit(0)
+
+    if args.daemon:
+        try:
+            succeeded = run_async(submit_script(args.socket, script_file, context))
+        except OSError as error:
+            print(f"Error: No daemon is listening on '{args.socket}': {error}")
+            exit(1)
+    else:
+        succeeded = execute_script(script_file, context)
+
+    if args.chrome_trace:
+        parallelism = export_chrome_trace(args.trace, args.chrome_trace)
+        print(f"Chrome trace written to '{args.chrome_trace}' (average parallelism {parallelism:.1f}).")
+    exit(0 if succeeded else 1)
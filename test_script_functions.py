@@ -1,9 +1,32 @@
 # test_script_functions.py
 
+import asyncio
+import io
+import json
+import os
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
 import pytest
 from unittest.mock import patch
 
-from executor import read_script, validate_script, get_all_tasks, Task
+import executor
+from executor import (read_script, validate_script, get_all_tasks, compile_script, direct_command, load_script, execute_script, execute_script_async, run_worker, serve, watch_script,
+                      estimate_makespan, export_chrome_trace, plan_script, print_logs, read_events, send_message, Coordinator, LogWriter, LogStore, ResourcePool, ResultCache, RunHistory, Scheduler, ScriptLoader, Task)
+
+
+def read_log(directory):
+    """
+    Returns the records of the log store in 'directory' in the plain-text format.
+    """
+    output = io.StringIO()
+    LogStore(str(directory)).export(output)
+    return output.getvalue()
 
 
 @pytest.fixture
@@ -292,3 +315,1279 @@ def test_read_script_file_not_found():
 
 #         mock_logger_info.assert_called_with("Executing task: task1")  # Verify logging occurred
     
+
+
+@pytest.fixture
+def diamond_graph():
+    return compile_script({
+        "write": {"command": "true"},
+        "testing": {"command": "true", "dependencies": ["write"]},
+        "showing": {"command": "true", "dependencies": ["testing"]},
+        "read": {"command": "true", "dependencies": ["testing"]},
+        "tearDown": {"command": "true", "dependencies": ["showing", "read"]},
+    })
+
+
+def drain(scheduler):
+    ready = []
+    while (task_id := scheduler.next_ready()) is not None:
+        ready.append(scheduler.graph.tasks[task_id].name)
+    return ready
+
+
+def test_scheduler_releases_independent_tasks_together(diamond_graph):
+    """
+    Test that every task whose dependencies have finished becomes ready at the same time.
+    """
+    ids = diamond_graph.ids
+    scheduler = Scheduler(diamond_graph)
+    assert drain(scheduler) == ["write"]
+
+    scheduler.task_finished(ids["write"], True)
+    assert drain(scheduler) == ["testing"]
+
+    scheduler.task_finished(ids["testing"], True)
+    assert drain(scheduler) == ["showing", "read"]
+
+    scheduler.task_finished(ids["showing"], True)
+    assert drain(scheduler) == []
+    scheduler.task_finished(ids["read"], True)
+    assert drain(scheduler) == ["tearDown"]
+
+
+def test_scheduler_starts_critical_path_first():
+    """
+    Test that the ready task with the longest remaining path is handed out first, and that it shortens the run.
+    """
+    graph = compile_script({
+        "short": {"command": "true"},
+        "chain1": {"command": "true"},
+        "chain2": {"command": "true", "dependencies": ["chain1"]},
+        "chain3": {"command": "true", "dependencies": ["chain2"]},
+    })
+    durations = [3.0, 1.0, 1.0, 1.0]
+    assert list(graph.remaining_paths(durations)) == [3.0, 3.0, 2.0, 1.0]
+    assert [graph.tasks[task_id].name for task_id in graph.critical_path(durations)] == ["short"]
+
+    durations = [2.0, 1.0, 1.0, 1.0]
+    assert [graph.tasks[task_id].name for task_id in graph.critical_path(durations)] == ["chain1", "chain2", "chain3"]
+    scheduler = Scheduler(graph, graph.remaining_paths(durations))
+    assert scheduler.next_ready() == graph.ids["chain1"]
+    assert drain(Scheduler(graph)) == ["short", "chain1"]  # Script order without priorities
+
+    assert estimate_makespan(graph, durations, 1) == 5.0
+    assert estimate_makespan(graph, durations, 2) == 3.0
+
+
+def test_resource_pool_packs_tasks_against_every_resource():
+    """
+    Test that tasks only start when all their resources are left, and that smaller ready tasks fill the gaps.
+    """
+    graph = compile_script({
+        "compile1": {"command": "true", "resources": {"cpus": 2, "memory": "6G"}},
+        "compile2": {"command": "true", "resources": {"cpus": 2, "memory": "6G"}},
+        "upload1": {"command": "true", "resources": {"license": 1}},
+        "upload2": {"command": "true", "resources": {"license": 1}},
+        "huge": {"command": "true", "resources": {"cpus": 64}},
+    })
+    ids = graph.ids
+    resources = ResourcePool(graph, {"cpus": 4.0, "memory": 8192.0, "license": 1.0})
+    assert resources.demand(ids["huge"]) == {"cpus": 4.0}  # Capped, so it can still run alone
+    assert resources.demand(ids["upload1"]) == {"cpus": 1.0, "license": 1.0}
+
+    scheduler = Scheduler(graph, resources=resources)
+    started = []
+    while (task_id := scheduler.next_ready()) is not None:
+        started.append(graph.tasks[task_id].name)
+    assert started == ["compile1", "upload1"]  # compile2 would exceed the memory, upload2 the license
+    assert resources.free == {"cpus": 1.0, "memory": 2048.0, "license": 0.0}
+
+    scheduler.release(ids["compile1"])
+    assert scheduler.next_ready() == ids["compile2"]
+
+    durations = [10.0, 10.0, 1.0, 1.0, 1.0]
+    assert estimate_makespan(graph, durations, 8, {"cpus": 4.0, "memory": 8192.0, "license": 1.0}) == 21.0
+    assert estimate_makespan(graph, durations, 8, {"cpus": 8.0}) == 11.0  # huge takes every CPU once they finish
+
+
+def test_scheduler_reserves_resources_for_the_most_urgent_task():
+    """
+    Test that smaller tasks only run ahead of a task waiting for resources when they do not delay it,
+    and that parked tasks start once resources are released.
+    """
+    graph = compile_script({
+        "long": {"command": "true", "resources": {"cpus": 2}},
+        "big": {"command": "true", "resources": {"cpus": 4}},
+        "slow": {"command": "true"},
+        "quick": {"command": "true"},
+    })
+    ids = graph.ids
+    now = 0.0
+    scheduler = Scheduler(graph, [30, 25, 20, 2], resources=ResourcePool(graph, {"cpus": 4.0}),
+                          durations=[10.0, 1.0, 20.0, 2.0], clock=lambda: now)
+    assert scheduler.next_ready() == ids["long"]
+    assert scheduler.next_ready() == ids["quick"]  # Done before 'long' ends, unlike 'slow'
+    assert scheduler.next_ready() is None
+    assert scheduler.next_priority() == 25
+
+    now = 2.0
+    scheduler.release(ids["quick"])
+    assert scheduler.next_ready() is None  # 'big' still waits for 'long', and 'slow' for 'big'
+    now = 10.0
+    scheduler.release(ids["long"])
+    assert scheduler.next_ready() == ids["big"]
+    assert scheduler.next_ready() is None
+    now = 11.0
+    scheduler.release(ids["big"])
+    assert scheduler.next_ready() == ids["slow"]
+
+
+def test_validate_script_rejects_invalid_resources():
+    """
+    Test that resource amounts must be non-negative numbers, or sizes for memory.
+    """
+    validate_script({"task": {"command": "true", "resources": {"cpus": 2, "memory": "512M", "disk": 1}}})
+    with pytest.raises(ValueError, match="invalid amount for resource 'memory'"):
+        validate_script({"task": {"command": "true", "resources": {"memory": "lots"}}})
+    with pytest.raises(ValueError, match="invalid amount for resource 'cpus'"):
+        validate_script({"task": {"command": "true", "resources": {"cpus": -1}}})
+
+
+def test_null_keys_are_treated_as_absent():
+    """
+    Test that optional keys left empty in the YAML, which load as None, take their default values.
+    """
+    script = {"task": {"command": "echo", "arguments": None, "dependencies": None, "enabled": None, "timeout": None}}
+    validate_script(script)
+    task = get_all_tasks(script)["task"]
+    assert (task.arguments, task.dependencies, task.enabled, task.timeout) == ({}, [], True, None)
+    with pytest.raises(ValueError, match="missing required key 'command'"):
+        validate_script({"task": {"command": None}})
+
+
+def test_scheduler_drops_dependents_of_failed_task(diamond_graph, capsys):
+    """
+    Test that a failed task transitively drops every task depending on it.
+    """
+    scheduler = Scheduler(diamond_graph)
+    drain(scheduler)
+    scheduler.task_finished(diamond_graph.ids["write"], False)
+
+    assert drain(scheduler) == []
+    assert scheduler.unfinished == 0
+    assert "Task 'testing' depends on incomplete task 'write'" in capsys.readouterr().out
+
+
+def test_task_graph_orders_forward_dependencies():
+    """
+    Test that a dependency declared later in the script is still scheduled first.
+    """
+    graph = compile_script({
+        "deploy": {"command": "true", "dependencies": ["build"]},
+        "build": {"command": "true"},
+    })
+
+    assert [graph.tasks[task_id].name for task_id in graph.order] == ["build", "deploy"]
+    assert list(graph.dependents_of(graph.ids["build"])) == [graph.ids["deploy"]]
+    assert list(graph.dependencies_of(graph.ids["deploy"])) == [graph.ids["build"]]
+    assert list(graph.indegree) == [1, 0]
+
+
+def test_task_graph_rejects_unknown_dependency():
+    """
+    Test raising an error for a task with a non-existent dependency.
+    """
+    with pytest.raises(ValueError) as excinfo:
+        compile_script({"task1": {"command": "true", "dependencies": ["non_existent_task"]}})
+
+    assert "Task 'task1' has an invalid dependency: 'non_existent_task'" in str(excinfo.value)
+
+
+def test_task_graph_rejects_cycles():
+    """
+    Test raising an error naming the tasks of a dependency cycle.
+    """
+    with pytest.raises(ValueError) as excinfo:
+        compile_script({
+            "setup": {"command": "true"},
+            "a": {"command": "true", "dependencies": ["setup", "c"]},
+            "b": {"command": "true", "dependencies": ["a"]},
+            "c": {"command": "true", "dependencies": ["b"]},
+        })
+
+    assert "form a dependency cycle" in str(excinfo.value)
+    assert all(f"'{name}'" in str(excinfo.value) for name in ("a", "b", "c"))
+    assert "'setup'" not in str(excinfo.value)
+
+
+def test_task_graph_schedules_long_chains():
+    """
+    Test compiling and scheduling a generated chain of 100k tasks.
+    """
+    count = 100_000
+    script = {f"task{i}": {"command": "true", "dependencies": [f"task{i - 1}"] if i else []} for i in range(count)}
+    scheduler = Scheduler(compile_script(script))
+
+    executed = 0
+    while (task_id := scheduler.next_ready()) is not None:
+        scheduler.task_finished(task_id, True)
+        executed += 1
+
+    assert executed == count
+
+
+MATRIX_SCRIPT = """
+build:
+  command: make OS={os}
+  matrix:
+    os: [linux, mac]
+test:
+  command: run_tests --os {os} --python {python}
+  matrix:
+    os: [linux, mac]
+    python: ["3.11", "3.12"]
+  dependencies: ["build[{os}]"]
+report:
+  command: report
+  dependencies: [test]
+"""
+
+
+def test_task_graph_expands_matrices_lazily(tmp_path, capsys):
+    """
+    Test that matrix cells are numbered without being stored, depend on the cells their templates
+    name, and that a target cell only pulls in its own dependencies.
+    """
+    (tmp_path / "script.yaml").write_text(MATRIX_SCRIPT)
+    graph = load_script(str(tmp_path / "script.yaml"))
+
+    assert len(graph) == 7
+    assert len(graph.tasks.definitions) == 3
+    names = [task.name for task in graph.tasks]
+    assert names == ["build[linux]", "build[mac]", "test[linux,3.11]", "test[linux,3.12]",
+                     "test[mac,3.11]", "test[mac,3.12]", "report"]
+    cell = graph.tasks[graph.ids["test[mac,3.11]"]]
+    assert cell.command.format(**cell.arguments) == "run_tests --os mac --python 3.11"
+    assert [names[i] for i in graph.dependencies_of(graph.ids["test[mac,3.11]"])] == ["build[mac]"]
+    assert len(graph.dependencies_of(graph.ids["report"])) == 4
+    assert "test[bsd,3.11]" not in graph.ids
+
+    reloaded = load_script(str(tmp_path / "script.yaml"))
+    assert "loaded from its compiled plan" in capsys.readouterr().out
+    assert [task.name for task in reloaded.tasks] == names
+
+    single = load_script(str(tmp_path / "script.yaml"), plan_cache=False, targets=["test[mac,3.12]"])
+    assert sorted(task.name for task in single.tasks) == ["build[mac]", "test[mac,3.12]"]
+
+
+def test_validate_script_rejects_invalid_matrices():
+    """
+    Test that matrices need distinct values, and dependency, input and output templates using only their parameters.
+    """
+    with pytest.raises(ValueError, match="invalid data type for 'matrix'"):
+        validate_script({"sweep": {"command": "true", "matrix": {"n": []}}})
+    with pytest.raises(ValueError, match="invalid values for matrix parameter 'n'"):
+        validate_script({"sweep": {"command": "true", "matrix": {"n": [1, "1"]}}})
+    with pytest.raises(ValueError, match="invalid dependency template 'build\\[{os}\\]'"):
+        validate_script({"sweep": {"command": "true", "matrix": {"n": [1]}, "dependencies": ["build[{os}]"]}})
+    with pytest.raises(ValueError, match="invalid output template 'out-{n'"):
+        validate_script({"sweep": {"command": "true", "matrix": {"n": [1]}, "outputs": ["out-{n"]}})
+    with pytest.raises(ValueError, match="invalid input template 'in-{size}.txt'"):
+        validate_script({"sweep": {"command": "true", "matrix": {"n": [1]}, "inputs": ["in-{size}.txt"]}})
+
+
+BATCH_TOOL = """
+import os, sys
+with open("invocations", "a") as invocations:
+    invocations.write(" ".join(sys.argv[1:]) + "\\n")
+for argument in sys.argv[1:]:
+    print(f"square {int(argument) ** 2}")
+    print(f"checked {argument}", file=sys.stderr)
+    code = 3 if argument == "7" else 0
+    print(os.environ["EXECUTOR_BATCH_DELIMITER"], code, flush=True)
+    print(os.environ["EXECUTOR_BATCH_DELIMITER"], code, file=sys.stderr, flush=True)
+"""
+
+
+def test_execute_script_batches_tasks_sharing_a_template(tmp_path, monkeypatch, capsys):
+    """
+    Test that ready tasks sharing a batched command template run in invocations of at most 'size'
+    tasks, with exit codes and output attributed back to each task.
+    """
+    (tmp_path / "tool.py").write_text(BATCH_TOOL)
+    (tmp_path / "script.yaml").write_text("""
+square:
+  command: python tool.py {n}
+  matrix:
+    n: [1, 2, 3, 4, 5, 6, 7, 8]
+  batch:
+    size: 3
+""")
+    monkeypatch.chdir(tmp_path)
+
+    assert not execute_script("script.yaml", {"no_stop": True, "jobs": 1})
+    out = capsys.readouterr().out
+    assert (tmp_path / "invocations").read_text().splitlines() == ["1 2 3", "4 5 6", "7 8"]
+    assert out.count("started with a single command") == 3
+    assert "Task 'square[7]' failed with exit code 3." in out
+    assert "Error output:\nchecked 7\n" in out
+    assert "Task 'square[8]' completed successfully." in out
+
+    log = read_log(tmp_path / "log")
+    assert "** Task: square[2] finished with exit code 0 **" in log
+    assert "** Task: square[7] finished with exit code 3 **" in log
+    assert "   [square[5]:stdout] square 25\n" in log
+    assert "   [square[5]:stderr] checked 5\n" in log
+    assert "EXECUTOR" not in log and "--executor-batch-" not in log
+
+
+def test_execute_script_reruns_tasks_a_batch_did_not_report(tmp_path, monkeypatch, capsys):
+    """
+    Test that tasks left without a delimiter line by a batched command run again on their own.
+    """
+    (tmp_path / "first.py").write_text(
+        "import sys\nopen('computed', 'a').write(sys.argv[1] + '\\n')\nsys.exit(sys.argv[1] == '3')\n")
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: python first.py {n}
+  matrix:
+    n: [1, 2, 3, 4]
+  batch: true
+""")
+    monkeypatch.chdir(tmp_path)
+
+    assert not execute_script("script.yaml", {"no_stop": True, "jobs": 1})
+    out = capsys.readouterr().out
+    assert "without reporting 4 of its 4 tasks, running them on their own." in out
+    assert sorted((tmp_path / "computed").read_text().split()) == ["1", "1", "2", "3", "4"]
+    assert "Task 'first[2]' completed successfully." in out
+    assert "Task 'first[3]' failed with exit code 1." in out
+    assert "** Task: first[4] not reported by the batched command **" in read_log(tmp_path / "log")
+
+
+def test_validate_script_rejects_invalid_batches():
+    """
+    Test that only commands ending with argument words after their first word can be batched, within positive limits.
+    """
+    validate_script({"square": {"command": "python tool.py {n}", "arguments": {"n": 1}, "batch": {"size": 10}}})
+    with pytest.raises(ValueError, match="invalid value for 'batch'"):
+        validate_script({"square": {"command": "python tool.py {n}", "batch": {"size": 0}}})
+    with pytest.raises(ValueError, match="needs a placeholder after the first word"):
+        validate_script({"square": {"command": "{program} 1", "batch": True}})
+    validate_script({"square": {"command": "python tool.py --size={n} {m}", "arguments": {"n": 1, "m": 2}, "batch": True}})
+    with pytest.raises(ValueError, match="must end with argument words holding placeholders"):
+        validate_script({"square": {"command": "python tool.py {n} > out.txt", "batch": True}})
+    with pytest.raises(ValueError, match="must end with argument words holding placeholders"):
+        validate_script({"square": {"command": "python tool.py {n} --verbose", "batch": True}})
+    with pytest.raises(ValueError, match="must end with argument words holding placeholders"):
+        validate_script({"square": {"command": "python tool.py {n} && echo done", "batch": True}})
+    with pytest.raises(ValueError, match="cannot be batched with 'cache' set"):
+        validate_script({"square": {"command": "python tool.py {n}", "batch": True, "cache": True}})
+
+
+def test_execute_script_runs_independent_tasks_in_parallel(tmp_path, monkeypatch):
+    """
+    Test that independent tasks overlap when more than one job is allowed.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "parallel.yaml").write_text("""
+first:
+  command: sleep 0.5
+second:
+  command: sleep 0.5
+""")
+    monkeypatch.chdir(tmp_path)
+
+    start = time.monotonic()
+    execute_script("parallel.yaml", {"jobs": 2})
+    assert time.monotonic() - start < 0.9
+
+
+def test_execute_script_rejects_invalid_jobs(tmp_path, monkeypatch):
+    """
+    Test that a number of jobs below 1 is an error instead of the default or an empty schedule.
+    """
+    (tmp_path / "script.yaml").write_text("only:\n  command: \"true\"\n")
+    monkeypatch.chdir(tmp_path)
+    for jobs in (0, -2, 1.5):
+        with pytest.raises(ValueError, match="Invalid number of jobs"):
+            execute_script("script.yaml", {"jobs": jobs})
+    with pytest.raises(ValueError, match="Invalid number of jobs"):
+        plan_script("script.yaml", {"jobs": 0})
+
+    result = subprocess.run([sys.executable, executor.__file__, "script.yaml", "-j", "0"], capture_output=True, text=True)
+    assert result.returncode == 2 and "invalid positive integer '0'" in result.stderr
+
+
+def test_execute_script_async_can_be_awaited(tmp_path, monkeypatch, capsys):
+    """
+    Test awaiting the script execution from an event loop owned by the caller.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+write:
+  command: echo done > out.txt
+read:
+  command: cat out.txt
+  dependencies:
+    - write
+""")
+    monkeypatch.chdir(tmp_path)
+
+    async def service():
+        await asyncio.gather(execute_script_async("script.yaml", {}), asyncio.sleep(0))
+
+    asyncio.run(service())
+
+    out = capsys.readouterr().out
+    assert "Task 'write' completed successfully." in out
+    assert "Task 'read' completed successfully." in out
+
+
+def test_log_writer_batches_whole_records(tmp_path):
+    """
+    Test that the records of tasks logging in turns are written whole, in the order the tasks finished.
+    """
+    log_path = tmp_path / "executor_log.txt"
+    with LogWriter(str(log_path), flush_interval=60) as log_writer:
+        log_writer.write("** Task: a **\n", "a")
+        log_writer.write("** Task: b **\n", "b")
+        log_writer.write("   [a:stdout] first\n", "a")
+        log_writer.write("** Task: b done **\n", "b", last=True)
+        log_writer.write("no task\n")
+        log_writer.write("** Task: c **\n", "c")
+        log_writer.write("** Task: a done **\n", "a", last=True)
+        assert log_path.read_text() == ""  # Nothing is written before the flush interval or the size is reached
+
+    assert log_path.read_text() == ("** Task: b **\n** Task: b done **\n"
+                                    "no task\n"
+                                    "** Task: a **\n   [a:stdout] first\n** Task: a done **\n"
+                                    "** Task: c **\n")
+
+
+def test_log_writer_flushes_on_size(tmp_path):
+    """
+    Test that pending records are written as soon as the size threshold is reached, long before the flush interval.
+    """
+    log_path = tmp_path / "executor_log.txt"
+    with LogWriter(str(log_path), flush_interval=60, flush_size=10) as log_writer:
+        log_writer.write("0123456789\n")
+        deadline = time.monotonic() + 10
+        while log_path.read_text() == "" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert log_path.read_text() == "0123456789\n"
+
+
+def test_log_store_indexes_task_records(tmp_path, capsys):
+    """
+    Test that the log store keeps one record per task and run, even when tasks log in turns,
+    and prints the latest record of a task.
+    """
+    for run in range(2):
+        with LogStore(str(tmp_path)) as store:
+            store.write("** Task: a **\n", "a")
+            store.write("** Task: b **\n", "b")
+            store.write(f"   [a:stdout] run {run}\n", "a")
+            store.write("** Task: b done **\n", "b", last=True)
+            store.write("** Task: a done **\n", "a", last=True)
+
+    store = LogStore(str(tmp_path))
+    assert sorted((record["run"], record["task"]) for record in store.find()) == [(1, "a"), (1, "b"), (2, "a"), (2, "b")]
+    assert [record["run"] for record in store.find("a")] == [1, 2]
+    assert print_logs(store, "a") == 1
+    assert capsys.readouterr().out == "** Task: a **\n   [a:stdout] run 1\n** Task: a done **\n"
+
+    with LogStore(str(tmp_path)) as store:  # Hedged copies of a task, logging at the same time
+        store.write("first copy\n", "c", attempt=1)
+        store.write("second copy\n", "c", attempt=2)
+        store.write("second done\n", "c", True, attempt=2)
+        store.write("first cancelled\n", "c", True, attempt=1)
+    assert [store.read(record) for record in store.find("c")] == ["first copy\nfirst cancelled\n",
+                                                                  "second copy\nsecond done\n"]
+
+
+def test_log_store_rotates_segments(tmp_path, monkeypatch):
+    """
+    Test that full segments are left for new ones, and that the oldest are deleted with their
+    index entries once the store is too big.
+    """
+    monkeypatch.setattr(executor, "LOG_SEGMENT_SIZE", 1)
+    for run in range(3):
+        with LogStore(str(tmp_path)) as store:
+            store.write(f"run {run}\n", "task", last=True)
+    store = LogStore(str(tmp_path))
+    assert store.segments() == [1, 2, 3]
+    assert [store.read(record) for record in store.find("task")] == ["run 0\n", "run 1\n", "run 2\n"]
+
+    monkeypatch.setattr(executor, "LOG_MAX_SIZE", 0)
+    with LogStore(str(tmp_path)) as store:
+        store.write("run 3\n", "task", last=True)
+    assert store.segments() == [4]
+    assert [store.read(record) for record in store.find("task")] == ["run 3\n"]
+
+
+def test_log_store_rotates_segments_by_age(tmp_path):
+    """
+    Test that a segment is left for a new one once its first record is LOG_SEGMENT_AGE old, however
+    recently records were appended to it.
+    """
+    for run in range(2):
+        with LogStore(str(tmp_path)) as store:
+            store.write(f"run {run}\n", "task", last=True)
+    assert store.segments() == [1]
+
+    connection = store.connect()
+    with connection:
+        connection.execute("UPDATE segments SET created = created - ?", (executor.LOG_SEGMENT_AGE,))
+    connection.close()
+    with LogStore(str(tmp_path)) as store:
+        store.write("run 2\n", "task", last=True)
+    assert store.segments() == [1, 2]
+    assert [store.read(record) for record in store.find("task")] == ["run 0\n", "run 1\n", "run 2\n"]
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    """
+    Test that eviction removes the least recently used entries first, until the cache fits.
+    """
+    cache = ResultCache(str(tmp_path / "cache"), max_size=1)
+    for age, key in enumerate(["aa01", "bb02", "cc03"]):
+        staging = cache.stage()
+        for stream in ("stdout", "stderr"):
+            (tmp_path / staging / stream).write_bytes(b"x" * 400 * 1024)
+        cache.store(key, staging, 0, str(tmp_path), [])
+        os.utime(os.path.join(cache.entry(key), "result.json"), (age, age))
+    assert cache.restore("aa01", str(tmp_path))  # Marks the oldest entry as used
+
+    cache.evict()
+
+    assert os.path.isdir(cache.entry("aa01"))
+    assert not os.path.isdir(cache.entry("bb02"))
+    assert not os.path.isdir(cache.entry("cc03"))
+
+
+def test_execute_script_skips_up_to_date_tasks(tmp_path, monkeypatch, capsys):
+    """
+    Test that up to date tasks are skipped, unless one of their dependencies reran.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+generate:
+  command: echo data > generated.txt
+  inputs: [source.txt]
+  outputs: [generated.txt]
+package:
+  command: cp generated.txt package.txt
+  inputs: [generated.txt]
+  outputs: [package.txt]
+  dependencies: [generate]
+""")
+    (tmp_path / "source.txt").write_text("source")
+    os.utime(tmp_path / "source.txt", (1, 1))
+    monkeypatch.chdir(tmp_path)
+
+    execute_script("script.yaml", {})
+    assert "Task 'package' completed successfully." in capsys.readouterr().out
+
+    execute_script("script.yaml", {})
+    out = capsys.readouterr().out
+    assert "Task 'generate' is up to date." in out
+    assert "Task 'package' is up to date." in out
+
+    (tmp_path / "generated.txt").unlink()
+    execute_script("script.yaml", {})
+    out = capsys.readouterr().out
+    assert "Task 'generate' completed successfully." in out
+    assert "Task 'package' completed successfully." in out  # Its dependency reran
+
+
+def test_execute_script_skips_up_to_date_matrix_cells(tmp_path, monkeypatch, capsys):
+    """
+    Test that every cell of a matrix is checked against its own inputs and outputs, and that a task
+    depending on the whole matrix runs again when one of its cells did.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+copy:
+  command: cp in-{n}.txt out-{n}.txt
+  inputs: ["in-{n}.txt"]
+  outputs: ["out-{n}.txt"]
+  matrix:
+    n: [1, 2]
+pack:
+  command: cat out-1.txt out-2.txt > packed.txt
+  outputs: [packed.txt]
+  dependencies: [copy]
+""")
+    for n in (1, 2):
+        (tmp_path / f"in-{n}.txt").write_text(str(n))
+        os.utime(tmp_path / f"in-{n}.txt", (1, 1))
+    monkeypatch.chdir(tmp_path)
+
+    execute_script("script.yaml", {})
+    assert (tmp_path / "out-2.txt").read_text() == "2"
+    capsys.readouterr()
+
+    (tmp_path / "in-2.txt").write_text("changed")
+    execute_script("script.yaml", {})
+    out = capsys.readouterr().out
+    assert "Task 'copy[1]' is up to date." in out
+    assert "Task 'copy[2]' completed successfully." in out
+    assert (tmp_path / "out-2.txt").read_text() == "changed"
+    assert "Task 'pack' completed successfully." in out
+    assert (tmp_path / "packed.txt").read_text() == "1changed"
+
+
+def test_execute_script_traces_tasks(tmp_path, monkeypatch):
+    """
+    Test that every executed task is traced with its resource usage and exported as Chrome trace events.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: sleep 0.2
+second:
+  command: sleep 0.2
+last:
+  command: exit 3
+  dependencies: [first, second]
+""")
+    monkeypatch.chdir(tmp_path)
+
+    execute_script("script.yaml", {"jobs": 2, "trace_file": "trace.jsonl", "no_stop": True})
+    records = {record["task"]: record for record in map(json.loads, open("trace.jsonl"))}
+
+    assert sorted(records) == ["first", "last", "second"]
+    assert records["last"]["retcode"] == 3
+    assert records["first"]["wall"] >= 0.2
+    assert records["first"]["max_rss_kb"] > 0
+    assert records["first"]["spawn_latency"] < records["first"]["wall"]
+
+    parallelism = export_chrome_trace("trace.jsonl", "trace.json")
+    events = {event["name"]: event for event in json.load(open("trace.json"))["traceEvents"]}
+    assert {events["first"]["tid"], events["second"]["tid"]} == {0, 1}  # Ran side by side
+    assert events["last"]["ts"] >= events["first"]["ts"] + events["first"]["dur"]
+    assert parallelism > 1
+
+    execute_script("script.yaml", {"trace_file": "trace.jsonl", "targets": ["first"], "plan_cache": False})
+    assert [json.loads(line)["task"] for line in open("trace.jsonl")] == ["first"]  # Only the latest run
+
+
+def test_run_history_averages_and_compacts_runs(tmp_path, monkeypatch):
+    """
+    Test that the expected duration averages the latest successful runs, and that old runs are compacted.
+    """
+    monkeypatch.setattr("executor.HISTORY_RUNS", 10)
+    database = str(tmp_path / "history.db")
+    history = RunHistory(database, "script.yaml")
+    for seconds in range(1, 21):
+        history.record("build", float(seconds))
+    history.record("build", 100.0, retcode=1)
+    history.record("build", 0.01, cached=True)
+    history.record("test", 2.0, output_size=123)
+    history.save()
+
+    history = RunHistory(database, "script.yaml").load()
+    assert history.durations == {"build": pytest.approx(18.0), "test": 2.0}  # Average of runs 16 to 20
+    assert RunHistory(database, "other.yaml").load().durations == {}
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM runs WHERE task = 'build'").fetchone()[0] == 10
+        assert connection.execute("SELECT output_size FROM runs WHERE task = 'test'").fetchone()[0] == 123
+
+
+def test_execute_script_records_durations_for_plan(tmp_path, monkeypatch, capsys):
+    """
+    Test that task durations are recorded next to the script and used by the plan.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+fast:
+  command: "true"
+slow:
+  command: sleep 0.3
+last:
+  command: "true"
+  dependencies: [fast, slow]
+""")
+    monkeypatch.chdir(tmp_path)
+
+    execute_script("script.yaml", {"jobs": 1})
+    history = RunHistory(script_file="script.yaml").load()
+    assert sorted(history.durations) == ["fast", "last", "slow"]
+    assert history.durations["slow"] >= 0.3
+
+    capsys.readouterr()
+    makespan = plan_script("script.yaml", {"jobs": 2})
+    out = capsys.readouterr().out
+    path = out.split("Critical path")[1].splitlines()
+    assert [line.split()[0] for line in path[1:3]] == ["slow", "last"]
+    assert "Estimated makespan with 2 jobs" in out
+    assert history.durations["slow"] <= makespan < sum(history.durations.values()) + 0.01
+
+
+def test_execute_script_prints_eta_from_history_without_cached_runs(tmp_path, monkeypatch, capsys):
+    """
+    Test that completed tasks report the remaining time expected from the history, and that runs
+    restored from the result cache leave the recorded durations alone.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: sleep 0.3
+  cache: true
+second:
+  command: sleep 0.2
+  dependencies: [first]
+""")
+    monkeypatch.chdir(tmp_path)
+    context = {"jobs": 1, "cache_dir": str(tmp_path / "cache")}
+
+    execute_script("script.yaml", context)
+    durations = RunHistory(script_file="script.yaml").load().durations
+    assert durations["first"] >= 0.3
+    capsys.readouterr()
+
+    execute_script("script.yaml", context)
+    out = capsys.readouterr().out
+    assert "Task 'first' restored from cache." in out
+    assert f"Task 'first' completed successfully. [1/2, ETA {durations['second']:.1f}s]" in out
+    assert "Task 'second' completed successfully. [2/2, ETA 0.0s]" in out
+    assert RunHistory(script_file="script.yaml").load().durations["first"] == pytest.approx(durations["first"])
+
+
+def test_execute_script_runs_python_tasks_in_pool(tmp_path, monkeypatch, capsys):
+    """
+    Test that python-pool tasks run in warm workers with their own argv, directory and exit code,
+    and that workers are recycled.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "report.py").write_text(
+        "import os, sys\nprint(sys.argv, os.path.basename(os.getcwd()))\nsys.exit(int(sys.argv[1]))\n")
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: python report.py 0
+  runner: python-pool
+  test_dir: sub
+second:
+  command: python report.py 0
+  runner: python-pool
+  test_dir: sub
+third:
+  command: python report.py 4
+  runner: python-pool
+  test_dir: sub
+redirected:
+  command: python report.py 0 > out.txt
+  runner: python-pool
+  test_dir: sub
+""")
+    monkeypatch.chdir(tmp_path)
+
+    execute_script("script.yaml", {"jobs": 1, "no_stop": True, "pool_recycle": 2, "trace_file": "trace.jsonl"})
+    out = capsys.readouterr().out
+    assert "Task 'third' failed with exit code 4." in out
+    assert "Task 'redirected' completed successfully." in out
+    assert (tmp_path / "sub" / "out.txt").read_text() == "['report.py', '0'] sub\n"  # Ran by the shell
+    assert "[first:stdout] ['report.py', '0'] sub" in read_log(tmp_path / "log")
+
+    pids = {record["task"]: record["pid"] for record in map(json.loads, open("trace.jsonl"))}
+    assert pids["first"] == pids["second"] != pids["third"]
+
+
+def test_python_pool_leaves_other_interpreters_to_the_shell(tmp_path, monkeypatch, capsys):
+    """
+    Test that a python-pool task whose 'python' on the PATH is not the executor's interpreter runs through the shell.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "python").write_text(f"#!/bin/sh\ntouch wrapped\nexec {sys.executable} \"$@\"\n")
+    (tmp_path / "bin" / "python").chmod(0o755)
+    (tmp_path / "report.py").write_text("print('reported')\n")
+    (tmp_path / "script.yaml").write_text("""
+report:
+  command: python report.py
+  runner: python-pool
+""")
+    monkeypatch.chdir(tmp_path)
+
+    env = dict(os.environ, PATH=f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    assert execute_script("script.yaml", {"env": env})
+    assert (tmp_path / "wrapped").exists()
+    assert "[report:stdout] reported" in read_log(tmp_path / "log")
+
+    with patch.object(sys, "frozen", True, create=True):
+        assert execute_script("script.yaml", {"trace_file": "trace.jsonl"})
+    assert "Task 'report' completed successfully." in capsys.readouterr().out
+    assert json.loads(open("trace.jsonl").read())["user_cpu"] is not None  # A child of its own, not a pool worker
+
+
+def test_direct_command_skips_shell_only_when_safe(tmp_path):
+    """
+    Test that only commands without shell syntax or builtins are executed without a shell, unless forced.
+    """
+    program, argv = direct_command("ls -l  /tmp")
+    assert os.path.basename(program) == "ls" and argv == ["ls", "-l", "/tmp"]
+
+    assert direct_command("ls *.txt") is None
+    assert direct_command("echo done > out.txt") is None
+    assert direct_command("cd /tmp") is None
+    assert direct_command("no-such-program-here") is None  # The shell reports it
+    assert direct_command("ls /tmp", shell=True) is None
+    assert direct_command("echo 'a b'", shell=False)[1] == ["echo", "a b"]
+
+    (tmp_path / "tool").write_text("#!/bin/sh\n")
+    (tmp_path / "tool").chmod(0o755)
+    assert direct_command("./tool x", str(tmp_path)) == (os.path.join(str(tmp_path), "./tool"), ["./tool", "x"])
+
+
+def test_task_reports_missing_program_without_shell(tmp_path, monkeypatch, capsys):
+    """
+    Test that a task forced to run without a shell fails like the shell would when its program is missing.
+    """
+    (tmp_path / "log").mkdir()
+    task = Task("missing", "no-such-program-here --version", test_dir=str(tmp_path), shell=False)
+    monkeypatch.chdir(tmp_path)
+    retcode, output, error = task.execute({})
+    assert retcode == 127
+    assert "could not be started" in capsys.readouterr().out
+
+
+def test_task_timeout_kills_process_group(tmp_path, monkeypatch, capsys):
+    """
+    Test that a task running past its timeout is killed together with the processes it started.
+    """
+    (tmp_path / "log").mkdir()
+    task = Task("hung", "sleep 30 & sleep 30; wait", test_dir=str(tmp_path), timeout=0.3)
+    monkeypatch.chdir(tmp_path)
+    start = time.perf_counter()
+    retcode, output, error = task.execute({})
+    assert retcode == 124
+    assert time.perf_counter() - start < 5  # The background sleep holding the pipe was killed too
+    assert "Task 'hung' timed out after 0.3 seconds." in capsys.readouterr().out
+
+
+def test_cancelled_task_kills_process_group(tmp_path, monkeypatch):
+    """
+    Test that cancelling a task without a timeout kills the processes its shell started as well.
+    """
+    (tmp_path / "log").mkdir()
+    task = Task("stale", "sleep 37 & echo $! > child.pid; wait; echo done", test_dir=str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        run = asyncio.create_task(task.execute_async({}))
+        while not (tmp_path / "child.pid").exists() or not (tmp_path / "child.pid").read_text().strip():
+            await asyncio.sleep(0.01)
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+    asyncio.run(scenario())
+
+    stat = f"/proc/{(tmp_path / 'child.pid').read_text().strip()}/stat"
+    deadline = time.monotonic() + 5
+    while os.path.exists(stat) and open(stat).read().rsplit(")", 1)[1].split()[0] != "Z":
+        assert time.monotonic() < deadline, "The background sleep survived the cancel"
+        time.sleep(0.01)
+
+
+def test_execute_script_stops_at_global_timeout(tmp_path, monkeypatch, capsys):
+    """
+    Test that the run timeout kills the running task and starts no other.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: sleep 30
+second:
+  command: sleep 30
+  dependencies: [first]
+""")
+    monkeypatch.chdir(tmp_path)
+
+    start = time.perf_counter()
+    execute_script("script.yaml", {"timeout": 0.3, "no_stop": True})
+    out = capsys.readouterr().out
+    assert time.perf_counter() - start < 5
+    assert "Task 'first' failed with exit code 124." in out
+    assert "Task 'second' command" not in out
+
+
+def test_execute_script_hedges_straggler(tmp_path, monkeypatch, capsys):
+    """
+    Test that a hedged task running past its p95 gets a second copy, and that the first copy to finish wins.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+flaky:
+  command: if [ -e started ]; then echo fast; else touch started; sleep 30; fi
+  hedge: true
+""")
+    monkeypatch.chdir(tmp_path)
+    history = RunHistory(script_file="script.yaml")
+    for _ in range(5):
+        history.record("flaky", 0.2)
+    history.save()
+
+    start = time.perf_counter()
+    execute_script("script.yaml", {})
+    out = capsys.readouterr().out
+    assert time.perf_counter() - start < 5
+    assert "Task 'flaky' is running longer than 0.20 seconds, starting a second copy." in out
+    assert "Task 'flaky' finished first in its second copy." in out
+    assert "Task 'flaky' completed successfully." in out
+
+
+@pytest.fixture
+def announced_address(capsys):
+    """
+    Returns a coroutine function waiting until a server started on port 0 prints the address it listens on.
+    """
+    async def wait(prefix, timeout=10):
+        deadline = time.monotonic() + timeout
+        printed = ""
+        while not (match := re.search(rf"^{prefix} on (\S+)\.$", printed, re.MULTILINE)):
+            assert time.monotonic() < deadline, f"Nothing printed '{prefix} on HOST:PORT.'"
+            await asyncio.sleep(0.01)
+            printed += capsys.readouterr().out
+        sys.stdout.write(printed)  # Left for the test to read
+        return match[1]
+    return wait
+
+
+def test_coordinator_runs_tasks_on_workers(tmp_path, monkeypatch, capsys, announced_address):
+    """
+    Test that tasks run on the registered workers, streaming their logs to the coordinator, and that
+    workers with a wrong token are turned away.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+first:
+  command: echo one
+second:
+  command: echo two
+last:
+  command: exit 3
+  dependencies: [first, second]
+""")
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        run = asyncio.create_task(
+            execute_script_async("script.yaml", {"coordinator": "127.0.0.1:0", "token": "secret", "no_stop": True}))
+        address = await announced_address("Coordinator listening")
+        await asyncio.gather(
+            run,
+            run_worker(address, 1, {}, "wrong"),
+            run_worker(address, 1, {}, "secret"),
+            run_worker(address, 1, {}, "secret"))
+    asyncio.run(scenario())
+
+    out = capsys.readouterr().out
+    assert out.count("joined with 1 slots.") == 2
+    assert "Task 'second' completed successfully." in out
+    assert "Task 'last' failed with exit code 3." in out
+    assert "[first:stdout] one" in read_log(tmp_path / "log")
+
+
+def test_coordinator_turns_away_unsafe_setups(capsys):
+    """
+    Test that a coordinator needs a token to listen beyond the loopback, and rejects workers with invalid slots.
+    """
+    with pytest.raises(ValueError, match="without a token"):
+        Coordinator("0.0.0.0:7070", None)
+
+    async def scenario():
+        coordinator = Coordinator("127.0.0.1:0", None)
+        await coordinator.start()
+        port = coordinator.server.sockets[0].getsockname()[1]
+        for slots in ("many", 0, None):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await send_message(writer, {"type": "hello", "name": "bad", "slots": slots})
+            assert await reader.read() == b""  # Disconnected
+            writer.close()
+        await coordinator.close()
+        return coordinator.workers
+    assert asyncio.run(scenario()) == []
+    assert capsys.readouterr().out.count("Worker 'bad' rejected: invalid number of slots") == 3
+
+
+def test_coordinator_requeues_tasks_of_lost_worker(tmp_path, monkeypatch, capsys, announced_address):
+    """
+    Test that a task running on a worker that dies is run again on another worker.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "script.yaml").write_text("""
+build:
+  command: if [ -e started ]; then echo resumed; else touch started; sleep 30; fi
+""")
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        run = asyncio.create_task(execute_script_async("script.yaml", {"coordinator": "127.0.0.1:0"}))
+        address = await announced_address("Coordinator listening")
+        worker = subprocess.Popen([sys.executable, executor.__file__, "--worker", address, "-j", "1"],
+                                  cwd=tmp_path, stdout=subprocess.DEVNULL, start_new_session=True)
+        while not (tmp_path / "started").exists():
+            await asyncio.sleep(0.05)
+        os.killpg(worker.pid, signal.SIGKILL)
+        await asyncio.to_thread(worker.wait)
+        await asyncio.gather(run, run_worker(address, 1, {}))
+    asyncio.run(scenario())
+
+    out = capsys.readouterr().out
+    assert "was lost while running task 'build', queueing it again." in out
+    assert "Task 'build' completed successfully." in out
+    assert "[build:stdout] resumed" in read_log(tmp_path / "log")
+
+
+def test_event_bus_publishes_task_events_and_throttles_output(tmp_path, monkeypatch, announced_address):
+    """
+    Test that a client of the event bus receives the graph and the events of every task in order,
+    with the output of a loud task coalesced and trimmed instead of sent line by line.
+    """
+    (tmp_path / "loud.py").write_text("for i in range(20000):\n    print(f'{i:>99}')\n")
+    (tmp_path / "script.yaml").write_text("""
+loud:
+  command: python loud.py
+quiet:
+  command: echo ok
+  dependencies: [loud]
+""")
+    monkeypatch.chdir(tmp_path)
+    run = threading.Thread(target=execute_script, args=("script.yaml", {"events": "127.0.0.1:0", "events_wait": 10}))
+    run.start()
+    events = list(read_events(asyncio.run(announced_address("Publishing events"))))
+    run.join()
+
+    assert events[0]["type"] == "run"
+    assert events[0]["tasks"] == [{"name": "loud", "dependencies": []}, {"name": "quiet", "dependencies": [0]}]
+    assert events[-1]["type"] == "done" and events[-1]["succeeded"]
+    for name in ("loud", "quiet"):
+        types = [event["type"] for event in events if event.get("task") == name and event["type"] != "output"]
+        assert types == ["queued", "started", "finished"]
+    finished = next(event for event in events if event["type"] == "finished" and event["task"] == "loud")
+    assert finished["retcode"] == 0 and finished["duration"] > 0
+
+    output = [event for event in events if event["type"] == "output" and event["task"] == "loud"]
+    assert sum(len(event["text"]) for event in output) < 2_000_000 / 2
+    assert sum(event["skipped"] for event in output) > 0
+    assert "** Task: loud finished with exit code 0 **" in output[-1]["text"]
+    assert any("[quiet:stdout] ok" in event["text"] for event in events if event["type"] == "output" and event["task"] == "quiet")
+
+
+def test_daemon_keeps_plans_and_pool_between_submissions(tmp_path, monkeypatch, capsys):
+    """
+    Test that scripts submitted to the daemon stream their output back, reuse the plan compiled for
+    the first submission and run on the same warm Python pool worker, with the environment of the client.
+    The worker is only started by the first python-pool task, and only the owner may use the socket.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "pid.py").write_text("import os\nprint(os.environ.get('EXIT_CODE'), os.getpid())\n")
+    (tmp_path / "script.yaml").write_text("""
+pid:
+  command: python pid.py
+  runner: python-pool
+fail:
+  command: exit $EXIT_CODE
+  dependencies: [pid]
+""")
+    monkeypatch.chdir(tmp_path)
+    socket_path = str(tmp_path / "executor.sock")
+    workers = []
+    worker_class = executor.PythonWorker
+    monkeypatch.setattr(executor, "PythonWorker", lambda: workers.append(worker_class()) or workers[-1])
+
+    async def submit(code):
+        client = await asyncio.create_subprocess_exec(
+            sys.executable, executor.__file__, "script.yaml", "--daemon", "--socket", socket_path,
+            "--no-plan-cache", stdout=subprocess.PIPE, env=dict(os.environ, EXIT_CODE=str(code)))
+        out, _ = await client.communicate()
+        return client.returncode, out.decode()
+
+    async def scenario():
+        daemon = asyncio.create_task(serve(socket_path, {"pool_recycle": 10}))
+        while not os.path.exists(socket_path):
+            await asyncio.sleep(0.01)
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+        await asyncio.sleep(0.1)
+        assert workers == []
+        results = [await submit(0), await submit(2)]
+        daemon.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await daemon
+        return results
+
+    (first_code, first), (second_code, second) = asyncio.run(scenario())
+    assert first_code == 0 and "Task 'fail' completed successfully." in first
+    assert second_code == 1 and "Task 'fail' failed with exit code 2." in second
+    assert "reused from memory." in second
+    assert not os.path.exists(socket_path)
+    lines = [line.split()[-2:] for line in read_log(tmp_path / "log").splitlines()
+             if line.strip().startswith("[pid:stdout]")]
+    assert [code for code, _ in lines] == ["0", "2"]
+    assert len(lines) == 2 and lines[0][1] == lines[1][1]
+    assert len(workers) == 1
+
+
+WATCHED_SCRIPT = """
+generate:
+  command: cp source.txt generated.txt
+  inputs: [source.txt]
+  outputs: [generated.txt]
+use:
+  command: python helper.py generated.txt
+  dependencies: [generate]
+other:
+  command: echo other
+slow:
+  command: sleep {seconds}
+  inputs: [slow.txt]
+  arguments:
+    seconds: 30
+"""
+
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_watch_script_runs_only_affected_tasks(tmp_path, monkeypatch, capsys, polling):
+    """
+    Test that watch mode runs again only the tasks reading the changed files and their dependents,
+    and cancels a run the change made stale.
+    """
+    (tmp_path / "log").mkdir()
+    (tmp_path / "source.txt").write_text("one")
+    (tmp_path / "slow.txt").write_text("")
+    (tmp_path / "helper.py").write_text("import sys\nprint(open(sys.argv[1]).read())\n")
+    (tmp_path / "script.yaml").write_text(WATCHED_SCRIPT.replace("30", "0"))
+    monkeypatch.chdir(tmp_path)
+
+    async def wait_for(text):
+        out = ""
+        for _ in range(200):
+            out += capsys.readouterr().out
+            if text in out:
+                return out
+            await asyncio.sleep(0.05)
+        raise AssertionError(f"{text!r} not printed in:\n{out}")
+
+    async def scenario():
+        watch = asyncio.create_task(watch_script("script.yaml", {"plan_cache": False}, polling))
+        await wait_for("Watching")
+        (tmp_path / "helper.py").write_text("import sys\nprint(open(sys.argv[1]).read().upper())\n")
+        rerun = await wait_for("Watching")
+
+        (tmp_path / "source.txt").write_text("two")
+        regenerated = await wait_for("Watching")
+
+        (tmp_path / "script.yaml").write_text(WATCHED_SCRIPT)
+        await wait_for("Task 'slow' command: sleep 30")
+        (tmp_path / "slow.txt").write_text("changed")
+        stale = await wait_for("Task 'slow' command: sleep 30")
+        watch.cancel()
+        await asyncio.gather(watch, return_exceptions=True)
+        return rerun, regenerated, stale
+
+    rerun, regenerated, stale = asyncio.run(scenario())
+    assert "Running again: use." in rerun and "Task 'use' completed successfully." in rerun
+    assert "Task 'generate'" not in rerun and "Task 'other'" not in rerun
+    assert "Running again: generate." in regenerated
+    assert "Task 'generate' completed successfully." in regenerated and "Task 'use' completed successfully." in regenerated
+    assert "Task 'other'" not in regenerated and "Task 'slow'" not in regenerated
+    assert "Cancelling the current run, which the change made stale." in stale
+    log = read_log(tmp_path / "log")
+    assert "TWO" in log
+    assert "** Task: slow cancelled **" in log
+
+
+def test_load_script_reuses_compiled_plan(tmp_path, valid_script_content, capsys):
+    """
+    Test that an unchanged script is loaded from its compiled plan without being parsed again.
+    """
+    script_file = tmp_path / "test.yaml"
+    script_file.write_text(valid_script_content)
+    graph = load_script(str(script_file), "/first")
+    assert (tmp_path / ".test.yaml.plan").exists()
+
+    with patch("executor.read_script", side_effect=AssertionError("script parsed again")):
+        cached = load_script(str(script_file), "/second")
+
+    assert [task.name for task in cached.tasks] == [task.name for task in graph.tasks] == ["task1", "task2"]
+    assert list(cached.dependencies_of(1)) == [0]
+    assert cached.tasks[0].arguments == {"name": "world"}
+    assert cached.tasks[0].test_dir == "/second"
+    assert "loaded from its compiled plan" in capsys.readouterr().out
+
+
+def test_load_script_recompiles_changed_script(tmp_path, valid_script_content):
+    """
+    Test that editing the script invalidates its compiled plan.
+    """
+    script_file = tmp_path / "test.yaml"
+    script_file.write_text(valid_script_content)
+    load_script(str(script_file))
+
+    script_file.write_text(valid_script_content.replace("echo hello", "echo bye"))
+
+    assert load_script(str(script_file)).tasks[0].command == "echo bye"
+
+
+@pytest.fixture
+def included_scripts(tmp_path):
+    (tmp_path / "log").mkdir()
+    (tmp_path / "components" / "libs").mkdir(parents=True)
+    (tmp_path / "main.yaml").write_text("""
+include:
+  net: components/net.yaml
+  libs: components/libs
+app:
+  command: echo app
+  dependencies:
+    - net:build
+""")
+    (tmp_path / "components" / "net.yaml").write_text("""
+build:
+  command: pwd > net.txt
+  dependencies:
+    - fetch
+    - libs/zlib:build
+fetch:
+  command: echo fetch
+""")
+    (tmp_path / "components" / "libs" / "zlib.yaml").write_text("""
+build:
+  command: echo zlib
+""")
+    (tmp_path / "components" / "libs" / "unused.yaml").write_text("""
+build:
+  command: echo unused
+""")
+    return tmp_path
+
+
+def test_script_loader_reads_only_needed_includes(included_scripts):
+    """
+    Test that only the included files holding the targets and their dependencies are read.
+    """
+    loader = ScriptLoader(str(included_scripts / "main.yaml"))
+
+    script = loader.read(["net:build"])
+
+    assert set(script) == {"net:build", "net:fetch", "libs/zlib:build"}
+    assert script["net:build"]["dependencies"] == ["net:fetch", "libs/zlib:build"]
+    assert script["net:build"]["test_dir"] == "components"
+    assert "libs/unused" not in loader.scripts and "libs/unused" in loader.namespaces
+
+
+def test_execute_script_runs_included_tasks_in_their_directory(included_scripts, monkeypatch, capsys):
+    """
+    Test running a script with cross-file dependencies, every task in its own file's directory.
+    """
+    monkeypatch.chdir(included_scripts)
+
+    execute_script("main.yaml", {"targets": ["app"]})
+
+    out = capsys.readouterr().out
+    assert "Task 'app' completed successfully." in out
+    assert "Task 'libs/zlib:build' completed successfully." in out
+    assert "unused" not in out
+    assert (included_scripts / "components" / "net.txt").read_text() == f"{included_scripts / 'components'}\n"
@@ -1,10 +1,42 @@
 # test_task_class.py
 
+import asyncio
+import io
 import os
 import pytest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
-from executor import Task
+from executor import LogStore, ResultCache, Task
+
+
+def read_log(directory):
+    """
+    Returns the records of the log store in 'directory' in the plain-text format.
+    """
+    output = io.StringIO()
+    LogStore(str(directory)).export(output)
+    return output.getvalue()
+
+
+class FakeStream:
+    """
+    Minimal stand-in for asyncio.StreamReader returning the given chunks.
+    """
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+
+    async def read(self, n=-1):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def fake_process(returncode, output, error):
+    process = AsyncMock()
+    process.returncode = returncode
+    process.wait.return_value = returncode
+    process.rusage = None
+    process.stdout = FakeStream(output)
+    process.stderr = FakeStream(error)
+    return process
 
 
 @pytest.fixture
@@ -48,37 +80,148 @@ def test_task_with_dependencies(task_with_dependencies):
     assert task_with_dependencies.dependencies == ["dep1", "dep2"]
 
 
-@patch("subprocess.Popen")
-def test_task_execute_success(mock_popen, task_with_command):
+@patch("executor.spawn_process", new_callable=AsyncMock)
+def test_task_execute_success(mock_spawn, task_with_command, tmp_path, monkeypatch, capsys):
     """
-    Test successful task execution using mocked subprocess.Popen.
+    Test successful task execution using a mocked child process, announcing its command once.
     """
-    mock_process = mock_popen.return_value
-    mock_process.returncode = 0
-    mock_process.communicate.return_value = (b"Output message", b"")
+    mock_spawn.return_value = fake_process(0, b"Output message", b"")
 
-    task_with_command.test_dir = os.getcwd()
+    monkeypatch.chdir(tmp_path)
+    task_with_command.test_dir = str(tmp_path)
     retcode, output, error = task_with_command.execute({})
 
     assert retcode == 0
     assert output == "Output message"
     assert error == ""
-    mock_popen.assert_called_once()
+    mock_spawn.assert_called_once()
+    assert capsys.readouterr().out.count("Task 'test_task' command: echo hello") == 1
 
 
-@patch("subprocess.Popen")
-def test_task_execute_failure(mock_popen, task_with_command):
+@patch("executor.spawn_process", new_callable=AsyncMock)
+def test_task_execute_failure(mock_spawn, task_with_command, tmp_path, monkeypatch):
     """
-    Test task execution failure using mocked subprocess.Popen.
+    Test task execution failure using a mocked child process.
     """
-    mock_process = mock_popen.return_value
-    mock_process.returncode = 1
-    mock_process.communicate.return_value = (b"Error message", b"")
+    mock_spawn.return_value = fake_process(1, b"Error message", b"")
 
-    task_with_command.test_dir = os.getcwd()
+    monkeypatch.chdir(tmp_path)
+    task_with_command.test_dir = str(tmp_path)
     retcode, output, error = task_with_command.execute({})
 
     assert retcode == 1
     assert output == "Error message"
     assert error == ""
-    mock_popen.assert_called_once()
+    mock_spawn.assert_called_once()
+
+
+def test_task_execute_async_uses_test_dir(tmp_path):
+    """
+    Test that tasks run in their test directory without changing the executor's working directory.
+    """
+    cwd = os.getcwd()
+    task = Task("pwd", "pwd", test_dir=str(tmp_path))
+    (tmp_path / "log").mkdir()
+
+    async def run_two():
+        os.chdir(tmp_path)
+        try:
+            return await asyncio.gather(task.execute_async({}), task.execute_async({}))
+        finally:
+            os.chdir(cwd)
+
+    results = asyncio.run(run_two())
+
+    assert os.getcwd() == cwd
+    assert [output for _, output, _ in results] == [f"{tmp_path}\n"] * 2
+
+
+def test_task_execute_keeps_only_output_tail(tmp_path, monkeypatch):
+    """
+    Test that large outputs are streamed to the log while only their tail is kept in memory.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "log").mkdir()
+    task = Task("loud", "seq 1 100000; echo boom >&2; exit 3", test_dir=str(tmp_path))
+
+    retcode, output, error = task.execute({"output_tail": 16})
+
+    assert retcode == 3
+    assert output == "98\n99999\n100000\n"
+    assert error == "boom\n"
+    log = read_log(tmp_path / "log")
+    assert "   [loud:stdout] 1\n" in log
+    assert "   [loud:stdout] 100000\n" in log
+    assert "   [loud:stderr] boom\n" in log
+    assert "** Task: loud finished with exit code 3 **" in log
+
+
+def test_task_execute_keeps_whole_output_shorter_than_tail(tmp_path, monkeypatch):
+    """
+    Test that outputs shorter than the tail are kept whole, however they are chunked.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "log").mkdir()
+
+    retcode, output, error = Task("short", "printf 0123456789").execute({"output_tail": 16})
+    assert (retcode, output, error) == (0, "0123456789", "")
+
+    retcode, output, error = Task("medium", "head -c 40000 /dev/zero | tr '\\0' x").execute({})
+    assert output == "x" * 40000
+
+
+@pytest.fixture
+def cached_task(tmp_path):
+    (tmp_path / "log").mkdir()
+    (tmp_path / "input.txt").write_text("hello")
+    return Task("cached", "echo ran >> runs.log; tr a-z A-Z < input.txt | tee output.txt",
+                test_dir=str(tmp_path), inputs=["*.txt"], outputs=["output.txt"], cache=True)
+
+
+def test_task_execute_replays_cached_result(tmp_path, monkeypatch, cached_task):
+    """
+    Test that an unchanged cacheable task is replayed from the cache, restoring its outputs.
+    """
+    monkeypatch.chdir(tmp_path)
+    context = {"cache": ResultCache(str(tmp_path / "cache"))}
+
+    assert cached_task.execute(context) == (0, "HELLO", "")
+    (tmp_path / "output.txt").unlink()
+    assert cached_task.execute(context) == (0, "HELLO", "")
+
+    assert (tmp_path / "runs.log").read_text() == "ran\n"
+    assert (tmp_path / "output.txt").read_text() == "HELLO"
+    assert "** Task: cached" in read_log(tmp_path / "log")
+
+
+def test_task_execute_reruns_when_input_changes(tmp_path, monkeypatch, cached_task):
+    """
+    Test that changing a declared input file invalidates the cached result.
+    """
+    monkeypatch.chdir(tmp_path)
+    context = {"cache": ResultCache(str(tmp_path / "cache"))}
+
+    cached_task.execute(context)
+    (tmp_path / "input.txt").write_text("bye")
+
+    assert cached_task.execute(context) == (0, "BYE", "")
+    assert (tmp_path / "runs.log").read_text() == "ran\nran\n"
+
+
+def test_task_is_up_to_date(tmp_path):
+    """
+    Test the make-style comparison of declared output and input modification times.
+    """
+    task = Task("build", "cp source.txt target.txt", test_dir=str(tmp_path),
+                inputs=["source.txt"], outputs=["target.txt"])
+    (tmp_path / "source.txt").write_text("source")
+    assert not task.is_up_to_date()  # Missing output
+
+    (tmp_path / "target.txt").write_text("source")
+    os.utime(tmp_path / "source.txt", (1, 1))
+    assert task.is_up_to_date()
+
+    os.utime(tmp_path / "source.txt", (2**32, 2**32))
+    assert not task.is_up_to_date()  # Input edited after the output was written
+
+    assert not Task("no_outputs", "true", test_dir=str(tmp_path), inputs=["source.txt"]).is_up_to_date()
@@ -1,159 +1,237 @@
 """
-# My first app
-Here's our first attempt at using data to create a table:
-"""
+Streamlit UI of the executor.
 
-import streamlit as st
-import numpy as np
-import pandas as pd
-import time
+Runs a script, or attaches to a run started with '--events HOST:PORT', and follows the events it
+publishes (see executor.EventBus). The output of the tasks streams in with st.write_stream while a
+DAG and a Gantt chart of the tasks are redrawn next to it.
 
-_LOREM_IPSUM = """
-The result of your code will appear here!!!
+    pip install -r ui/requirements.txt
+    streamlit run ui/app.py
 """
-def stream_data():
-    for word in _LOREM_IPSUM.split(" "):
-        yield word + " "
-        time.sleep(0.1)
-
-    yield pd.DataFrame(
-        np.random.randn(5, 10),
-        columns=["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"],
-    )
-
-    for word in _LOREM_IPSUM.split(" "):
-        yield word + " "
-        time.sleep(0.1)
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
 
-def Text_Len(input):
-    return len(input)
+import streamlit as st
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from executor import read_events  # noqa: E402
+
+OUTPUT_INTERVAL = 0.25     # seconds between two chunks of output handed to st.write_stream
+CHART_INTERVAL = 1.0       # seconds between two redraws of the DAG and the Gantt chart
+OUTPUT_LIMIT = 256 * 1024  # characters of output shown in the page, the rest is only in the log store
+DAG_LIMIT = 200            # tasks above which the DAG is not drawn
+GANTT_LIMIT = 500          # latest started tasks shown in the Gantt chart
+CONNECT_TIMEOUT = 10.0     # seconds to wait for the event bus of a run
+STATUS_COLORS = {"pending": "#d9d9d9", "queued": "#9ecae1", "running": "#fdae6b", "succeeded": "#74c476",
+                 "skipped": "#c7e9c0", "failed": "#fb6a4a", "not run": "#969696"}
+
+
+def dot_id(name):
+    """
+    Quotes a task name as an ID of the DOT language.
+    """
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class RunState:
+    def __init__(self):
+        """
+        Initializes a RunState object, the state of a run rebuilt from its events.
+        """
+        self.script = ""
+        self.names = []
+        self.dependencies = []
+        self.status = {}
+        self.started = {}
+        self.durations = {}
+        self.start = time.time()
+        self.succeeded = None
+
+    def apply(self, event):
+        """
+        Updates the state with an event of the run.
+        """
+        kind = event["type"]
+        if kind == "run":
+            self.script = event["script"]
+            self.names = [task["name"] for task in event["tasks"]]
+            self.dependencies = [task["dependencies"] for task in event["tasks"]]
+            self.status = dict.fromkeys(self.names, "pending")
+            self.start = event["time"]
+        elif kind == "queued":
+            self.status[event["task"]] = "queued"
+        elif kind == "started":
+            self.status[event["task"]] = "running"
+            self.started[event["task"]] = event["time"]
+        elif kind == "finished":
+            if event["retcode"] == 0:
+                self.status[event["task"]] = "succeeded" if event["ran"] else "skipped"
+            else:
+                self.status[event["task"]] = "skipped" if event["retcode"] == -1 else "failed"
+            self.started[event["task"]] = event["started"]
+            self.durations[event["task"]] = event["duration"]
+        elif kind == "done":
+            self.succeeded = event["succeeded"]
+            for name, status in self.status.items():
+                if status in ("pending", "queued"):
+                    self.status[name] = "not run"  # Dropped after a failure, or the run was stopped
+
+    def summary(self):
+        """
+        Returns a line counting the tasks of every status.
+        """
+        counts = {}
+        for status in self.status.values():
+            counts[status] = counts.get(status, 0) + 1
+        return ", ".join(f"{count} {status}" for status, count in counts.items())
+
+    def dag(self):
+        """
+        Returns the graph of the tasks in the DOT language, colored by status.
+        """
+        lines = ["digraph {", "rankdir=LR;", 'node [shape=box, style="rounded,filled", fontname="sans-serif"];']
+        for name in self.names:
+            lines.append(f'{dot_id(name)} [fillcolor="{STATUS_COLORS[self.status[name]]}"];')
+        for name, dependencies in zip(self.names, self.dependencies):
+            lines.extend(f'{dot_id(self.names[dependency])} -> {dot_id(name)};' for dependency in dependencies)
+        lines.append("}")
+        return "\n".join(lines)
+
+    def gantt(self):
+        """
+        Returns the bars of the latest started tasks, in seconds since the start of the run.
+        """
+        now = time.time()
+        latest = sorted(self.started, key=self.started.get)[-GANTT_LIMIT:]
+        return [{"task": name, "status": self.status[name], "start": self.started[name] - self.start,
+                 "end": self.started[name] - self.start + self.durations.get(name, now - self.started[name])}
+                for name in latest]
+
+
+def draw(state, status, dag, gantt):
+    """
+    Redraws the progress of a run into its placeholders.
+    """
+    if state.succeeded is None:
+        status.info(f"Running '{state.script}': {state.summary()}")
+    elif state.succeeded:
+        status.success(f"'{state.script}' succeeded: {state.summary()}")
+    else:
+        status.error(f"'{state.script}' failed: {state.summary()}")
+    if len(state.names) <= DAG_LIMIT:
+        dag.graphviz_chart(state.dag(), use_container_width=True)
+    else:
+        dag.caption(f"The DAG of {len(state.names)} tasks is too large to draw.")
+    gantt.vega_lite_chart(state.gantt(), {
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "y": {"field": "task", "type": "nominal", "sort": None, "title": None},
+            "x": {"field": "start", "type": "quantitative", "title": "seconds"},
+            "x2": {"field": "end"},
+            "color": {"field": "status", "type": "nominal", "legend": {"orient": "bottom"},
+                      "scale": {"domain": list(STATUS_COLORS), "range": list(STATUS_COLORS.values())}},
+        },
+    }, use_container_width=True)
+
+
+def stream_output(events, state, status, dag, gantt):
+    """
+    Follows the events of a run, yielding the output of its tasks to st.write_stream.
+
+    Output is handed over in chunks every OUTPUT_INTERVAL seconds and the charts redrawn every
+    CHART_INTERVAL seconds, whatever the rate of the events, so the browser never falls behind.
+    Once OUTPUT_LIMIT characters were shown, the rest of the output is left to the log store.
+    """
+    shown = 0
+    pending = []
+    last_output = last_chart = 0.0
+    yield "```\n"
+    for event in events:
+        state.apply(event)
+        if event["type"] == "output" and shown < OUTPUT_LIMIT:
+            if event["skipped"]:
+                pending.append(f"[{event['skipped']} bytes of output of '{event['task']}' skipped]\n")
+            pending.append(event["text"])
+        now = time.monotonic()
+        if pending and (now - last_output >= OUTPUT_INTERVAL or event["type"] == "done"):
+            chunk = "".join(pending)[:OUTPUT_LIMIT - shown]
+            pending = []
+            shown += len(chunk)
+            if shown >= OUTPUT_LIMIT:
+                chunk += "\n[Further output is only in the log store: python executor.py logs TASK]\n"
+            last_output = now
+            yield chunk
+        if now - last_chart >= CHART_INTERVAL or event["type"] == "done":
+            draw(state, status, dag, gantt)
+            last_chart = now
+    yield "\n```"
+
+
+def start_run(script_file, targets):
+    """
+    Starts the executor on a script, publishing its events on a free local port it picks itself.
+
+    Returns:
+        tuple: The address of the event bus, or None if the executor exited or did not print it within
+            CONNECT_TIMEOUT seconds, the executor process, and the file receiving its output.
+    """
+    command = [sys.executable, os.path.join(ROOT, "executor.py"), script_file, "--events", "127.0.0.1:0",
+               "--events-wait", str(CONNECT_TIMEOUT)]
+    for target in targets:
+        command += ["--target", target]
+    output = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while time.monotonic() < deadline:
+        exited = process.poll() is not None
+        output.seek(0)
+        match = re.search(rb"^Publishing events on (\S+)\.$", output.read(), re.MULTILINE)
+        if match:
+            return match[1].decode(), process, output
+        if exited:
+            break
+        time.sleep(0.05)
+    return None, process, output
+
+
+st.set_page_config(page_title="Executor", layout="wide")
 st.title("Executor")
 
-left_column, right_column = st.columns(2)
-# You can use a column just like st.sidebar:
-text = ""
+left_column, right_column = st.columns([1, 2])
 with left_column:
-    st.write("")
-    st.write("")
-    st.write("")
-    text = st.text_area("Write your **Python :snake: Program** here :sunglasses:", height=600)
+    script_file = st.text_input("Script", os.environ.get("EXECUTOR_SCRIPT_PATH", ""),
+                                help="YAML script, relative to the directory streamlit was started in.")
+    targets = st.text_input("Targets", help="Space separated tasks to run with their dependencies, all by default.")
+    run = st.button(" :arrow_forward: Run", disabled=not script_file)
+    st.divider()
+    address = st.text_input("Event bus", help="HOST:PORT of a run started with --events.")
+    attach = st.button(" :link: Attach", disabled=not address)
 
-# Or even better, call Streamlit functions inside a "with" block:
 with right_column:
-    btn_cols = st.columns(8)
-    with btn_cols[0]:
-        st.button(" :arrow_forward: ", on_click=Text_Len(), args=(input=text))
-            #st.write_stream(stream_data)
-            #st.write(f"You wrote {len(text)} characters.")
-    with btn_cols[1]:
-        st.button(" :repeat: ")
-    text = st.text_area("", height=594)
-
-
-
-
-
-# df = pd.DataFrame({
-#   'first column': [1, 2, 3, 4],
-#   'second column': [10, 20, 30, 40]
-# })
-
-
-# st.write("Printing the table with 'magic'")
-# df
-
-
-# st.write("Printing the table with the 'table' widget")
-# st.table(df)
-
-
-# st.write("Plotting a line chart of random dataframe...")
-# chart_data = pd.DataFrame(
-#      np.random.randn(20, 3),
-#      columns=['a', 'b', 'c'])
-# st.line_chart(chart_data)
-
-
-# st.write("Now, displaying dots in a map")
-# #map_data = pd.DataFrame(
-# #    np.random.randn(1000, 2) / [50, 50] + [37.76, -122.4],
-# #    columns=['lat', 'lon'])
-# #st.map(map_data)
-# d = {"lat": [20.688640], "lon":[-103.351017]}
-# df = pd.DataFrame.from_dict(d)
-# with st.expander("map"):
-#     st.map(df, size=2, use_container_width=False, zoom=10)
-
-
-# st.write("Using widgets")
-# x = st.slider('x')  # 👈 this is a widget
-# st.write(x, 'squared is', x * x)
-
-# st.text_input("Your name", key="name")
-# # You can access the value at any point with:
-# st.session_state.name
-
-
-# st.write("Using Checkboxes")
-# if st.checkbox('Show dataframe'):
-#     chart_data = pd.DataFrame(
-#        np.random.randn(20, 3),
-#        columns=['a', 'b', 'c'])
-#     chart_data
-
-
-# st.write("Using slectbox for options")
-# df = pd.DataFrame({
-#     'first column': [1, 2, 3, 4],
-#     'second column': [10, 20, 30, 40]
-#     })
-# option = st.selectbox(
-#     'Which number do you like best?',
-#      df['first column'])
-# 'You selected: ', option
-
-
-# st.write("Control the layout of your app")
-# left_column2, right_column2 = st.columns(2)
-# # You can use a column just like st.sidebar:
-# left_column2.button('Press me!')
-
-# # Or even better, call Streamlit functions inside a "with" block:
-# with right_column2:
-#     chosen = st.radio(
-#         'Sorting hat',
-#         ("Gryffindor", "Ravenclaw", "Hufflepuff", "Slytherin"))
-#     st.write(f"You are in {chosen} house!")
-
-
-
-
-
-
-# with st.sidebar:
-#     st.write("This is my sidebar")
-
-#     add_selectbox = st.selectbox(
-#         'How would you like to be contacted?',
-#         ('Email', 'Home phone', 'Mobile phone')
-#     )
-
-
-#     add_slider = st.slider(
-#         'Select a range of values',
-#         0.0, 100.0, (25.0, 75.0)
-#     )
-
-
-#     'Starting a long computation...'
-#     # Add a placeholder
-#     latest_iteration = st.empty()
-#     bar = st.progress(0)
-
-#     for i in range(100):
-#       # Update the progress bar with each iteration.
-#       latest_iteration.text(f'Iteration {i+1}')
-#       bar.progress(i + 1)
-#       time.sleep(0.1)
-#     '...and now we\'re done!'
+    status = st.empty()
+    dag = st.empty()
+    gantt = st.empty()
+
+if run or attach:
+    process = output = None
+    if run:
+        address, process, output = start_run(script_file, targets.split())
+    if address:
+        try:
+            st.write_stream(stream_output(read_events(address, CONNECT_TIMEOUT), RunState(), status, dag, gantt))
+        except ConnectionError as error:
+            status.error(str(error))
+    else:
+        status.error("The executor did not start publishing the events of the run.")
+    if process:
+        process.wait()
+        output.seek(0)
+        with st.expander(f"Executor output (exit code {process.returncode})", expanded=process.returncode != 0):
+            st.code(output.read().decode(errors="replace"))
+        output.close()